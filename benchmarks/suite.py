@@ -0,0 +1,329 @@
+"""
+Benchmark suite: times each formatting stage, format_mscx / format_mscz end to end, and inspection,
+on synthetic scores (see synthetic.py). Results are written as JSON so runs can be compared.
+
+Run from the repo root:
+    python -m benchmarks.suite run [--preset small medium] [--repeat 5] [--output results.json]
+    python -m benchmarks.suite run --measures 800 --parts 40      (a custom score instead of the presets, see synthetic.py)
+    python -m benchmarks.suite compare old.json new.json [--threshold 1.15]
+
+`compare` exits with 1 if anything got slower than the threshold, so it can be used to catch slowdowns in CI.
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from importlib.metadata import version, PackageNotFoundError
+from typing import Callable
+
+from musescore_part_formatter.main import (
+    format_mscx,
+    format_mscx_bytes,
+    format_mscz,
+    get_score_attributes,
+    prep_formatting_params,
+    _find_main_score,
+    _format_score_tree,
+    _get_score_info,
+    _serialize_tree,
+)
+from musescore_part_formatter.formatting import (
+    add_rehearsal_mark_line_breaks,
+    add_double_bar_line_breaks,
+    add_regular_line_breaks,
+    final_pass_through,
+    new_add_page_breaks,
+    add_broadway_header,
+    add_part_name,
+    clear_style_cache,
+    render_style_bytes,
+)
+from musescore_part_formatter.layout import plan_layout_breaks, apply_layout_plan
+from musescore_part_formatter.measure_index import MeasureIndex
+from musescore_part_formatter.param_sweep import sweep_index, candidates as sweep_candidates
+from musescore_part_formatter.utils import Style
+from musescore_part_formatter.minimal_diff import SourceTracker
+from musescore_part_formatter.xml_backend import get_xml_backend
+
+from .synthetic import SyntheticScoreSpec, write_synthetic_mscz, add_spec_arguments, spec_from_args
+
+PRESETS = {
+    "small": SyntheticScoreSpec(num_measures=64, num_parts=4),
+    "medium": SyntheticScoreSpec(num_measures=200, num_parts=12, time_sig_change_every=48),
+    "large": SyntheticScoreSpec(num_measures=400, num_parts=24, time_sig_change_every=64),
+    "symphonic": SyntheticScoreSpec(num_measures=600, num_parts=40, staves_per_part=2, rehearsal_every=24),
+}
+
+# the order the reference layout passes run in, see formatting.add_layout_breaks_multipass()
+LAYOUT_PASSES = [
+    ("rehearsal_marks", lambda index, nmpl, nlpp: add_rehearsal_mark_line_breaks(index)),
+    ("double_bars", lambda index, nmpl, nlpp: add_double_bar_line_breaks(index)),
+    ("regular_line_breaks", lambda index, nmpl, nlpp: add_regular_line_breaks(index, nmpl)),
+    ("final_pass_through", lambda index, nmpl, nlpp: final_pass_through(index)),
+    ("page_breaks", lambda index, nmpl, nlpp: new_add_page_breaks(index, nlpp)),
+]
+
+FORMATTING_PARAMS = {
+    "selected_style": "broadway",
+    "show_title": "Benchmark Show",
+    "show_number": "1",
+    "version_num": "1.0.0",
+}
+
+
+def time_it(fn: Callable, setup: Callable | None = None, repeat: int = 5) -> list[float]:
+    """Wall time of `fn(setup())` for each repeat, setup isn't timed"""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _first_staff(tree):
+    return tree.getroot().find("Score").find("Staff")
+
+
+def stage_benchmarks(name: str, data: bytes, is_part: bool) -> dict[str, tuple[Callable, Callable | None]]:
+    """Benchmarks for each stage of formatting one mscx: {benchmark name: (fn, setup)}"""
+    backend = get_xml_backend()
+    params = prep_formatting_params(FORMATTING_PARAMS)
+    nmpl = params["num_measures_per_line_part" if is_part else "num_measures_per_line_score"]
+    nlpp = params["num_lines_per_page"]
+    parsed = backend.fromstring(data)
+
+    def fresh_tree():
+        return backend.fromstring(data)
+
+    def fresh_staff():
+        return copy.deepcopy(_first_staff(parsed))
+
+    def index_after(n_passes: int):
+        def setup():
+            index = MeasureIndex(fresh_staff())
+            for _, layout_pass in LAYOUT_PASSES[:n_passes]:
+                layout_pass(index, nmpl, nlpp)
+            return index
+        return setup
+
+    def formatted_tracked():
+        tree = fresh_tree()
+        tracker = SourceTracker(tree.getroot(), data)
+        _format_score_tree(tree, params, is_part)
+        return tracker
+
+    def formatted_tree():
+        tree = fresh_tree()
+        _format_score_tree(tree, params, is_part)
+        return tree
+
+    res = {
+        f"{name}/parse": (lambda _: backend.fromstring(data), None),
+        f"{name}/score_info": (lambda _: _get_score_info(parsed), None),
+        f"{name}/measure_index": (MeasureIndex, fresh_staff),
+    }
+    for i, (pass_name, layout_pass) in enumerate(LAYOUT_PASSES):
+        res[f"{name}/layout/{pass_name}"] = (
+            lambda index, layout_pass=layout_pass: layout_pass(index, nmpl, nlpp),
+            index_after(i),
+        )
+    res[f"{name}/layout/fused_plan"] = (
+        lambda index: plan_layout_breaks(index, nmpl, nlpp),
+        lambda: MeasureIndex(fresh_staff()),
+    )
+    res[f"{name}/layout/fused_apply"] = (
+        lambda state: apply_layout_plan(*state),
+        lambda: (lambda index: (index, plan_layout_breaks(index, nmpl, nlpp)))(MeasureIndex(fresh_staff())),
+    )
+    res[f"{name}/layout/sweep"] = (
+        lambda index: sweep_index(index, sweep_candidates()),
+        lambda: MeasureIndex(fresh_staff()),
+    )
+    res[f"{name}/header"] = (
+        lambda staff: (add_broadway_header(staff, "1", "Benchmark Show"), add_part_name(staff)),
+        fresh_staff,
+    )
+    res[f"{name}/serialize"] = (_serialize_tree, formatted_tree)
+    res[f"{name}/serialize_minimal_diff"] = (lambda tracker: tracker.tostring(), formatted_tracked)
+    res[f"{name}/format_mscx_bytes"] = (lambda _: format_mscx_bytes(data, params, is_part), None)
+    res[f"{name}/format_mscx_bytes_streaming"] = (
+        lambda _: format_mscx_bytes(data, params, is_part, streaming=True),
+        None,
+    )
+    return res
+
+
+def run_scenario(scenario: str, spec: SyntheticScoreSpec, repeat: int, max_workers: int | None) -> list[dict]:
+    results = []
+
+    def record(benchmark: str, times: list[float]) -> None:
+        results.append({
+            "scenario": scenario,
+            "benchmark": benchmark,
+            "repeat": len(times),
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.fmean(times),
+            "times": times,
+        })
+        print(f"  {benchmark:<45}{statistics.median(times) * 1000:>10.2f} ms")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        mscz_path = os.path.join(work_dir, "synthetic.mscz")
+        write_synthetic_mscz(mscz_path, spec)
+        with zipfile.ZipFile(mscz_path) as z:
+            members = {name: z.read(name) for name in z.namelist() if name.endswith(".mscx")}
+        main_name = _find_main_score(list(members))
+        part_name = next(name for name in members if name != main_name)
+        mb = sum(len(data) for data in members.values()) / 1e6
+        print(f"{scenario}: {spec.num_measures} measures, {spec.num_parts} parts, {mb:.1f} MB of mscx")
+
+        # -- Stages --
+        for label, name, is_part in (("score", main_name, False), ("part", part_name, True)):
+            for benchmark, (fn, setup) in stage_benchmarks(label, members[name], is_part).items():
+                record(benchmark, time_it(fn, setup, repeat))
+
+        score_info = _get_score_info(get_xml_backend().fromstring(members[main_name]))
+        record(
+            "style/render_cold",
+            time_it(lambda _: render_style_bytes(Style.BROADWAY, False, score_info), clear_style_cache, repeat),
+        )
+        record(
+            "style/render_warm",
+            time_it(lambda _: render_style_bytes(Style.BROADWAY, False, score_info), None, repeat),
+        )
+
+        # -- End to end --
+        mscx_path = os.path.join(work_dir, "score.mscx")
+        params = prep_formatting_params(FORMATTING_PARAMS)
+
+        def copy_main_score():
+            with open(mscx_path, "wb") as f:
+                f.write(members[main_name])
+
+        record("format_mscx", time_it(lambda _: format_mscx(mscx_path, params), copy_main_score, repeat))
+
+        output_path = os.path.join(work_dir, "out.mscz")
+        record("format_mscz", time_it(lambda _: format_mscz(mscz_path, output_path, FORMATTING_PARAMS), None, repeat))
+        record(
+            "format_mscz_streaming",
+            time_it(lambda _: format_mscz(mscz_path, output_path, FORMATTING_PARAMS, streaming=True), None, repeat),
+        )
+        if max_workers is not None and max_workers > 1:
+            record(
+                f"format_mscz_parallel_{max_workers}",
+                time_it(
+                    lambda _: format_mscz(mscz_path, output_path, FORMATTING_PARAMS, max_workers=max_workers),
+                    None,
+                    repeat,
+                ),
+            )
+        record("inspect/get_score_attributes", time_it(lambda _: get_score_attributes(mscz_path), None, repeat))
+        record(
+            "inspect/get_score_attributes_full",
+            time_it(lambda _: get_score_attributes(mscz_path, metadata_only=False), None, repeat),
+        )
+
+    for res in results:
+        res["spec"] = spec.to_dict()
+    return results
+
+
+def _metadata() -> dict:
+    try:
+        package_version = version("musescore-part-formatter")
+    except PackageNotFoundError:
+        package_version = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "package_version": package_version,
+        "python": sys.version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "xml_backend": get_xml_backend().name,
+    }
+
+
+def run(args: argparse.Namespace) -> None:
+    custom = args.num_measures is not None
+    if args.num_measures is None:
+        args.num_measures = SyntheticScoreSpec.num_measures
+    custom = custom or spec_from_args(args) != SyntheticScoreSpec()
+    if custom:
+        scenarios = {"custom": spec_from_args(args)}
+    else:
+        scenarios = {name: PRESETS[name] for name in args.preset}
+
+    results = []
+    for scenario, spec in scenarios.items():
+        results.extend(run_scenario(scenario, spec, args.repeat, args.max_workers))
+        print()
+
+    report = {"metadata": _metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> bool:
+    """Print the median time ratio (new / old) of every benchmark both runs have. False if anything got slower"""
+    with open(old_path) as f:
+        old = {(r["scenario"], r["benchmark"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {(r["scenario"], r["benchmark"]): r for r in json.load(f)["results"]}
+
+    ok = True
+    print(f"{'benchmark':<60}{'old (ms)':>10}{'new (ms)':>10}{'ratio':>8}")
+    for key in [k for k in new if k in old]:
+        ratio = new[key]["median"] / old[key]["median"] if old[key]["median"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            ok = False
+            flag = "  SLOWER"
+        print(
+            f"{'/'.join(key):<60}{old[key]['median'] * 1000:>10.2f}{new[key]['median'] * 1000:>10.2f}{ratio:>8.2f}{flag}"
+        )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the formatter on synthetic scores")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--preset", nargs="+", choices=list(PRESETS), default=["small", "medium"])
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", help="Write the results to this JSON file")
+    run_parser.add_argument(
+        "--max-workers", type=int, default=None, help="Also time format_mscz with the parts formatted in parallel"
+    )
+    add_spec_arguments(run_parser)
+    run_parser.set_defaults(num_measures=None)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=1.15, help="Ratio (new / old) that counts as a slowdown (default: 1.15)"
+    )
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif not compare(args.old, args.new, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
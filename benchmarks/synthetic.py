@@ -0,0 +1,316 @@
+"""
+Synthetic .mscz generator, for benchmarking on scores of any size.
+
+The files are laid out like MuseScore 4 writes them (main score + one excerpt per part, each with a .mss style),
+but only contain what the formatter looks at: title frame, metaTags, parts/staves, and measures with notes, rests,
+rehearsal marks, double bar lines, time signature changes and (in the parts) multimeasure rests.
+
+    python -m benchmarks.synthetic out.mscz --measures 400 --parts 20
+"""
+
+import argparse
+import random
+import string
+import zipfile
+from dataclasses import dataclass, asdict
+
+# (sigN, sigD, beats per measure in quarters) cycled through at each time signature change
+TIME_SIGNATURES = [(4, 4, 4), (3, 4, 3), (6, 8, 3), (2, 2, 4)]
+
+
+@dataclass
+class SyntheticScoreSpec:
+    num_measures: int = 200
+    num_parts: int = 8
+    staves_per_part: int = 1  # eg. 2 for piano
+    mm_rest_density: float = 0.2  # roughly how much of each part is resting (becomes mm rests in the parts)
+    rehearsal_every: int = 16  # measures between rehearsal marks (with a double bar before each one), 0 for none
+    time_sig_change_every: int = 0  # measures between time signature changes, 0 for none
+    seed: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class _Writer:
+    """Tiny indenting XML writer, much faster than building a tree for big scores"""
+
+    def __init__(self):
+        self.lines = ['<?xml version="1.0" encoding="UTF-8"?>']
+        self.depth = 0
+
+    def open(self, tag: str, attrs: str = "") -> None:
+        self.lines.append(f"{'  ' * self.depth}<{tag}{attrs}>")
+        self.depth += 1
+
+    def close(self, tag: str) -> None:
+        self.depth -= 1
+        self.lines.append(f"{'  ' * self.depth}</{tag}>")
+
+    def leaf(self, tag: str, text: str = "", attrs: str = "") -> None:
+        if text:
+            self.lines.append(f"{'  ' * self.depth}<{tag}{attrs}>{text}</{tag}>")
+        else:
+            self.lines.append(f"{'  ' * self.depth}<{tag}{attrs}/>")
+
+    def tobytes(self) -> bytes:
+        return ("\n".join(self.lines) + "\n").encode("utf-8")
+
+
+class _Plan:
+    """What happens in each measure, shared by the score and the parts so they line up"""
+
+    def __init__(self, spec: SyntheticScoreSpec):
+        rng = random.Random(spec.seed)
+        n = spec.num_measures
+        self.time_sigs = {0: TIME_SIGNATURES[0]}
+        if spec.time_sig_change_every:
+            for i, m in enumerate(range(spec.time_sig_change_every, n, spec.time_sig_change_every)):
+                self.time_sigs[m] = TIME_SIGNATURES[(i + 1) % len(TIME_SIGNATURES)]
+
+        self.rehearsal_marks = {}
+        if spec.rehearsal_every:
+            for i, m in enumerate(range(spec.rehearsal_every, n, spec.rehearsal_every)):
+                self.rehearsal_marks[m] = _rehearsal_letter(i)
+
+        # per part: which measures are rests, in runs so they make mm rests
+        self.resting: list[list[bool]] = []
+        for _ in range(spec.num_parts):
+            rests = [False] * n
+            m = 0
+            while m < n:
+                if rng.random() < spec.mm_rest_density / 4:
+                    length = rng.randint(2, 12)
+                    for j in range(m, min(m + length, n)):
+                        rests[j] = True
+                    m += length
+                m += 1
+            self.resting.append(rests)
+
+        self.pitches = [rng.randint(55, 80) for _ in range(97)]
+
+    def time_sig_at(self, m: int) -> tuple[int, int, int]:
+        return self.time_sigs[max(k for k in self.time_sigs if k <= m)]
+
+    def breaks_mm_rest(self, m: int) -> bool:
+        """MuseScore ends multimeasure rests at rehearsal marks and time signature changes"""
+        return m in self.rehearsal_marks or m in self.time_sigs
+
+
+def _rehearsal_letter(i: int) -> str:
+    letters = string.ascii_uppercase
+    return letters[i % 26] * (i // 26 + 1)
+
+
+def _write_title_frame(w: _Writer, spec: SyntheticScoreSpec, part_name: str | None) -> None:
+    w.open("VBox")
+    w.leaf("height", "10")
+    for style, text in (
+        ("title", "Synthetic Score"),
+        ("subtitle", f"{spec.num_measures} measures, {spec.num_parts} parts"),
+        ("composer", "benchmarks.synthetic"),
+    ) + ((("instrument_excerpt", part_name),) if part_name else ()):
+        w.open("Text")
+        w.leaf("style", style)
+        w.leaf("text", text)
+        w.close("Text")
+    w.close("VBox")
+
+
+def _write_measure(
+    w: _Writer, plan: _Plan, m: int, part: int, staff: int, mm_length: int = 0
+) -> None:
+    sig_n, sig_d, quarters = plan.time_sig_at(m)
+    if mm_length:
+        w.open("Measure", f' len="{sig_n * mm_length}/{sig_d}"')
+        w.leaf("multiMeasureRest", str(mm_length))
+    else:
+        w.open("Measure")
+    w.open("voice")
+    if m in plan.time_sigs:
+        w.open("TimeSig")
+        w.leaf("sigN", str(sig_n))
+        w.leaf("sigD", str(sig_d))
+        w.close("TimeSig")
+    if m in plan.rehearsal_marks and staff == 0:
+        w.open("RehearsalMark")
+        w.leaf("text", plan.rehearsal_marks[m])
+        w.close("RehearsalMark")
+
+    if mm_length or plan.resting[part][m]:
+        w.open("Rest")
+        w.leaf("durationType", "measure")
+        w.leaf("duration", f"{sig_n * max(mm_length, 1)}/{sig_d}")
+        w.close("Rest")
+    else:
+        for beat in range(quarters):
+            w.open("Chord")
+            w.leaf("durationType", "quarter")
+            w.open("Note")
+            w.leaf("pitch", str(plan.pitches[(m * 7 + beat + part) % len(plan.pitches)] - 12 * staff))
+            w.close("Note")
+            w.close("Chord")
+
+    if m + 1 in plan.rehearsal_marks:
+        w.open("BarLine")
+        w.leaf("subtype", "double")
+        w.close("BarLine")
+    w.close("voice")
+    w.close("Measure")
+
+
+def _mm_rest_lengths(plan: _Plan, part: int, num_measures: int) -> dict[int, int]:
+    """Start measure -> length of each multimeasure rest in a part"""
+    res = {}
+    rests = plan.resting[part]
+    m = 0
+    while m < num_measures:
+        if not rests[m]:
+            m += 1
+            continue
+        end = m + 1
+        while end < num_measures and rests[end] and not plan.breaks_mm_rest(end):
+            end += 1
+        if end - m >= 2:
+            res[m] = end - m
+        m = end
+    return res
+
+
+def generate_mscx(spec: SyntheticScoreSpec, part: int | None = None, plan: _Plan | None = None) -> bytes:
+    """The main score, or the excerpt for one part (which gets multimeasure rests)"""
+    plan = plan or _Plan(spec)
+    parts = range(spec.num_parts) if part is None else [part]
+    part_name = None if part is None else _part_name(part)
+
+    w = _Writer()
+    w.open("museScore", ' version="4.50"')
+    w.leaf("programVersion", "4.5.2")
+    w.open("Score")
+    if part_name:
+        w.leaf("name", part_name)
+    w.leaf("Division", "480")
+    for name, value in (
+        ("arranger", ""),
+        ("composer", "benchmarks.synthetic"),
+        ("subtitle", ""),
+        ("workTitle", "Synthetic Score"),
+    ):
+        w.leaf("metaTag", value, f' name="{name}"')
+
+    staff_id = 1
+    staff_ids = []
+    for p in parts:
+        w.open("Part", f' id="{p + 1}"')
+        ids = []
+        for _ in range(spec.staves_per_part):
+            w.open("Staff", f' id="{staff_id}"')
+            w.open("StaffType", ' group="pitched"')
+            w.leaf("name", "stdNormal")
+            w.close("StaffType")
+            w.close("Staff")
+            ids.append(staff_id)
+            staff_id += 1
+        w.leaf("trackName", _part_name(p))
+        w.open("Instrument", f' id="instrument-{p + 1}"')
+        w.leaf("longName", _part_name(p))
+        w.close("Instrument")
+        w.close("Part")
+        staff_ids.append((p, ids))
+
+    first = True
+    for p, ids in staff_ids:
+        mm_rests = _mm_rest_lengths(plan, p, spec.num_measures) if part is not None else {}
+        for s, sid in enumerate(ids):
+            w.open("Staff", f' id="{sid}"')
+            if first:
+                _write_title_frame(w, spec, part_name)
+                first = False
+            mm_left = 0
+            for m in range(spec.num_measures):
+                # like MuseScore, the mm rest measure comes first and the measures it covers follow it
+                length = mm_rests.get(m, 0) if mm_left == 0 else 0
+                _write_measure(w, plan, m, p, s, length)
+                mm_left = length - 1 if length else max(mm_left - 1, 0)
+            w.close("Staff")
+
+    w.close("Score")
+    w.close("museScore")
+    return w.tobytes()
+
+
+def _part_name(part: int) -> str:
+    return f"Instrument {part + 1}"
+
+
+def _part_dir(part: int) -> str:
+    return f"Excerpts/{part}_Instrument_{part + 1}"
+
+
+def _style(page_width: str = "8.5") -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<museScore version="4.50">\n  <Style>\n    <pageWidth>{page_width}</pageWidth>\n  </Style>\n</museScore>\n'
+    ).encode("utf-8")
+
+
+def write_synthetic_mscz(path: str, spec: SyntheticScoreSpec) -> None:
+    plan = _Plan(spec)
+    members = {
+        "score_style.mss": _style(),
+        "Synthetic.mscx": generate_mscx(spec, plan=plan),
+    }
+    for p in range(spec.num_parts):
+        name = f"{p}_Instrument_{p + 1}"
+        members[f"{_part_dir(p)}/{name}.mss"] = _style()
+        members[f"{_part_dir(p)}/{name}.mscx"] = generate_mscx(spec, part=p, plan=plan)
+
+    rootfiles = "\n".join(f'    <rootfile full-path="{name}"/>' for name in members)
+    members["META-INF/container.xml"] = (
+        f'<?xml version="1.0" encoding="UTF-8"?>\n<container>\n  <rootfiles>\n{rootfiles}\n  </rootfiles>\n</container>\n'
+    ).encode("utf-8")
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = SyntheticScoreSpec()
+    parser.add_argument("--measures", dest="num_measures", type=int, default=defaults.num_measures)
+    parser.add_argument("--parts", dest="num_parts", type=int, default=defaults.num_parts)
+    parser.add_argument("--staves-per-part", type=int, default=defaults.staves_per_part)
+    parser.add_argument("--mm-rest-density", type=float, default=defaults.mm_rest_density)
+    parser.add_argument(
+        "--rehearsal-every", type=int, default=defaults.rehearsal_every,
+        help="Measures between rehearsal marks, 0 for none",
+    )
+    parser.add_argument(
+        "--time-sig-change-every", type=int, default=defaults.time_sig_change_every,
+        help="Measures between time signature changes, 0 for none",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def spec_from_args(args: argparse.Namespace) -> SyntheticScoreSpec:
+    return SyntheticScoreSpec(
+        num_measures=args.num_measures,
+        num_parts=args.num_parts,
+        staves_per_part=args.staves_per_part,
+        mm_rest_density=args.mm_rest_density,
+        rehearsal_every=args.rehearsal_every,
+        time_sig_change_every=args.time_sig_change_every,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic .mscz")
+    parser.add_argument("output", help="Path to write the .mscz to")
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    write_synthetic_mscz(args.output, spec_from_args(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Parse + serialize speed of each XML backend on the test scores
+
+Run from the repo root:
+    python -m benchmarks.xml_backend [--repeat 20]
+"""
+
+import argparse
+import glob
+import time
+import zipfile
+
+from musescore_part_formatter.xml_backend import available_xml_backends, get_xml_backend
+
+TEST_DATA = "tests/test-data"
+
+
+def load_test_scores() -> dict[str, bytes]:
+    """Every mscx in the test data (including the ones inside the mscz files)"""
+    res = {}
+    for path in sorted(glob.glob(f"{TEST_DATA}/sample-mscx/*.mscx")):
+        with open(path, "rb") as f:
+            res[path] = f.read()
+    for path in sorted(glob.glob(f"{TEST_DATA}/*.mscz")):
+        with zipfile.ZipFile(path) as z:
+            for name in z.namelist():
+                if name.endswith(".mscx"):
+                    res[f"{path}:{name}"] = z.read(name)
+    return res
+
+
+def bench_backend(name: str, scores: dict[str, bytes], repeat: int) -> dict[str, float]:
+    backend = get_xml_backend(name)
+    parse_time = 0.0
+    serialize_time = 0.0
+    for _ in range(repeat):
+        for data in scores.values():
+            start = time.perf_counter()
+            tree = backend.fromstring(data)
+            parse_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            backend.tostring(tree)
+            serialize_time += time.perf_counter() - start
+
+    return {"parse": parse_time, "serialize": serialize_time}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the XML backends")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    scores = load_test_scores()
+    total_mb = sum(len(data) for data in scores.values()) * args.repeat / 1e6
+    print(f"{len(scores)} scores x {args.repeat} repeats ({total_mb:.1f} MB of XML)\n")
+
+    results = {name: bench_backend(name, scores, args.repeat) for name in available_xml_backends()}
+
+    print(f"{'backend':<10}{'parse (s)':>12}{'serialize (s)':>16}{'total (s)':>12}")
+    for name, res in results.items():
+        total = res["parse"] + res["serialize"]
+        print(f"{name:<10}{res['parse']:>12.3f}{res['serialize']:>16.3f}{total:>12.3f}")
+
+    if "lxml" in results:
+        stdlib, lxml = results["stdlib"], results["lxml"]
+        print(
+            f"\nlxml speedup: parse {stdlib['parse'] / lxml['parse']:.1f}x, "
+            f"serialize {stdlib['serialize'] / lxml['serialize']:.1f}x"
+        )
+    else:
+        print("\nlxml is not installed, pip install lxml to compare")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,20 @@
-from .main import format_mscz, format_mscx
-from .main import FormattingParams
\ No newline at end of file
+# The public API is loaded on first use, so `import musescore_part_formatter` (and the CLIs) start up quickly
+_LAZY_ATTRIBUTES = {
+    "format_mscz": "main",
+    "format_mscx": "main",
+    "FormattingParams": "main",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+        value = globals()[name] = getattr(module, name)
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_ATTRIBUTES])
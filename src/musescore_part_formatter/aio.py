@@ -0,0 +1,164 @@
+"""
+asyncio API, for calling the formatter from async code (eg. a web backend) without blocking the event loop.
+
+    async with AsyncFormatter(max_concurrency=4) as formatter:
+        ok = await formatter.format_mscz("in.mscz", "out.mscz", params)
+        info = await formatter.get_score_attributes("out.mscz")
+
+All of the work (including reading and writing archives) runs on an executor: a `parallel.make_executor()` pool by
+default, or pass in your own. At most `max_concurrency` jobs are on the executor at once, other callers wait their turn
+(so a burst of requests queues up here instead of piling into the executor).
+
+Cancelling a call that hasn't started yet takes it off the executor. One that's already running can't be stopped: it
+finishes in the background, but `format_mscz()` output is written to a temp file first and only moved into place if the
+call wasn't cancelled (a call cancelled while the move is already under way still finishes it).
+`set_score_attributes()` edits in place, so a cancelled call may still have made its changes.
+"""
+
+from concurrent.futures import Executor, Future
+from typing import Any, Callable
+import asyncio
+import os
+
+from .main import format_mscz, get_score_attributes, set_score_attributes
+from .utils import mkstemp_for_output
+from .file_inspect import ScoreInfo
+from .parallel import make_executor
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _format_mscz_to_temp(input_path: str, output_path: str, params: dict[str, str], kwargs: dict) -> str | None:
+    """
+    The executor side of `AsyncFormatter.format_mscz()`: format into a temp file next to `output_path`.
+    Returns the temp file's path, or None if formatting failed (the temp file is removed then)
+    """
+    fd, tmp_path = mkstemp_for_output(os.path.dirname(os.path.abspath(output_path)), suffix=".mscz.tmp")
+    os.close(fd)
+    try:
+        ok = format_mscz(input_path, tmp_path, params, **kwargs)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    if not ok:
+        _remove(tmp_path)
+        return None
+    return tmp_path
+
+
+def _remove_abandoned_output(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        _remove(future.result())
+
+
+class AsyncFormatter:
+    def __init__(
+        self,
+        executor: Executor | None = None,
+        max_workers: int | None = None,
+        max_concurrency: int | None = None,
+    ):
+        """
+        executor: where the work runs. If not given, a `make_executor(max_workers)` pool is made on first use
+        (and shut down by `aclose()`)
+        max_concurrency: most jobs on the executor at once (default: max_workers, or the number of CPUs)
+        """
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._max_workers = max_workers
+        self.max_concurrency = max_concurrency or max_workers or os.cpu_count() or 1
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = make_executor(self._max_workers)
+        return self._executor
+
+    async def _run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        on_abandoned: Callable[[Future], None] | None = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Run `fn(*args, **kwargs)` on the executor once there's a free slot.
+        If the caller is cancelled while `fn` is already running, `on_abandoned` gets its future once it's done
+        (called from another thread), eg. to clean up what it made
+        """
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        try:
+            res = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                self._slots.release()
+            else:
+                # still running, keep its slot until it's actually done
+                def abandoned(future: Future) -> None:
+                    if on_abandoned is not None:
+                        on_abandoned(future)
+                    try:
+                        loop.call_soon_threadsafe(self._slots.release)
+                    except RuntimeError:  # loop is already closed
+                        pass
+
+                future.add_done_callback(abandoned)
+            raise
+        except BaseException:
+            self._slots.release()
+            raise
+        self._slots.release()
+        return res
+
+    async def format_mscz(
+        self, input_path: str, output_path: str, params: dict[str, str], **kwargs
+    ) -> bool:
+        """Same as `main.format_mscz()` (takes the same keyword arguments)"""
+        # making the temp file and moving it into place are file system calls too, so they're kept off the event loop
+        tmp_path = await self._run(
+            _format_mscz_to_temp,
+            input_path,
+            output_path,
+            params,
+            kwargs,
+            on_abandoned=_remove_abandoned_output,
+        )
+        if tmp_path is None:
+            return False
+        # shielded: once it's formatted, a cancel shouldn't leave the temp file behind halfway through the move
+        await asyncio.shield(asyncio.to_thread(os.replace, tmp_path, output_path))
+        return True
+
+    async def get_score_attributes(self, input_path: str) -> ScoreInfo:
+        """Same as `main.get_score_attributes()`"""
+        return await self._run(get_score_attributes, input_path)
+
+    async def set_score_attributes(
+        self, input_path: str, score_properties: ScoreInfo, minimal_diff: bool = False
+    ) -> None:
+        """Same as `main.set_score_attributes()`"""
+        await self._run(set_score_attributes, input_path, score_properties, minimal_diff)
+
+    async def aclose(self) -> None:
+        """Shut down the executor (if this made it), waiting for running jobs to finish"""
+        if self._owns_executor and self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown)
+
+    async def __aenter__(self) -> "AsyncFormatter":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
@@ -0,0 +1,499 @@
+"""
+Batch mode: format (inspect, or stamp) whole directories (or globs) of scores in one process, on a pool of workers
+
+Example:
+    python -m musescore_part_formatter.batch format scores/ "other/**/*.mscz" \
+        --output-dir formatted/ \
+        --summary summary.json \
+        --style broadway \
+        --show-title "My Show"
+
+Outputs mirror the input layout under --output-dir (relative to each input directory, or to the part of each glob before
+the first wildcard). One status line per file is printed to stderr as they finish, and a JSON summary is written at the end.
+
+    python -m musescore_part_formatter.batch inspect library/ --format csv --output library.csv
+
+writes one row per file (its `ScoreInfo`, see `main.get_score_attributes()`) as JSON lines or CSV, as they finish.
+Files that can't be read get a row with the error instead.
+
+    python -m musescore_part_formatter.batch stamp library/ --set composer="Someone Else" --set meta_composer="Someone Else"
+
+sets title box / meta properties in the main score and every excerpt of each file, without formatting anything
+(see `main.stamp_mscz()`). Files are changed in place unless --output-dir is given.
+"""
+
+import argparse
+import glob
+import json
+import csv
+import os
+import sys
+import time
+from typing import IO, Iterator, TypedDict
+
+from .utils import FormattingParams
+from .file_inspect import ScoreInfo
+from .main import (
+    _format_mscz,
+    check_stamp_properties,
+    get_score_attributes,
+    stamp_mscz,
+    predict_formatting_params,
+    prep_formatting_params,
+    add_formatting_arguments,
+    formatting_params_from_args,
+)
+from .parallel import make_executor, map_unordered
+
+from logging import getLogger
+
+LOGGER = getLogger("PartFormatter")
+
+
+class BatchFileResult(TypedDict):
+    input: str
+    output: str
+    ok: bool
+    seconds: float
+    error: str | None
+
+
+def _glob_base(pattern: str) -> str:
+    """The part of a glob pattern before the first path component with a wildcard in it"""
+    parts = []
+    for part in pattern.replace(os.sep, "/").split("/"):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return "/".join(parts)
+
+
+def collect_inputs(inputs: list[str]) -> list[tuple[str, str]]:
+    """
+    Expand files, directories (searched recursively for .mscz files) and glob patterns into
+    (input path, output path relative to the output dir) pairs. Files matched more than once are only included once.
+    """
+    res = []
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            base = item
+            paths = sorted(
+                glob.glob(os.path.join(glob.escape(item), "**", "*.mscz"), recursive=True)
+            )
+        elif glob.has_magic(item):
+            base = _glob_base(item)
+            paths = sorted(p for p in glob.glob(item, recursive=True) if os.path.isfile(p))
+        else:
+            base = os.path.dirname(item)
+            paths = [item]
+
+        for path in paths:
+            key = os.path.abspath(path)
+            if key in seen:
+                continue
+            seen.add(key)
+            res.append((path, os.path.relpath(path, base or ".")))
+    return res
+
+
+def check_unique_outputs(output_paths: list[str]) -> None:
+    """
+    Raise a ValueError if two inputs would be written to the same output
+    (eg. a/x.mscz and b/x.mscz passed as files both go to x.mscz), they'd overwrite each other
+    """
+    seen = set()
+    for path in output_paths:
+        key = os.path.abspath(path)
+        if key in seen:
+            raise ValueError(f"More than one input would be written to {path}")
+        seen.add(key)
+
+
+def _format_one(
+    input_path: str, output_path: str, params: FormattingParams, predict_from: dict[str, str] | None = None
+) -> BatchFileResult:
+    """
+    With `predict_from` (the params as passed in, before `prep_formatting_params()`), whatever they don't set is
+    predicted from the score first (see `main.predict_formatting_params()`)
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if predict_from is not None:
+            params = predict_formatting_params(input_path, predict_from, params)
+        ok = _format_mscz(input_path, output_path, params)
+        if not ok:
+            error = "No .mscx files found in the provided mscz file."
+    except Exception as e:
+        LOGGER.exception("Failed to process %s", input_path)
+        ok = False
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "input": input_path,
+        "output": output_path,
+        "ok": ok,
+        "seconds": round(time.perf_counter() - start, 4),
+        "error": error,
+    }
+
+
+def format_batch(
+    inputs: list[str],
+    output_dir: str,
+    params: dict[str, str],
+    predict: bool = False,
+    max_workers: int | None = None,
+) -> Iterator[BatchFileResult]:
+    """
+    Format every score matched by `inputs` (see `collect_inputs()`) into `output_dir`.
+    Yields one result per file as they finish. A file failing doesn't stop the rest of the batch.
+    Raises a ValueError (before formatting anything) if two inputs would be written to the same output.
+
+    With `predict`, the params that aren't passed in are predicted for each score (see `main.format_mscz()`).
+
+    max_workers=1 runs everything in this process, otherwise files are spread over a pool
+    (default size: number of CPUs)
+    """
+    prepped_params = prep_formatting_params(params, predict)
+    jobs = [
+        (input_path, os.path.join(output_dir, rel_path), prepped_params, params if predict else None)
+        for input_path, rel_path in collect_inputs(inputs)
+    ]
+    check_unique_outputs([output_path for _, output_path, _, _ in jobs])
+
+    if max_workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield _format_one(*job)
+        return
+
+    with make_executor(max_workers) as executor:
+        max_pending = 2 * (max_workers or os.cpu_count() or 1)
+        yield from map_unordered(executor, _format_one, jobs, max_pending)
+
+
+class BatchInspectResult(TypedDict):
+    input: str
+    ok: bool
+    seconds: float
+    error: str | None
+    info: ScoreInfo | None
+
+
+def _inspect_one(input_path: str, metadata_only: bool) -> BatchInspectResult:
+    start = time.perf_counter()
+    info = None
+    error = None
+    try:
+        info = get_score_attributes(input_path, metadata_only=metadata_only)
+    except Exception as e:
+        LOGGER.exception("Failed to inspect %s", input_path)
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "input": input_path,
+        "ok": error is None,
+        "seconds": round(time.perf_counter() - start, 4),
+        "error": error,
+        "info": info,
+    }
+
+
+def inspect_batch(
+    inputs: list[str],
+    max_workers: int | None = None,
+    metadata_only: bool = True,
+) -> Iterator[BatchInspectResult]:
+    """
+    `get_score_attributes()` of every score matched by `inputs` (see `collect_inputs()`).
+    Yields one result per file as they finish, a file that can't be read gets a result with its error.
+
+    max_workers=1 runs everything in this process, otherwise files are spread over a pool
+    (default size: number of CPUs)
+    """
+    jobs = [(input_path, metadata_only) for input_path, _ in collect_inputs(inputs)]
+
+    if max_workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield _inspect_one(*job)
+        return
+
+    with make_executor(max_workers) as executor:
+        max_pending = 4 * (max_workers or os.cpu_count() or 1)
+        yield from map_unordered(executor, _inspect_one, jobs, max_pending)
+
+
+INSPECT_CSV_COLUMNS = ["input", "ok", "seconds", "error", *ScoreInfo.__annotations__]
+
+
+class InspectWriter:
+    """Writes `BatchInspectResult`s to `out` as they come in, as JSON lines or CSV (one column per `ScoreInfo` key)"""
+
+    def __init__(self, out: IO[str], output_format: str = "jsonl"):
+        if output_format not in ("jsonl", "csv"):
+            raise ValueError(f"Unknown format: {output_format}")
+        self.out = out
+        self.output_format = output_format
+        self._csv = None
+        if output_format == "csv":
+            self._csv = csv.DictWriter(out, INSPECT_CSV_COLUMNS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, result: BatchInspectResult) -> None:
+        if self._csv is None:
+            self.out.write(json.dumps(result) + "\n")
+        else:
+            row = {name: value for name, value in result.items() if name != "info"}
+            for name, value in (result["info"] or {}).items():
+                row[name] = " ".join(value) if name == "time_signatures" else value
+            self._csv.writerow(row)
+        self.out.flush()  # so rows show up while the batch is still running
+
+
+class BatchStampResult(BatchFileResult):
+    changed: list[str]  # members that changed
+
+
+def _stamp_one(input_path: str, output_path: str, properties: dict[str, str]) -> BatchStampResult:
+    start = time.perf_counter()
+    changed = []
+    error = None
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        changed = stamp_mscz(input_path, properties, output_path)
+    except Exception as e:
+        LOGGER.exception("Failed to stamp %s", input_path)
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "input": input_path,
+        "output": output_path,
+        "ok": error is None,
+        "seconds": round(time.perf_counter() - start, 4),
+        "error": error,
+        "changed": changed,
+    }
+
+
+def stamp_batch(
+    inputs: list[str],
+    properties: dict[str, str],
+    output_dir: str | None = None,
+    max_workers: int | None = None,
+) -> Iterator[BatchStampResult]:
+    """
+    `stamp_mscz()` every score matched by `inputs` (see `collect_inputs()`), in place unless `output_dir` is given.
+    Yields one result per file as they finish. A file failing doesn't stop the rest of the batch.
+    Raises a ValueError (before changing anything) if two inputs would be written to the same output.
+
+    max_workers=1 runs everything in this process, otherwise files are spread over a pool
+    (default size: number of CPUs)
+    """
+    check_stamp_properties(properties)  # before anything is changed
+    jobs = [
+        (input_path, os.path.join(output_dir, rel_path) if output_dir else input_path, properties)
+        for input_path, rel_path in collect_inputs(inputs)
+    ]
+    check_unique_outputs([output_path for _, output_path, _ in jobs])
+
+    if max_workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield _stamp_one(*job)
+        return
+
+    with make_executor(max_workers) as executor:
+        max_pending = 4 * (max_workers or os.cpu_count() or 1)
+        yield from map_unordered(executor, _stamp_one, jobs, max_pending)
+
+
+def parse_stamp_properties(assignments: list[str]) -> dict[str, str]:
+    """NAME=VALUE strings (from --set) -> properties"""
+    res = {}
+    for assignment in assignments:
+        name, sep, value = assignment.partition("=")
+        if not sep or not name:
+            raise ValueError(f"Expected NAME=VALUE, got {assignment!r}")
+        res[name] = value
+    check_stamp_properties(res)
+    return res
+
+
+def summarize(results: list[BatchFileResult], seconds: float) -> dict:
+    """Machine readable summary of a batch run"""
+    results = sorted(results, key=lambda r: r["input"])
+    failed = [r for r in results if not r["ok"]]
+    return {
+        "total": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "seconds": round(seconds, 4),
+        "files": results,
+    }
+
+
+def _write_summary(summary: dict, summary_path: str | None) -> None:
+    if summary_path:
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=2)
+    else:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Format (inspect, or stamp) many MuseScore files (.mscz) in one go."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    format_parser = subparsers.add_parser("format", help="Format scores")
+    format_parser.add_argument(
+        "inputs", nargs="+", help=".mscz files, directories, or glob patterns"
+    )
+    format_parser.add_argument(
+        "--output-dir", required=True, help="Directory to write formatted scores to"
+    )
+    format_parser.add_argument(
+        "--summary",
+        default=None,
+        help="Path to write the JSON summary to (default: stdout)",
+    )
+    format_parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Number of files to format at once (default: number of CPUs)",
+    )
+    format_parser.add_argument(
+        "--predict", action="store_true", help="Predict the formatting params that aren't passed in, for each score"
+    )
+    add_formatting_arguments(format_parser)
+
+    inspect_parser = subparsers.add_parser("inspect", help="Read the title / meta data of scores")
+    inspect_parser.add_argument(
+        "inputs", nargs="+", help=".mscz files, directories, or glob patterns"
+    )
+    inspect_parser.add_argument(
+        "--format", choices=("jsonl", "csv"), default="jsonl", help="Output format (default: jsonl)"
+    )
+    inspect_parser.add_argument(
+        "--output", default=None, help="Path to write the rows to (default: stdout)"
+    )
+    inspect_parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Number of files to inspect at once (default: number of CPUs)",
+    )
+
+    stamp_parser = subparsers.add_parser(
+        "stamp", help="Set the title box / meta data of scores (and their parts) without formatting them"
+    )
+    stamp_parser.add_argument(
+        "inputs", nargs="+", help=".mscz files, directories, or glob patterns"
+    )
+    stamp_parser.add_argument(
+        "--set",
+        dest="assignments",
+        action="append",
+        required=True,
+        metavar="NAME=VALUE",
+        help="Property to set, eg. title=\"My Song\" or meta_composer=\"Someone\" (repeatable)",
+    )
+    stamp_parser.add_argument(
+        "--output-dir", default=None, help="Directory to write stamped scores to (default: change them in place)"
+    )
+    stamp_parser.add_argument(
+        "--summary",
+        default=None,
+        help="Path to write the JSON summary to (default: stdout)",
+    )
+    stamp_parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Number of files to stamp at once (default: number of CPUs)",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "inspect":
+        _inspect_main(args)
+        return
+    if args.command == "stamp":
+        _stamp_main(parser, args)
+        return
+
+    start = time.perf_counter()
+    results = []
+    try:
+        for result in format_batch(
+            args.inputs,
+            args.output_dir,
+            formatting_params_from_args(args, predict=args.predict),
+            predict=args.predict,
+            max_workers=args.max_workers,
+        ):
+            results.append(result)
+            if result["ok"]:
+                print(f"✅ {result['input']} ({result['seconds']}s)", file=sys.stderr)
+            else:
+                print(f"❌ {result['input']}: {result['error']}", file=sys.stderr)
+    except ValueError as e:  # two inputs with the same output (files that fail are in the results instead)
+        parser.error(str(e))
+
+    summary = summarize(results, time.perf_counter() - start)
+    _write_summary(summary, args.summary)
+
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def _inspect_main(args: argparse.Namespace) -> None:
+    failed = 0
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = InspectWriter(out, args.format)
+        for result in inspect_batch(args.inputs, max_workers=args.max_workers):
+            writer.write(result)
+            if not result["ok"]:
+                failed += 1
+                print(f"❌ {result['input']}: {result['error']}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if failed:
+        sys.exit(1)
+
+
+def _stamp_main(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    try:
+        properties = parse_stamp_properties(args.assignments)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    results = []
+    try:
+        for result in stamp_batch(args.inputs, properties, args.output_dir, max_workers=args.max_workers):
+            results.append(result)
+            if result["ok"]:
+                print(
+                    f"✅ {result['input']} ({len(result['changed'])} changed, {result['seconds']}s)", file=sys.stderr
+                )
+            else:
+                print(f"❌ {result['input']}: {result['error']}", file=sys.stderr)
+    except ValueError as e:  # two inputs with the same output
+        parser.error(str(e))
+
+    summary = summarize(results, time.perf_counter() - start)
+    _write_summary(summary, args.summary)
+
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+Daemon mode: a long running formatter that scores are sent to, instead of starting a new python for each one.
+
+    python -m musescore_part_formatter.daemon serve --socket /tmp/part-formatter.sock --max-workers 4
+    python -m musescore_part_formatter.daemon format in.mscz out.mscz --socket /tmp/part-formatter.sock --show-title "My Show"
+    python -m musescore_part_formatter.daemon inspect in.mscz --socket /tmp/part-formatter.sock
+    python -m musescore_part_formatter.daemon stats --socket /tmp/part-formatter.sock
+
+(or --port N instead of --socket, to listen on loopback TCP)
+
+The worker pool is started (and the style templates rendered in each worker) before the daemon starts listening, so the
+first job doesn't pay for it. Jobs wait in a bounded queue, if it's full the job is turned down straight away instead of
+piling up. Jobs that take longer than their timeout are given up on (see `aio.py` for what that means for a job that's
+already running).
+
+Protocol: one JSON object per line each way. Requests look like
+    {"command": "format", "input": "in.mscz", "output": "out.mscz", "params": {...}, "options": {...}, "timeout": 60}
+    {"command": "inspect", "input": "in.mscz"}
+    {"command": "stats"}
+and get back {"ok": true, "result": ...} or {"ok": false, "error": "..."}. Paths are as the daemon sees them, so send
+absolute ones (`DaemonClient` does).
+"""
+
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+import threading
+import time
+
+from .aio import AsyncFormatter
+from .main import add_formatting_arguments, formatting_params_from_args
+from .parallel import make_executor
+from .xml_backend import get_xml_backend
+
+from logging import getLogger
+
+LOGGER = getLogger("PartFormatter")
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_TIMEOUT = 300.0  # seconds
+LATENCY_WINDOW = 1000  # most recent jobs the latency stats are worked out from
+
+# format_mscz() keyword arguments a client can pass in "options"
+FORMAT_OPTIONS = ("predict", "streaming", "minimal_diff", "use_cache", "incremental")
+
+
+class DaemonError(Exception):
+    pass
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    """
+    Remove a socket left over from a daemon that didn't shut down cleanly.
+    Raises DaemonError if something else is at `socket_path`: a file that isn't a socket, or a daemon that's still running
+    """
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise DaemonError(f"{socket_path} already exists and isn't a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:  # nobody's listening on it
+            os.remove(socket_path)
+            return
+    raise DaemonError(f"Something is already listening on {socket_path}")
+
+
+def _warm_up_worker() -> None:
+    """Runs when each worker starts: do the imports / lookups / style renders a first job would otherwise pay for"""
+    from .formatting import warm_style_cache
+
+    get_xml_backend()
+    warm_style_cache()
+
+
+def _ready() -> bool:
+    return True
+
+
+class DaemonStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.running = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)  # seconds from being queued to being done
+
+    def to_dict(self, queued: int) -> dict[str, Any]:
+        uptime = time.monotonic() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4)
+
+        return {
+            "uptime": round(uptime, 2),
+            "queued": queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected,
+            "jobs_per_second": round(self.completed / uptime, 4) if uptime else 0.0,
+            "latency": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 4) if latencies else None,
+            },
+        }
+
+
+class FormatterDaemon:
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        executor: Executor | None = None,
+    ):
+        """
+        max_workers: size of the worker pool (default: number of CPUs), also how many jobs run at once
+        queue_size: most jobs waiting for a worker, more than that get turned down
+        timeout: default time limit for a job, in seconds
+        executor: run jobs here instead of on a new pool (it's not warmed up or shut down)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.stats = DaemonStats()
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopping: asyncio.Event | None = None
+        self.ready = threading.Event()  # set once it's listening
+
+    async def _start_workers(self) -> None:
+        if self._executor is None:
+            self._executor = make_executor(self.max_workers, initializer=_warm_up_worker)
+            # the pool only starts its workers once there's work, so give them some
+            await asyncio.gather(
+                *(asyncio.wrap_future(self._executor.submit(_ready)) for _ in range(self.max_workers))
+            )
+        self._formatter = AsyncFormatter(self._executor, max_concurrency=self.max_workers)
+        # unbounded, `_waiting()` is what's limited to queue_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._idle = 0  # consumers waiting for a job
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.max_workers)]
+
+    async def serve(self, socket_path: str | None = None, port: int | None = None) -> None:
+        """
+        Serve on a unix socket, or on loopback TCP, until `stop()` is called.
+        A socket left over at `socket_path` is replaced, anything else there raises DaemonError
+        """
+        if (socket_path is None) == (port is None):
+            raise ValueError("Pass exactly one of socket_path or port")
+
+        if socket_path is not None:
+            _remove_stale_socket(socket_path)  # before starting the workers, so nothing needs cleaning up if it raises
+
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        await self._start_workers()
+
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self._handle_connection, path=socket_path)
+        else:
+            server = await asyncio.start_server(self._handle_connection, "127.0.0.1", port)
+
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(signum, self._stopping.set)
+
+        LOGGER.info(f"Formatter daemon listening on {socket_path or f'127.0.0.1:{port}'}")
+        self.ready.set()
+        try:
+            async with server:
+                await self._stopping.wait()
+        finally:
+            for consumer in self._consumers:
+                consumer.cancel()
+            if self._owns_executor:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def stop(self) -> None:
+        """Stop serving (can be called from any thread)"""
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                response = await self._handle_request(line)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, line: bytes) -> dict[str, Any]:
+        try:
+            request = json.loads(line)
+            command = request.get("command")
+            if command == "stats":
+                return {"ok": True, "result": self.stats.to_dict(self._waiting())}
+            if command not in ("format", "inspect"):
+                raise DaemonError(f"Unknown command: {command}")
+
+            if self._waiting() >= self.queue_size:
+                self.stats.rejected += 1
+                raise DaemonError("Job queue is full, try again later")
+            done = asyncio.get_running_loop().create_future()
+            self._queue.put_nowait((request, time.monotonic(), done))
+            return {"ok": True, "result": await done}
+
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    def _waiting(self) -> int:
+        """
+        Jobs waiting for a worker. A job stays in the queue until the consumer it woke up gets to run, so those don't
+        count (otherwise a burst of jobs could be turned down with workers sitting idle)
+        """
+        return max(0, self._queue.qsize() - self._idle)
+
+    async def _consume(self) -> None:
+        while True:
+            self._idle += 1
+            try:
+                request, queued_at, done = await self._queue.get()
+            finally:
+                self._idle -= 1
+            self.stats.running += 1
+            try:
+                timeout = request.get("timeout") or self.timeout
+                result = await asyncio.wait_for(self._run_job(request), timeout)
+            except asyncio.TimeoutError:
+                self.stats.timed_out += 1
+                _resolve(done, exception=DaemonError(f"Job took longer than {timeout}s"))
+            except Exception as e:
+                self.stats.failed += 1
+                _resolve(done, exception=e)
+            else:
+                self.stats.completed += 1
+                _resolve(done, result=result)
+            finally:
+                self.stats.running -= 1
+                self.stats.latencies.append(time.monotonic() - queued_at)
+
+    async def _run_job(self, request: dict[str, Any]) -> Any:
+        if request["command"] == "inspect":
+            return await self._formatter.get_score_attributes(request["input"])
+
+        options = request.get("options") or {}
+        unknown = set(options) - set(FORMAT_OPTIONS)
+        if unknown:
+            raise DaemonError(f"Unknown options: {', '.join(sorted(unknown))}")
+        ok = await self._formatter.format_mscz(
+            request["input"], request["output"], request.get("params") or {}, **options
+        )
+        if not ok:
+            raise DaemonError("Formatting failed, see the daemon's logs for details")
+        return request["output"]
+
+
+def _resolve(done: asyncio.Future, result: Any = None, exception: Exception | None = None) -> None:
+    if done.done():  # the request was cancelled (eg. the daemon is shutting down)
+        return
+    if exception is not None:
+        done.set_exception(exception)
+    else:
+        done.set_result(result)
+
+
+class DaemonClient:
+    def __init__(self, socket_path: str | None = None, port: int | None = None, timeout: float | None = None):
+        if (socket_path is None) == (port is None):
+            raise ValueError("Pass exactly one of socket_path or port")
+        self.socket_path = socket_path
+        self.port = port
+        self.timeout = timeout  # socket timeout, in seconds
+
+    def _connect(self) -> socket.socket:
+        if self.socket_path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        else:
+            sock = socket.create_connection(("127.0.0.1", self.port), timeout=self.timeout)
+        return sock
+
+    def request(self, request: dict[str, Any]) -> Any:
+        """Send one request, returns its result (raises DaemonError if it failed)"""
+        with self._connect() as sock, sock.makefile("rwb") as f:
+            f.write(json.dumps(request).encode("utf-8") + b"\n")
+            f.flush()
+            line = f.readline()
+        if not line:
+            raise DaemonError("Daemon closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise DaemonError(response["error"])
+        return response["result"]
+
+    def format_mscz(
+        self,
+        input_path: str,
+        output_path: str,
+        params: dict[str, Any],
+        timeout: float | None = None,
+        **options,
+    ) -> str:
+        """Same as `main.format_mscz()` (`options` are its keyword arguments), `timeout` is the job's time limit"""
+        return self.request(
+            {
+                "command": "format",
+                "input": os.path.abspath(input_path),
+                "output": os.path.abspath(output_path),
+                "params": params,
+                "options": options,
+                "timeout": timeout,
+            }
+        )
+
+    def get_score_attributes(self, input_path: str) -> dict[str, Any]:
+        return self.request({"command": "inspect", "input": os.path.abspath(input_path)})
+
+    def stats(self) -> dict[str, Any]:
+        return self.request({"command": "stats"})
+
+
+def _add_address_arguments(parser: argparse.ArgumentParser) -> None:
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument("--socket", dest="socket_path", help="Unix socket path")
+    address.add_argument("--port", type=int, help="Port on 127.0.0.1")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Run, or send scores to, a long running formatter.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Start the daemon")
+    _add_address_arguments(serve_parser)
+    serve_parser.add_argument(
+        "--max-workers", type=int, default=None, help="Worker pool size (default: number of CPUs)"
+    )
+    serve_parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"Most jobs waiting for a worker before new ones are turned down (default: {DEFAULT_QUEUE_SIZE})",
+    )
+    serve_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"Default time limit per job, in seconds (default: {DEFAULT_TIMEOUT:g})",
+    )
+
+    format_parser = subparsers.add_parser("format", help="Format a score on the daemon")
+    _add_address_arguments(format_parser)
+    format_parser.add_argument("input", help="Path to input .mscz file")
+    format_parser.add_argument("output", help="Path to output .mscz file")
+    format_parser.add_argument("--timeout", type=float, default=None, help="Time limit for this job, in seconds")
+    format_parser.add_argument("--streaming", action="store_true")
+    format_parser.add_argument("--minimal-diff", action="store_true")
+    format_parser.add_argument("--incremental", action="store_true")
+    add_formatting_arguments(format_parser)
+
+    inspect_parser = subparsers.add_parser("inspect", help="Get a score's properties from the daemon")
+    _add_address_arguments(inspect_parser)
+    inspect_parser.add_argument("input", help="Path to .mscz file")
+
+    stats_parser = subparsers.add_parser("stats", help="Show the daemon's throughput / latency stats")
+    _add_address_arguments(stats_parser)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        daemon = FormatterDaemon(args.max_workers, args.queue_size, args.timeout)
+        try:
+            asyncio.run(daemon.serve(args.socket_path, args.port))
+        except DaemonError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        return
+
+    client = DaemonClient(args.socket_path, args.port)
+    try:
+        if args.command == "format":
+            options = {}
+            for name in ("streaming", "minimal_diff", "incremental"):
+                if getattr(args, name):
+                    options[name] = True
+            client.format_mscz(
+                args.input, args.output, formatting_params_from_args(args), timeout=args.timeout, **options
+            )
+            print(f"✅ Successfully formatted score: {args.output}")
+        elif args.command == "inspect":
+            json.dump(client.get_score_attributes(args.input), sys.stdout, indent=2)
+            print()
+        else:
+            json.dump(client.stats(), sys.stdout, indent=2)
+            print()
+    except (DaemonError, OSError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,11 @@ Code to dynamically predict the optimal formatting params for a score
 WIP still but Im working on it
 """
 
-from .utils import FormattingParams
+from .utils import FormattingParams, LinePlanner, PagePlanner
+from .file_inspect import get_time_signatures
 
+# measures per line tried either side of the time signature's usual one (see `predict_layout_params()`)
+NMPL_SWEEP_RADIUS = 2
 
 
 def _predict_nmpl(time_sig) -> int:
@@ -69,4 +72,46 @@ def predict_formatting_params(score_info) -> dict[str, object]:
     if time_sig := score_info.get("time_sig"):
         res["nmpl"] = _predict_nmpl(time_sig)
     
-    return res
\ No newline at end of file
+    return res
+
+
+def predict_layout_params(
+    input_path: str,
+    lines_per_page: tuple[int, ...] = (8,),
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+) -> dict[str, int]:
+    """
+    Pick num_measures_per_line_part / num_lines_per_page for a mscz from its parts' actual measures, instead of just
+    the time signature: every measures per line within `NMPL_SWEEP_RADIUS` of `_predict_nmpl()` (and every
+    `lines_per_page`) is planned on every part (see param_sweep.py), and the one with the lowest total cost wins.
+    Returns {} if the score doesn't have any parts
+    """
+    from .param_sweep import mscz_scores, sweep_score, candidates  # parses + plans, only needed when predicting
+
+    scores = []
+    targets = []
+    for _, score in mscz_scores(input_path):
+        time_sigs = get_time_signatures(score)
+        scores.append(score)
+        targets.append(_predict_nmpl(time_sigs[0] if time_sigs else None))
+    if not scores:
+        return {}
+
+    measures_per_line = sorted(
+        {
+            nmpl
+            for target in targets
+            for nmpl in range(target - NMPL_SWEEP_RADIUS, target + NMPL_SWEEP_RADIUS + 1)
+            if nmpl > 0
+        }
+    )
+    sweep_candidates = candidates(measures_per_line, lines_per_page)
+    totals = dict.fromkeys(sweep_candidates, 0.0)
+    for score, target in zip(scores, targets):
+        for result in sweep_score(score, sweep_candidates, page_planner, line_planner, target):
+            totals[(result.measures_per_line, result.num_lines_per_page)] += result.cost
+
+    # ties go to fewer measures per line, then the first of `lines_per_page`
+    nmpl, num_lines_per_page = min(totals, key=totals.get)
+    return {"num_measures_per_line_part": nmpl, "num_lines_per_page": num_lines_per_page}
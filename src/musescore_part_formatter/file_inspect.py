@@ -1,10 +1,10 @@
-from typing import TypedDict
-import shutil
-import tempfile
-import zipfile
-import os
+from typing import BinaryIO, TypedDict
+import xml.parsers.expat
 
 import xml.etree.ElementTree as ET
+from logging import getLogger
+
+LOGGER = getLogger("PartFormatter")
 
 
 class ScoreInfo(TypedDict):
@@ -35,6 +35,8 @@ TITLE_BOX_PROPERTIES = [
 ]
 META_PROPERTIES = ["arranger", "composer", "workTitle", "subtitle"]
 
+SCAN_CHUNK_SIZE = 1 << 16
+
 
 def get_properties_from_title_box(score: ET.Element, debug=False) -> dict[str, str]:
     staff = score.find("Staff")
@@ -102,7 +104,8 @@ def get_time_signatures(score: ET.Element) -> list[str]:
     measures = staff.findall("Measure")
     res = []
     for measure in measures:
-        if time_sig := measure.find("voice").find("TimeSig"):
+        time_sig = measure.find("voice").find("TimeSig")
+        if time_sig is not None and len(time_sig):
             res.append(f"{time_sig.find('sigN').text}/{time_sig.find('sigD').text}")
     return res
 
@@ -112,7 +115,7 @@ def _set_staff_spacing(style_file_txt: str, value: str) -> str:
 
 
 def set_style_params(style_file_txt: str, **kwargs) -> str:
-    print("STYLE PARAMS FUNCTION CALLED!")
+    LOGGER.debug("Setting style params: %s", kwargs)
 
     if "staff_spacing" in kwargs:
         style_file_txt = _set_staff_spacing(
@@ -134,7 +137,177 @@ def get_all_properties(score: ET.Element) -> ScoreInfo:
     return res  # type-ignore
 
 
-def set_all_properties(score: ET.Element, properties: dict[str, str]) -> None:
+class _ScanDone(Exception):
+    pass
+
+
+class _InfoScanner:
+    """
+    expat handlers for `scan_score_info()`. Depths: 1 is the root, 2 the <Score>, 3 its children (metaTags, Parts,
+    Staves), 4 the first Staff's VBox / Measures, ...
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_score = False
+        self.seen_score = False
+        self.element = ""  # the depth 3 element we're in
+        self.title_box: dict[str, str | None] = {}
+        self.meta: dict[str, str | None] = {}
+        self.num_parts = 0
+        self.num_part_staves = 0  # <Staff> definitions in the <Part>s
+        self.num_staves = 0
+        self.time_signatures: list[str] = []
+
+        self.meta_name: str | None = None
+        self.seen_vbox = False
+        self.in_vbox = False
+        self.text_fields: dict[str, str | None] = {}  # first <style> / <text> of the current title box <Text>
+        self.seen_voice = False  # first <voice> of the current measure
+        self.in_voice = False
+        self.time_sig: dict[str, str | None] | None = None  # first <TimeSig> of the current voice
+        self.in_time_sig = False
+        self.time_sig_children = 0
+
+        # .text of the element being captured (the text up to its first child, like ElementTree)
+        self.capture: list[str] | None = None
+        self.capture_depth = 0
+        self.capture_open = False
+
+    def _start_capture(self) -> None:
+        self.capture = []
+        self.capture_depth = self.depth
+        self.capture_open = True
+
+    def start(self, name, attrs):
+        if self.capture is not None and self.depth == self.capture_depth:
+            self.capture_open = False
+        self.depth += 1
+        depth = self.depth
+
+        if depth == 2:
+            if name == "Score" and not self.seen_score:
+                self.in_score = self.seen_score = True
+            return
+        if not self.in_score:
+            return
+
+        if depth == 3:
+            self.element = name
+            if name == "metaTag":
+                self.meta_name = attrs.get("name")
+                self._start_capture()
+            elif name == "Part":
+                self.num_parts += 1
+            elif name == "Staff":
+                self.num_staves += 1
+        elif self.element == "Part":
+            if depth == 4 and name == "Staff":
+                self.num_part_staves += 1
+        elif self.element == "Staff" and self.num_staves == 1:
+            self._start_in_first_staff(name, depth)
+
+    def _start_in_first_staff(self, name: str, depth: int) -> None:
+        if depth == 4:
+            if name == "VBox" and not self.seen_vbox:
+                self.seen_vbox = self.in_vbox = True
+            elif name == "Measure":
+                self.seen_voice = False
+        elif self.in_vbox:
+            if depth == 5 and name == "Text":
+                self.text_fields = {}
+            elif depth == 6 and name in ("style", "text") and name not in self.text_fields:
+                self.text_fields[name] = None
+                self._start_capture()
+        elif depth == 5:
+            if name == "voice" and not self.seen_voice:
+                self.seen_voice = self.in_voice = True
+                self.time_sig = None
+        elif self.in_time_sig and depth == 7:
+            self.time_sig_children += 1
+            if name in ("sigN", "sigD") and name not in self.time_sig:
+                self.time_sig[name] = None
+                self._start_capture()
+        elif self.in_voice and depth == 6 and name == "TimeSig" and self.time_sig is None:
+            self.time_sig = {}
+            self.in_time_sig = True
+            self.time_sig_children = 0
+
+    def end(self, name):
+        depth = self.depth
+        self.depth -= 1
+        if self.capture is not None and depth == self.capture_depth:
+            self._store_capture(name, "".join(self.capture) or None)
+            self.capture = None
+
+        if not self.in_score:
+            return
+        if depth == 2:
+            raise _ScanDone()
+        if depth == 3:
+            self.element = ""
+            # the Parts come before the staves and say how many there are, so there's no need to read any further
+            if name == "Staff" and self.num_staves == 1 and self.num_part_staves:
+                raise _ScanDone()
+        elif self.element == "Staff" and self.num_staves == 1:
+            if depth == 4 and name == "VBox":
+                self.in_vbox = False
+            elif self.in_vbox and depth == 5 and name == "Text":
+                if "style" in self.text_fields:
+                    self.title_box[self.text_fields["style"]] = self.text_fields.get("text")
+            elif depth == 5 and name == "voice":
+                self.in_voice = False
+            elif self.in_time_sig and depth == 6:
+                self.in_time_sig = False
+                if self.time_sig_children:
+                    self.time_signatures.append(f"{self.time_sig.get('sigN')}/{self.time_sig.get('sigD')}")
+
+    def _store_capture(self, name: str, text: str | None) -> None:
+        if name == "metaTag":
+            if self.meta_name in META_PROPERTIES:
+                self.meta[f"meta_{self.meta_name}"] = text
+        elif name in ("style", "text"):
+            self.text_fields[name] = text
+        else:
+            self.time_sig[name] = text
+
+    def characters(self, data):
+        if self.capture is not None and self.capture_open and self.depth == self.capture_depth:
+            self.capture.append(data)
+
+    def score_info(self) -> ScoreInfo:
+        res = self.title_box | self.meta
+        res["num_instruments"] = self.num_parts
+        res["num_staves"] = max(self.num_staves, self.num_part_staves)
+        res["time_signatures"] = self.time_signatures
+        return res
+
+
+def scan_score_info(fp: BinaryIO) -> ScoreInfo:
+    """
+    Same as `get_all_properties()` on the mscx in `fp`, without building a tree: one expat pass that stops once the
+    first staff (title box, time signatures) has been read, so most of a big score is never even read from `fp`
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    scanner = _InfoScanner()
+    parser.StartElementHandler = scanner.start
+    parser.EndElementHandler = scanner.end
+    parser.CharacterDataHandler = scanner.characters
+
+    try:
+        while chunk := fp.read(SCAN_CHUNK_SIZE):
+            parser.Parse(chunk, False)
+        parser.Parse(b"", True)
+    except _ScanDone:
+        pass
+
+    if not scanner.seen_score:
+        raise ValueError("No <Score> tag found in the XML.")
+    return scanner.score_info()
+
+
+def set_all_properties(score: ET.Element, properties: dict[str, str], debug=True) -> None:
     meta_properties = {
         k.removeprefix("meta_"): v
         for k, v in properties.items()
@@ -146,4 +319,4 @@ def set_all_properties(score: ET.Element, properties: dict[str, str]) -> None:
     }
 
     set_meta_score_properties(score, meta_properties)
-    set_title_box_score_properties(score, title_box_properties, debug=True)
+    set_title_box_score_properties(score, title_box_properties, debug=debug)
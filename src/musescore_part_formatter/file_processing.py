@@ -1,17 +1,114 @@
 from contextlib import contextmanager
-from typing import Iterator, Tuple, List
+from typing import BinaryIO, Callable, Iterable, Iterator, Tuple, List
 import zipfile
 import tempfile
+import shutil
+import struct
+import copy
+import zlib
+import io
 import os
 
+from .instrumentation import stage
+from .utils import mkstemp_for_output
 
-def _rezip_mscz(work_dir: str, output_path: str) -> None:
-    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as z:
-        for root, _, files in os.walk(work_dir):
-            for file in files:
-                full_path = os.path.join(root, file)
-                arcname = os.path.relpath(full_path, work_dir)
-                z.write(full_path, arcname)
+# Members of a .mscz that the formatter can change, everything else is copied over as is
+EDITABLE_MEMBER_EXTENSIONS = (".mscx", ".mss")
+
+_MASK_USE_DATA_DESCRIPTOR = 0x08
+
+
+def _read_raw_member(fp: BinaryIO, info: zipfile.ZipInfo) -> bytes:
+    """Read a member's data from the archive as-is (still compressed)"""
+    fp.seek(info.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+    return fp.read(info.compress_size)
+
+
+# zipfile has no public API for writing already compressed data, so `_write_raw_member()` does what ZipFile.writestr()
+# does minus the compression, through these undocumented ZipFile attributes. Nothing promises they stay, so if a python
+# version doesn't have them, members get recompressed instead (see `_copy_member()`)
+_RAW_WRITE_ATTRS = ("fp", "start_dir", "_didModify", "NameToInfo", "filelist")
+
+
+def _can_write_raw(dst: zipfile.ZipFile) -> bool:
+    return all(hasattr(dst, attr) for attr in _RAW_WRITE_ATTRS)
+
+
+def _write_raw_member(dst: zipfile.ZipFile, info: zipfile.ZipInfo, raw: bytes) -> None:
+    """
+    Write already compressed member data into `dst`, keeping the original member's metadata.
+    The only place that touches zipfile's internals, check `_can_write_raw()` first
+    """
+    zinfo = copy.copy(info)
+    # sizes + CRC are already known, so they go in the local header instead of a data descriptor
+    zinfo.flag_bits &= ~_MASK_USE_DATA_DESCRIPTOR
+    zinfo.header_offset = dst.fp.tell()
+    dst.fp.write(zinfo.FileHeader())
+    dst.fp.write(raw)
+    dst.filelist.append(zinfo)
+    dst.NameToInfo[zinfo.filename] = zinfo
+    dst.start_dir = dst.fp.tell()
+    dst._didModify = True
+
+
+def _copy_member(dst: zipfile.ZipFile, src: zipfile.ZipFile, raw_fp: BinaryIO, info: zipfile.ZipInfo) -> None:
+    """Copy a member of `src` (`raw_fp` is its file) to `dst` unchanged: still compressed if possible"""
+    if _can_write_raw(dst):
+        _write_raw_member(dst, info, _read_raw_member(raw_fp, info))
+    else:
+        dst.writestr(copy.copy(info), src.read(info), compress_type=info.compress_type)
+
+
+def _write_changed_member(dst: zipfile.ZipFile, info: zipfile.ZipInfo, data: bytes) -> None:
+    """Compress new data for a member, keeping its name, date and attributes"""
+    dst.writestr(copy.copy(info), data, compress_type=zipfile.ZIP_DEFLATED)
+
+
+def _rezip_mscz(work_dir: str, output_path: str, source_path: str | None = None) -> None:
+    """
+    Zip the contents of `work_dir` into `output_path`.
+
+    If `source_path` (the archive `work_dir` was unpacked from) is given, members are written in the same order as
+    the source, and any file that is unchanged is copied over still compressed instead of being recompressed.
+    Output is built in memory, so `output_path` can be the same as `source_path`
+    """
+    on_disk = {}
+    for root, _, files in os.walk(work_dir):
+        for file in files:
+            full_path = os.path.join(root, file)
+            arcname = os.path.relpath(full_path, work_dir).replace(os.sep, "/")
+            on_disk[arcname] = full_path
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        if source_path is not None:
+            with zipfile.ZipFile(source_path, "r") as src, open(source_path, "rb") as raw_fp:
+                for info in src.infolist():
+                    if info.is_dir():
+                        _copy_member(z, src, raw_fp, info)
+                        continue
+                    full_path = on_disk.pop(info.filename, None)
+                    if full_path is None:
+                        continue  # removed
+
+                    with open(full_path, "rb") as f:
+                        data = f.read()
+                    if len(data) == info.file_size and zlib.crc32(data) == info.CRC:
+                        _copy_member(z, src, raw_fp, info)
+                    else:
+                        _write_changed_member(z, info, data)
+
+        # anything new
+        for arcname, full_path in on_disk.items():
+            z.write(full_path, arcname)
+
+    with open(output_path, "wb") as f:
+        f.write(buffer.getvalue())
 
 
 @contextmanager
@@ -25,7 +122,7 @@ def unpack_mscz_to_tempdir(
     with tempfile.TemporaryDirectory() as work_dir:
         try:
             # --- unzip ---
-            with zipfile.ZipFile(mscz_path, "r") as z:
+            with stage("unzip"), zipfile.ZipFile(mscz_path, "r") as z:
                 z.extractall(work_dir)
                 mscx_files = [
                     os.path.join(work_dir, name)
@@ -36,8 +133,106 @@ def unpack_mscz_to_tempdir(
             yield work_dir, mscx_files
 
             if repack:
-                _rezip_mscz(work_dir, mscz_path)
+                with stage("rezip"):
+                    _rezip_mscz(work_dir, mscz_path, source_path=mscz_path)
 
         except Exception:
             # don't overwrite original file if something goes wrong
             raise
+
+
+def rewrite_mscz(
+    input_path: str,
+    output_path: str,
+    rewrite_members: Callable[[dict[str, bytes]], dict[str, bytes]],
+    passthrough: bool = True,
+) -> None:
+    """
+    Rewrite a .mscz without unpacking it to disk.
+
+    `rewrite_members` is given the contents of every .mscx / .mss member (keyed by member name, in archive order)
+    and returns the new contents of the ones it changed. The output archive is built in memory and written out in one go,
+    so `output_path` can be the same as `input_path`, and nothing is written if `rewrite_members` raises.
+
+    Members keep their original order and metadata. With `passthrough`, members that weren't changed are copied
+    over still compressed (byte for byte), otherwise everything is recompressed.
+    """
+    with zipfile.ZipFile(input_path, "r") as src, open(input_path, "rb") as raw_fp:
+        with stage("unzip"):
+            infos = src.infolist()
+            members = {
+                info.filename: src.read(info)
+                for info in infos
+                if info.filename.endswith(EDITABLE_MEMBER_EXTENSIONS)
+            }
+
+        changed = rewrite_members(members)
+
+        with stage("rezip"):
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as dst:
+                for info in infos:
+                    if info.filename in changed:
+                        _write_changed_member(dst, info, changed[info.filename])
+                    elif passthrough:
+                        _copy_member(dst, src, raw_fp, info)
+                    elif info.filename in members:
+                        _write_changed_member(dst, info, members[info.filename])
+                    else:
+                        _write_changed_member(dst, info, src.read(info))
+
+    with stage("rezip"):
+        with open(output_path, "wb") as f:
+            f.write(buffer.getvalue())
+
+
+def stream_rewrite_mscz(
+    input_path: str,
+    output_path: str,
+    rewrite_members: Callable[[Iterator[tuple[str, bytes]]], Iterable[tuple[str, bytes | None]]],
+    passthrough: bool = True,
+) -> None:
+    """
+    `rewrite_mscz()`, one member at a time, for scores too big to hold in memory all at once.
+
+    `rewrite_members` is given an iterator over the .mscx / .mss members (name, contents), read from the archive as it
+    goes, and yields (name, new contents, or None if unchanged) for every one of them in the same order. It can read
+    ahead (eg. to format a few members in parallel), only what it holds on to stays in memory.
+
+    The output is written to a temp file next to `output_path` and moved into place at the end, so `output_path` can be
+    the same as `input_path`, and nothing is written if `rewrite_members` raises.
+    """
+    fd, tmp_path = mkstemp_for_output(os.path.dirname(os.path.abspath(output_path)), suffix=".mscz.tmp")
+    try:
+        with os.fdopen(fd, "w+b") as out_fp:
+            with zipfile.ZipFile(input_path, "r") as src, open(input_path, "rb") as raw_fp:
+                infos = src.infolist()
+                editable = [info for info in infos if info.filename.endswith(EDITABLE_MEMBER_EXTENSIONS)]
+
+                def read_members() -> Iterator[tuple[str, bytes]]:
+                    for info in editable:
+                        with stage("unzip"):
+                            data = src.read(info)
+                        yield info.filename, data
+
+                rewritten = iter(rewrite_members(read_members()))
+                with zipfile.ZipFile(out_fp, "w", zipfile.ZIP_DEFLATED) as dst:
+                    for info in infos:
+                        data = None
+                        if info.filename.endswith(EDITABLE_MEMBER_EXTENSIONS):
+                            name, data = next(rewritten)
+                            if name != info.filename:
+                                raise ValueError(f"Expected {info.filename} back from rewrite_members, got {name}")
+                        with stage("rezip"):
+                            if data is not None:
+                                _write_changed_member(dst, info, data)
+                            elif passthrough:
+                                _copy_member(dst, src, raw_fp, info)
+                            else:
+                                _write_changed_member(dst, info, src.read(info))
+        if os.path.exists(output_path):
+            shutil.copymode(output_path, tmp_path)  # like writing over it would
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -1,27 +1,30 @@
 import xml.etree.ElementTree as ET
-import os, shutil
+import os
+from functools import lru_cache
+from typing import Iterable
 
 from .utils import (
     _make_part_name_text,
     _make_show_number_text,
     _make_show_title_text,
     _add_line_break_to_measure_opt,
-    _add_page_break_to_measure,
-    _measure_has_line_break,
-    _measure_has_double_bar,
-    _measure_has_rehearsal_mark,
 )
 
-from .utils import (
-    CONDUCTOR_SCORE_PART_NAME,
-    BROADWAY_PART_STYLE_PATH,
-    BROADWAY_SCORE_STYLE_PATH,
-    JAZZ_PART_STYLE_PATH,
-    JAZZ_SCORE_STYLE_PATH,
+from . import utils
+from .utils import CONDUCTOR_SCORE_PART_NAME
+from .utils import Style, LinePlanner, PagePlanner
+from .measure_index import (
+    MeasureIndex,
+    LAYOUT_BREAK,
+    REHEARSAL_MARK,
+    BARLINE,
+    MEASURE_REHEARSAL_MARK,
+    MEASURE_BARLINE,
 )
-from .utils import Style
 
+from .optimal_layout import plan_line_breaks, plan_page_breaks
 from .file_inspect import set_style_params
+from .instrumentation import stage
 from .estimating_formatting_params import predict_style_params
 
 from logging import getLogger
@@ -34,8 +37,8 @@ def add_broadway_header(staff: ET.Element, show_number: str, show_title: str) ->
     for elem in staff:
         # find first VBox
         if elem.tag == "VBox":
-            elem.append(_make_show_number_text(show_number))
-            elem.append(_make_show_title_text(show_title))
+            elem.append(_make_show_number_text(elem, show_number))
+            elem.append(_make_show_title_text(elem, show_title))
             return
 
 
@@ -48,102 +51,63 @@ def add_part_name(
                 style = child.find("style")
                 if style is not None and style.text == "instrument_excerpt":
                     return
-            elem.append(_make_part_name_text(part_name))
+            elem.append(_make_part_name_text(elem, part_name))
             return
 
 
 # -- LayoutBreak formatting --
-def prep_mm_rests(staff: ET.Element) -> ET.Element:
-    """
-    Go through each measure in score.
-    if measure n has a "len" attribute: then mark that measure and the next m (m = measure->multiMeasureRest -1) measures with the "_mm" attribute
-    """
-    measure_to_mark = 0
-    for elem in staff:
-        if elem.tag == "Measure":
-            if measure_to_mark > 0:
-                # mark measure
-                elem.attrib["_mm"] = str(measure_to_mark)  # value is dummy, never used
-                measure_to_mark -= 1
-            if elem.attrib.get("len"):
-                measure_to_mark = int(elem.find("multiMeasureRest").text) - 1
-    return staff
-
-
-def cleanup_mm_rests(staff: ET.Element) -> ET.Element:
-    """
-    Go through entire staff, remove any "_mm" attributes
-    """
-    for elem in staff:
-        if elem.attrib.get("_mm") is not None:
-            del elem.attrib["_mm"]
-    return staff
+# All of the passes below work off of a `MeasureIndex` (see measure_index.py), which is built once per staff
+# Measures are referred to by their index in the MeasureIndex
 
 
-def add_rehearsal_mark_line_breaks(staff: ET.Element) -> ET.Element:
+def add_rehearsal_mark_line_breaks(index: MeasureIndex) -> MeasureIndex:
     """
     Go through each measure in the score. If there is a rehearsal mark at measure n, ad a line break to measure n-1
-    if measure n-1 has a _mm attribute, go backwards until the first measure in the chain, and also add a line break
+    if measure n-1 is part of a multimeasure rest, also add a line break to the start of that multimeasure rest
 
-    add a line break by calling `_add_line_break_to_measure()`
+    add a line break by calling `index.add_line_break()`
     """
-    for i in range(len(staff)):
-        elem = staff[i]
-        if elem.tag != "Measure":
+    for i in range(len(index)):
+        if not index.has(i, REHEARSAL_MARK):
             continue
 
-        voice = elem.find("voice")
-        if voice is None:
+        prev_elem = index.prev_element(i)
+        assert prev_elem is not None
+        if prev_elem.tag != "Measure":
+            # eg. rehearsal mark on the first bar, line break goes on the title VBox
+            _add_line_break_to_measure_opt(prev_elem)
             continue
 
-        if voice.find("RehearsalMark") is not None:
-            assert i > 0
-            prev_elem = staff[i - 1]
-            (f"Adding Line Break to rehearsal mark at bar {i - 1}")
-            _add_line_break_to_measure_opt(prev_elem)
+        LOGGER.debug(f"Adding Line Break to rehearsal mark at bar {i - 1}")
+        index.add_line_break(i - 1)
 
-            if prev_elem.attrib.get("_mm") is not None:
-                for j in range(i - 1, -1, -1):
-                    if staff[j].attrib.get("len") is not None:
-                        LOGGER.debug(
-                            f"Adding Line Break to start of multimeasure rest at bar {j}"
-                        )
-                        _add_line_break_to_measure_opt(staff[j])
-                        break
-    return staff
+        if index.in_mm_rest(i - 1):
+            j = index.mm_start[i - 1]
+            LOGGER.debug(f"Adding Line Break to start of multimeasure rest at bar {j}")
+            index.add_line_break(j)
+    return index
 
 
-def add_double_bar_line_breaks(staff: ET.Element) -> ET.Element:
+def add_double_bar_line_breaks(index: MeasureIndex) -> MeasureIndex:
     """
     Go through each measure in the score. If there is a double bar on measure n, add a line break to measure n.
-    If measure n-1 has a "_mm" attribute, go backwards until the first measure in the chain, and also add a line break.
 
-    add a line break by calling `_add_line_break_to_measure()`
+    add a line break by calling `index.add_line_break()`
 
     TODO: Move this to a balancing function -- NOT here
     Additionally, set it up s.t. if there are 2 multimeasure rests together, only keep the second line break, remove the first one
         TODO: This should onlt do this if the entire section before the next rehearsal mark is a multimeasure rest
     """
-    for i in range(len(staff)):
-        elem = staff[i]
-        if elem.tag != "Measure":
-            continue
-
-        voice = elem.find("voice")
-        if voice is None:
-            continue
-
-        if voice.find("BarLine") is not None:
-            assert i > 0
-            prev_elem = staff[i]
+    for i in range(len(index)):
+        if index.has(i, BARLINE):
             LOGGER.debug(f"Adding Line Break to double Bar line at bar {i}")
-            _add_line_break_to_measure_opt(prev_elem)
+            index.add_line_break(i)
 
-    return staff
+    return index
 
 
 # TODO[SC-37]: make it acc work
-def balance_mm_rest_line_breaks(staff: ET.Element) -> ET.Element:
+def balance_mm_rest_line_breaks(index: MeasureIndex) -> MeasureIndex:
     """
     Scenario: We have:
     (NewLine) RehearsalMark ->MM Rest: Rehearsal Mark: MM Rest
@@ -152,22 +116,17 @@ def balance_mm_rest_line_breaks(staff: ET.Element) -> ET.Element:
     Removes unnecessary line breaks between consecutive multi-measure rests.
     """
     prev_mm = False
-    for elem in staff:
-        if elem.tag != "Measure":
-            continue
-        is_mm = elem.attrib.get("_mm") is not None
-        has_lb = elem.find("LayoutBreak") is not None
-        if prev_mm and is_mm and has_lb:
+    for i in range(len(index)):
+        is_mm = index.in_mm_rest(i)
+        if prev_mm and is_mm and index.has_line_break(i):
             # Remove the line break from this measure
-            lb = elem.find("LayoutBreak")
-            if lb is not None:
-                elem.remove(lb)
+            index.remove_line_break(i)
         prev_mm = is_mm
 
-    return staff
+    return index
 
 
-def add_regular_line_breaks(staff: ET.Element, measures_per_line: int) -> ET.Element:
+def add_regular_line_breaks(index: MeasureIndex, measures_per_line: int) -> MeasureIndex:
     """
     Go through entire score and add a line break every `measures_per_line` measures.
     Count starts at first measure and continues until an existing line break is hit, or until we reach `measures_per_line` measures,
@@ -178,27 +137,38 @@ def add_regular_line_breaks(staff: ET.Element, measures_per_line: int) -> ET.Ele
 
     mpl_count = 0
 
-    for measure in staff.findall("Measure"):
+    for i in range(len(index)):
         mpl_count += 1
 
-        if _measure_has_line_break(measure):
+        if index.has_line_break(i):
             mpl_count = 0
             continue
 
         if mpl_count == measures_per_line:
             mpl_count = 0
-            _add_line_break_to_measure_opt(measure)
+            index.add_line_break(i)
             continue
 
-        if measure.attrib.get("_mm", False):
+        if index.in_mm_rest(i):
             mpl_count -= 1
             continue
 
-    return staff
+    return index
+
+
+def add_optimal_line_breaks(index: MeasureIndex, measures_per_line: int) -> MeasureIndex:
+    """
+    Instead of `add_regular_line_breaks()` + `final_pass_through()`: add the lowest cost line breaks to each section
+    between the existing line breaks (see optimal_layout.py)
+    """
+    has_lb = [bool(flags & LAYOUT_BREAK) for flags in index.flags]
+    for i in plan_line_breaks(index, has_lb, measures_per_line):
+        index.add_line_break(i)
+    return index
 
 
 # TODO[SC-84]: Fix this
-def new_add_page_breaks(staff: ET.Element, num_lines_per_page: int) -> ET.Element:
+def new_add_page_breaks(index: MeasureIndex, num_lines_per_page: int) -> MeasureIndex:
     """
     Add page breaks to staff to improve vertical readability.
     - Aim for NUM_LINES_PER_PAGE +/- 1 line(s) per page: NUM -1 / NUM for the first page, NUM / NUM +1 for all others
@@ -235,14 +205,7 @@ def new_add_page_breaks(staff: ET.Element, num_lines_per_page: int) -> ET.Elemen
         - The MM rests should go on a new page, even though
     """
 
-    lines: list[list[ET.Element]] = [[]]
-
-    # Build list of lines
-
-    for measure in staff.findall("Measure"):
-        lines[-1].append(measure)
-        if _measure_has_line_break(measure):
-            lines.append([])
+    lines = index.lines()
 
     # start at 1, since first page should have 1 less line on it
     lines_on_this_page = 1
@@ -260,188 +223,242 @@ def new_add_page_breaks(staff: ET.Element, num_lines_per_page: int) -> ET.Elemen
 
         measure = lines[i][-1]
 
-        if measure.attrib.get("_mm") is not None:
-            if lines[i + 1][0].attrib.get("mm") is not None:
-                for j in range(i):
-                    line = lines[j]
-                    for m in line:
-                        if m.attrib.get("_mm") is None:
-                            # Finally found a line that doesnt h
-                            # add page break to last bar in eseries
-                            _add_page_break_to_measure(line[-1])
-
-            else:
-                _add_page_break_to_measure(measure)
+        if index.in_mm_rest(measure):
+            index.add_page_break(measure)
 
         else:
             next_line = lines[i + 1]
-            if next_line[0].attrib.get("_mm") is not None:
-                _add_page_break_to_measure(measure)
+            if index.in_mm_rest(next_line[0]):
+                index.add_page_break(measure)
                 # TODO[SC-XXX]: Add "V.S." Text to this measure
 
             else:
-                if _measure_has_double_bar(measure) or _measure_has_rehearsal_mark(
-                    lines[i + 1][0]
+                if index.has(measure, MEASURE_BARLINE) or index.has(
+                    lines[i + 1][0], MEASURE_REHEARSAL_MARK
                 ):
-                    _add_page_break_to_measure(measure)
+                    index.add_page_break(measure)
 
                 else:
-                    if _measure_has_double_bar(
-                        lines[i + 1][-1]
-                    ) or _measure_has_rehearsal_mark(lines[i + 2][0]):
-                        _add_page_break_to_measure(lines[i + 1][-1])
-                    elif _measure_has_double_bar(
-                        lines[i - 1][-1]
-                    ) or _measure_has_rehearsal_mark(lines[i][0]):
-                        _add_page_break_to_measure(lines[i][-1])
+                    if index.has(lines[i + 1][-1], MEASURE_BARLINE) or index.has(
+                        lines[i + 2][0], MEASURE_REHEARSAL_MARK
+                    ):
+                        index.add_page_break(lines[i + 1][-1])
+                    elif index.has(lines[i - 1][-1], MEASURE_BARLINE) or index.has(
+                        lines[i][0], MEASURE_REHEARSAL_MARK
+                    ):
+                        index.add_page_break(lines[i][-1])
                     else:
                         LOGGER.info(
                             "[add_page_breaks] Reached default case for adding page breaks"
                         )
                         # TODO: Define default case somewhere?
-                        _add_page_break_to_measure(measure)
+                        index.add_page_break(measure)
 
-    return staff
+    return index
+
+
+def add_optimal_page_breaks(index: MeasureIndex, num_lines_per_page: int) -> MeasureIndex:
+    """
+    Add page breaks at the lowest cost spots over the whole staff, instead of greedily (see optimal_layout.py)
+    """
+    for i in plan_page_breaks(index, index.lines(), num_lines_per_page):
+        index.add_page_break(i)
+    return index
 
 
-def add_page_breaks(staff: ET.Element) -> ET.Element:
+def add_page_breaks(index: MeasureIndex) -> MeasureIndex:
     """
     Add page breaks to staff to improve vertical readability.
     - Aim for 7–9 lines per page: 7–8 for first page, 8–9 for others.
     - Favor breaks before multimeasure rests or rehearsal marks.
     """
 
-    def is_line_break(measure):
-        return (
-            measure.find("LayoutBreak") is not None
-            and measure.attrib.get("_mm") is None
-        )
-
-    def has_rehearsal_mark(measure):
-        voice = measure.find("voice")
-        return (
-            voice is not None
-            and voice.find("RehearsalMark") is not None
-            and measure.attrib.get("_mm") is not None
-        )
-
-    def choose_best_break(
-        first_elem, second_elem, first_index, second_index, lines_on_page
-    ):
+    def is_line_break(i):
+        return index.has_line_break(i) and not index.in_mm_rest(i)
+
+    def has_rehearsal_mark(i):
+        return index.has(i, REHEARSAL_MARK) and index.in_mm_rest(i)
+
+    def choose_best_break(first, second, lines_on_page):
         LOGGER.debug(f"Page had {lines_on_page} lines before break.")
-        next_first = staff[first_index + 1] if first_index + 1 < len(staff) else None
-        next_second = staff[second_index + 1] if second_index + 1 < len(staff) else None
+        next_first = first + 1 if first + 1 < len(index) else None
+        next_second = second + 1 if second + 1 < len(index) else None
 
         # Prefer break before a rehearsal mark
         if next_second is not None and has_rehearsal_mark(next_second):
-            _add_page_break_to_measure(second_elem)
+            index.add_page_break(second)
             LOGGER.debug("1")
             return 0
         elif next_first is not None and has_rehearsal_mark(next_first):
-            _add_page_break_to_measure(second_elem)
+            index.add_page_break(second)
             LOGGER.debug("2")
             return 0
         # Prefer multimeasure rest (BarLine is a proxy for that)
-        elif first_elem.find("BarLine") is not None:
-            _add_page_break_to_measure(first_elem)
+        elif index.has(first, MEASURE_BARLINE):
+            index.add_page_break(first)
             LOGGER.debug("3")
             return 1
-        elif second_elem.find("BarLine") is not None:
-            _add_page_break_to_measure(second_elem)
+        elif index.has(second, MEASURE_BARLINE):
+            index.add_page_break(second)
             LOGGER.debug("4")
             return 0
         else:
-            _add_page_break_to_measure(first_elem)
+            index.add_page_break(first)
             LOGGER.debug("3")
             return 1
 
-        LOGGER.debug("added page break")
-
     num_line_breaks_per_page = 0
     first_page = True
-    first_elem, second_elem = None, None
-    first_index, second_index = -1, -1
-
-    for i, elem in enumerate(staff):
-        if elem.tag != "Measure":
-            LOGGER.debug("non-measure tag")
-            continue
+    first = None
 
+    for i in range(len(index)):
         cutoff = 7 if first_page else 8
 
-        if is_line_break(elem):
+        if is_line_break(i):
             num_line_breaks_per_page += 1
 
         if num_line_breaks_per_page == cutoff:
-            if first_elem is None:
-                first_elem, first_index = elem, i
+            if first is None:
+                first = i
                 num_line_breaks_per_page -= 1  # Keep counting for second option
                 continue
             else:
-                second_elem, second_index = elem, i
-                res = choose_best_break(
-                    first_elem,
-                    second_elem,
-                    first_index,
-                    second_index,
-                    num_line_breaks_per_page + 1,
-                )
+                res = choose_best_break(first, i, num_line_breaks_per_page + 1)
 
                 # Reset state
                 num_line_breaks_per_page = res
                 first_page = False
-                first_elem = second_elem = None
-                first_index = second_index = -1
-    return staff
+                first = None
+    return index
 
 
-def final_pass_through(staff: ET.Element) -> ET.Element:
+def final_pass_through(index: MeasureIndex) -> MeasureIndex:
     """
     Adjusts poorly balanced lines. If a line has only 2 measures and the previous has 4+:
     - If prev has 4: remove the break before it.
     - If prev has >4: remove the break and move it to the midpoint.
     """
-    lines = []
-    current_line = []
-
-    for elem in staff:
-        if elem.tag != "Measure":
-            continue
-        current_line.append(elem)
-        if any(child.tag == "LayoutBreak" for child in elem):
-            lines.append(current_line)
-            current_line = []
-    if current_line:
-        lines.append(current_line)
+    lines = index.lines()
+    if not lines[-1]:
+        lines.pop()
 
     for idx in range(1, len(lines)):
         this_line = lines[idx]
         prev_line = lines[idx - 1]
         if len(this_line) <= 2:
             if len(prev_line) == 4:
-                for elem in reversed(prev_line):
-                    lb = next(
-                        (child for child in elem if child.tag == "LayoutBreak"), None
-                    )
-                    if lb is not None:
-                        elem.remove(lb)
+                for i in reversed(prev_line):
+                    if index.has_line_break(i):
+                        index.remove_line_break(i)
                         break
             elif len(prev_line) > 4:
-                for elem in reversed(prev_line):
-                    lb = next(
-                        (child for child in elem if child.tag == "LayoutBreak"), None
-                    )
-                    if lb is not None:
-                        elem.remove(lb)
+                for i in reversed(prev_line):
+                    if index.has_line_break(i):
+                        index.remove_line_break(i)
                         break
                 split_index = len(prev_line) // 2
-                _add_line_break_to_measure_opt(prev_line[split_index])
+                index.add_line_break(prev_line[split_index])
+    return index
+
+
+def add_layout_breaks_multipass(
+    staff: ET.Element,
+    measures_per_line: int,
+    num_lines_per_page: int,
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+) -> ET.Element:
+    """
+    Reference layout: runs each layout break pass over the staff one after another.
+    `layout.add_layout_breaks()` does the same thing in a single pass, this is kept around so the output
+    of the two can be compared.
+    """
+    with stage("layout/index"):
+        index = MeasureIndex(staff)
+    with stage("layout/rehearsal_marks"):
+        add_rehearsal_mark_line_breaks(index)
+    with stage("layout/double_bars"):
+        add_double_bar_line_breaks(index)
+    if line_planner == LinePlanner.OPTIMAL:
+        with stage("layout/regular"):
+            add_optimal_line_breaks(index, measures_per_line)
+    else:
+        with stage("layout/regular"):
+            add_regular_line_breaks(index, measures_per_line)
+        with stage("layout/final_pass"):
+            final_pass_through(index)
+    with stage("layout/page_breaks"):
+        if page_planner == PagePlanner.OPTIMAL:
+            add_optimal_page_breaks(index, num_lines_per_page)
+        else:
+            new_add_page_breaks(index, num_lines_per_page)
     return staff
 
 
+def _get_style_paths(style: Style):
+    """(score style path, part style path) for the selected style"""
+    if style == Style.BROADWAY:
+        return utils.BROADWAY_SCORE_STYLE_PATH, utils.BROADWAY_PART_STYLE_PATH
+    elif style == Style.JAZZ:
+        return utils.JAZZ_SCORE_STYLE_PATH, utils.JAZZ_PART_STYLE_PATH
+    else:
+        raise ValueError(f"Unsupported style: {style}")
+
+
+# Rendered style files are cached per process, keyed by (style, score or part, style params)
+# only a handful of combinations come up in practice, so this just has to be big enough to hold them
+STYLE_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def _render_style_cached(
+    style: Style, is_excerpt: bool, style_params: tuple[tuple[str, str], ...]
+) -> bytes:
+    score_style_path, part_style_path = _get_style_paths(style)
+    source_style = part_style_path if is_excerpt else score_style_path
+
+    with open(source_style, "r", encoding="utf-8") as f:
+        style_text = f.read()
+
+    return set_style_params(style_text, **dict(style_params)).encode("utf-8")
+
+
+def clear_style_cache() -> None:
+    _render_style_cached.cache_clear()
+
+
+def warm_style_cache(styles: Iterable[Style] = Style, max_staves: int = 15) -> None:
+    """Render the style files a job would need up front (eg. when a worker starts), see `render_style_bytes()`"""
+    for style in styles:
+        render_style_bytes(style, is_excerpt=True)
+        for num_staves in range(1, max_staves + 1):
+            render_style_bytes(style, is_excerpt=False, score_info={"num_staves": num_staves})
+
+
 # TODO[SC-43]: Modify it so that the score style is selected based on the # of instruments
 # UPDATE TO ABOVE: Instead of hardcoding values, load in the styles file, and using the # of instruments
 #   Determine a staff spacing value wrt the page size (letter), orientation (vertical or horizontal), # of instruments, and
+def render_style_bytes(style: Style, is_excerpt: bool, score_info=None) -> bytes:
+    """
+    Load the jazz or broadway style file (score or part version), and fill in its style params.
+    Returns the contents of the .mss file (from the style cache if it has been rendered before)
+    """
+    if is_excerpt:
+        #For now, assuming all parts contain 1 instrument
+        style_params = predict_style_params({
+            "num_staves": 1,
+        })
+    else:
+        style_params = predict_style_params(score_info)
+
+    return _render_style_cached(Style(style), is_excerpt, tuple(sorted(style_params.items())))
+
+
+def render_style(style: Style, is_excerpt: bool, score_info=None) -> str:
+    """Same as `render_style_bytes()`, as text"""
+    return render_style_bytes(style, is_excerpt, score_info).decode("utf-8")
+
+
 def add_styles_to_score_and_parts(style: Style, work_dir: str, score_info=None) -> None:
     """
     Depending on what style enum is selected, load either the jazz or broadway style file.
@@ -450,15 +467,7 @@ def add_styles_to_score_and_parts(style: Style, work_dir: str, score_info=None)
     This includes both the main score and individual part style files.
     """
 
-    # Determine style files
-    if style == Style.BROADWAY:
-        score_style_path = BROADWAY_SCORE_STYLE_PATH
-        part_style_path = BROADWAY_PART_STYLE_PATH
-    elif style == Style.JAZZ:
-        score_style_path = JAZZ_SCORE_STYLE_PATH
-        part_style_path = JAZZ_PART_STYLE_PATH
-    else:
-        raise ValueError(f"Unsupported style: {style}")
+    _get_style_paths(style)  # fail early on an unsupported style
 
     # Walk through files in temp directory
     for root, _, files in os.walk(work_dir):
@@ -471,26 +480,28 @@ def add_styles_to_score_and_parts(style: Style, work_dir: str, score_info=None)
             rel_path = os.path.relpath(full_path, work_dir)
             is_excerpt = "Excerpts" in rel_path
 
-            if is_excerpt:
-                #For now, assuming all parts contain 1 instrument
-                source_style = part_style_path
-                style_params = predict_style_params({
-                    "num_staves": 1,
-                })
-            else:
-                source_style = score_style_path
-                style_params = predict_style_params(score_info)
-            
-            with open(source_style, "r") as f:
-                style_text = f.read()
-                style_text = set_style_params(
-                    style_text, 
-                    **style_params
-                )  
-
-                with open(full_path, "w") as out_f:
-                    out_f.write(style_text)
+            with open(full_path, "w") as out_f:
+                out_f.write(render_style(style, is_excerpt, score_info))
 
             LOGGER.info(
                 f"Replaced {'part' if is_excerpt else 'score'} style: {full_path}"
             )
+
+
+def add_styles_to_mscz_members(
+    style: Style, members: dict[str, bytes], score_info=None
+) -> dict[str, bytes]:
+    """
+    Same as `add_styles_to_score_and_parts()`, but for .mscz members held in memory (see `file_processing.rewrite_mscz()`)
+    Returns the new contents of every .mss member
+    """
+    _get_style_paths(style)
+
+    res = {}
+    for name in members:
+        if not name.lower().endswith(".mss"):
+            continue
+        is_excerpt = "Excerpts" in name
+        res[name] = render_style_bytes(style, is_excerpt, score_info)
+        LOGGER.info(f"Replaced {'part' if is_excerpt else 'score'} style: {name}")
+    return res
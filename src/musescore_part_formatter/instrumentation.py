@@ -0,0 +1,189 @@
+"""
+Per stage timings and counters for the formatter.
+
+Nothing is recorded unless a collector is active (it's kept in a context var), so this costs next to nothing normally:
+
+    with collect() as profile:
+        format_mscz("in.mscz", "out.mscz", params)
+    print(profile.to_dict())
+
+Pass `on_stage` to `collect()` to get each stage's timings as it finishes (eg. to ship them off to a metrics service).
+
+Stages (see `STAGES`) time wall time and the CPU time of the current thread, counters (see `COUNTERS`) just add up.
+Nested stages are each counted in full, so stage totals can add up to more than the total.
+Work done in `parallel.make_executor()` workers doesn't see the context var, so it's collected there and merged back
+(see `run_collected()`).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+import time
+
+STAGES = (
+    "unzip",
+    "parse",
+    "style",
+    "layout/index",  # building the MeasureIndex
+    "layout/plan",  # fused engine
+    "layout/apply",
+    "layout/rehearsal_marks",  # reference (multipass) engine
+    "layout/double_bars",
+    "layout/regular",
+    "layout/final_pass",
+    "layout/page_breaks",
+    "layout/sweep",  # param_sweep.py, scoring candidates
+    "predict",  # format_mscz(..., predict=True), includes the unzip / parse / layout stages it runs
+    "header",
+    "serialize",
+    "rezip",
+)
+
+COUNTERS = (
+    "measures_visited",
+    "line_breaks_added",
+    "line_breaks_removed",
+    "page_breaks_added",  # new page breaks, a line break that becomes one is in line_breaks_to_page_breaks
+    "line_breaks_to_page_breaks",
+    "page_breaks_removed",
+    "sweep_candidates",  # see param_sweep.py
+    "cache_hits",  # see result_cache.py
+    "cache_misses",
+    "member_cache_hits",  # format_mscz(..., incremental=True)
+    "member_cache_misses",
+)
+
+# (stage name, wall seconds, cpu seconds)
+StageCallback = Callable[[str, float, float], None]
+
+
+# plain classes rather than dataclasses: everything imports this, and dataclasses is slow to import
+class StageTiming:
+    __slots__ = ("calls", "wall", "cpu")
+
+    def __init__(self, calls: int = 0, wall: float = 0.0, cpu: float = 0.0):
+        self.calls = calls
+        self.wall = wall
+        self.cpu = cpu
+
+
+class Profile:
+    def __init__(self, on_stage: StageCallback | None = None):
+        self.stages: dict[str, StageTiming] = {}
+        self.counters: dict[str, int] = {}
+        self.wall = 0.0  # for the whole `collect()` block
+        self.cpu = 0.0
+        self.on_stage = on_stage
+
+    def add_stage(self, name: str, wall: float, cpu: float, calls: int = 1) -> None:
+        timing = self.stages.get(name)
+        if timing is None:
+            timing = self.stages[name] = StageTiming()
+        timing.calls += calls
+        timing.wall += wall
+        timing.cpu += cpu
+        if self.on_stage is not None:
+            self.on_stage(name, wall, cpu)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other: dict[str, Any]) -> None:
+        """Add in the stages and counters of another profile's `to_dict()` (the total is left alone)"""
+        for name, timing in other["stages"].items():
+            self.add_stage(name, timing["wall"], timing["cpu"], timing["calls"])
+        for name, n in other["counters"].items():
+            self.count(name, n)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "stages": {
+                name: {"calls": t.calls, "wall": t.wall, "cpu": t.cpu}
+                for name, t in self.stages.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+
+_collector: ContextVar[Profile | None] = ContextVar("musescore_part_formatter_profile", default=None)
+
+
+@contextmanager
+def collect(on_stage: StageCallback | None = None) -> Iterator[Profile]:
+    """Record everything that happens in this context (and this thread) into a new `Profile`"""
+    profile = Profile(on_stage=on_stage)
+    token = _collector.set(profile)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield profile
+    finally:
+        profile.wall = time.perf_counter() - wall
+        profile.cpu = time.thread_time() - cpu
+        _collector.reset(token)
+
+
+def is_collecting() -> bool:
+    return _collector.get() is not None
+
+
+class _Stage:
+    __slots__ = ("name", "profile", "wall", "cpu")
+
+    def __init__(self, name: str, profile: Profile):
+        self.name = name
+        self.profile = profile
+
+    def __enter__(self) -> None:
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def __exit__(self, *exc) -> None:
+        self.profile.add_stage(
+            self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu
+        )
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str) -> _Stage | _NoStage:
+    """Time a block: `with stage("parse"): ...`"""
+    profile = _collector.get()
+    if profile is None:
+        return _NO_STAGE
+    return _Stage(name, profile)
+
+
+def count(name: str, n: int = 1) -> None:
+    profile = _collector.get()
+    if profile is not None:
+        profile.count(name, n)
+
+
+def merge_profile(other: dict[str, Any]) -> None:
+    """`Profile.merge()` into the active collector, if there is one"""
+    profile = _collector.get()
+    if profile is not None:
+        profile.merge(other)
+
+
+def run_collected(fn: Callable[..., Any], *args, **kwargs) -> tuple[Any, dict[str, Any]]:
+    """
+    Run `fn` with its own collector, returning its result and profile (as a dict, so it pickles).
+    For running work on an executor, the caller `merge_profile()`s the result back in
+    """
+    with collect() as profile:
+        res = fn(*args, **kwargs)
+    return res, profile.to_dict()
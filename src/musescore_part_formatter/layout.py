@@ -0,0 +1,219 @@
+"""
+Single pass layout engine
+
+Produces the same line and page breaks as running the layout break passes in `formatting.py` one after another
+(`add_layout_breaks_multipass()`), but only walks the staff once (to build the `MeasureIndex`).
+Planning the breaks only reads the index's flags, and the tree is only touched again for the measures that actually change.
+
+The multi pass functions are kept around as the reference implementation, if you change the
+behaviour of one of them, change it here too (tests/test_layout.py checks that they agree).
+"""
+
+from dataclasses import dataclass, field
+import xml.etree.ElementTree as ET
+
+from .utils import _add_line_break_to_measure_opt, LinePlanner, PagePlanner
+from .instrumentation import stage
+from .optimal_layout import plan_line_breaks, plan_page_breaks
+from .measure_index import (
+    MeasureIndex,
+    REHEARSAL_MARK,
+    BARLINE,
+    LAYOUT_BREAK,
+    MEASURE_REHEARSAL_MARK,
+    MEASURE_BARLINE,
+)
+
+from logging import getLogger
+
+LOGGER = getLogger("PartFormatter")
+
+
+@dataclass
+class LayoutPlan:
+    """Changes to make to a staff, measures are indices into its MeasureIndex"""
+
+    added: set[int] = field(default_factory=set)  # measures that get a new line break
+    removed: list[int] = field(default_factory=list)  # measures that lose a line break
+    pages: list[int] = field(default_factory=list)  # measures whose line break becomes a page break
+    before_measure: list[int] = field(default_factory=list)  # line break goes on the element before this measure (eg. a VBox)
+    lines: list[range] = field(default_factory=list)  # the staff's lines once the line breaks are in (see `_build_lines()`)
+
+
+def plan_layout_breaks(
+    index: MeasureIndex,
+    measures_per_line: int,
+    num_lines_per_page: int,
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+) -> LayoutPlan:
+    """
+    Work out which line/page breaks to add/remove. Doesn't change the index or the tree.
+    """
+    plan = LayoutPlan()
+    added = plan.added
+    num_measures = len(index)
+    # working copy of the layout break flags
+    has_lb = [bool(f & LAYOUT_BREAK) for f in index.flags]
+    in_mm = index.in_mm_rest
+
+    # -- Rehearsal mark + double bar line breaks --
+    for i, flags in enumerate(index.flags):
+        if flags & REHEARSAL_MARK:
+            prev_elem = index.prev_element(i)
+            assert prev_elem is not None
+            if prev_elem.tag != "Measure":
+                plan.before_measure.append(i)
+            else:
+                has_lb[i - 1] = True
+                if in_mm(i - 1):
+                    has_lb[index.mm_start[i - 1]] = True
+        if flags & BARLINE:
+            has_lb[i] = True
+
+    # -- Regular line breaks --
+    if line_planner == LinePlanner.OPTIMAL:
+        for i in plan_line_breaks(index, has_lb, measures_per_line):
+            has_lb[i] = True
+        for i in range(num_measures):
+            if has_lb[i] and not index.has_line_break(i):
+                added.add(i)
+    else:
+        _plan_greedy_line_breaks(index, plan, has_lb, measures_per_line)
+
+    # -- Page breaks --
+    lines = plan.lines = _build_lines(has_lb)
+    if page_planner == PagePlanner.OPTIMAL:
+        plan.pages = plan_page_breaks(index, lines, num_lines_per_page)
+        return plan
+
+    flags = index.flags
+
+    lines_on_this_page = 1
+    for i in range(len(lines) - 3):
+        if lines_on_this_page != num_lines_per_page:
+            lines_on_this_page += 1
+            continue
+
+        lines_on_this_page = 0
+
+        last = lines[i][-1]
+        next_first = lines[i + 1][0]
+        if in_mm(last) or in_mm(next_first):
+            plan.pages.append(last)
+        elif flags[last] & MEASURE_BARLINE or flags[next_first] & MEASURE_REHEARSAL_MARK:
+            plan.pages.append(last)
+        elif (
+            flags[lines[i + 1][-1]] & MEASURE_BARLINE
+            or flags[lines[i + 2][0]] & MEASURE_REHEARSAL_MARK
+        ):
+            plan.pages.append(lines[i + 1][-1])
+        elif (
+            flags[lines[i - 1][-1]] & MEASURE_BARLINE
+            or flags[lines[i][0]] & MEASURE_REHEARSAL_MARK
+        ):
+            plan.pages.append(lines[i][-1])
+        else:
+            LOGGER.info("[add_page_breaks] Reached default case for adding page breaks")
+            plan.pages.append(last)
+
+    return plan
+
+
+def _plan_greedy_line_breaks(
+    index: MeasureIndex, plan: LayoutPlan, has_lb: list[bool], measures_per_line: int
+) -> None:
+    """Regular line breaks every `measures_per_line`, then the final pass through. Updates `has_lb` and `plan`"""
+    added = plan.added
+    num_measures = len(index)
+    in_mm = index.in_mm_rest
+
+    mpl_count = 0
+    for i in range(num_measures):
+        mpl_count += 1
+        if has_lb[i]:
+            mpl_count = 0
+            continue
+        if mpl_count == measures_per_line:
+            mpl_count = 0
+            has_lb[i] = True
+            continue
+        if in_mm(i):
+            mpl_count -= 1
+
+    for i in range(num_measures):
+        if has_lb[i] and not index.has_line_break(i):
+            added.add(i)
+
+    # -- Final pass through (fix up short lines) --
+    lines = _build_lines(has_lb)
+    if not lines[-1]:
+        lines.pop()
+
+    for idx in range(1, len(lines)):
+        this_line = lines[idx]
+        prev_line = lines[idx - 1]
+        if len(this_line) <= 2 and len(prev_line) >= 4:
+            last = prev_line[-1]
+            if last in added:
+                added.discard(last)
+                has_lb[last] = False
+            else:
+                plan.removed.append(last)
+                has_lb[last] = _has_second_layout_break(index.measures[last])
+
+            if len(prev_line) > 4:
+                split = prev_line[len(prev_line) // 2]
+                if not has_lb[split]:
+                    has_lb[split] = True
+                    added.add(split)
+
+
+def apply_layout_plan(index: MeasureIndex, plan: LayoutPlan) -> None:
+    for i in plan.before_measure:
+        _add_line_break_to_measure_opt(index.prev_element(i))
+    for i in plan.removed:
+        index.remove_line_break(i)
+    for i in sorted(plan.added):
+        index.add_line_break(i)
+    for i in plan.pages:
+        index.add_page_break(i)
+
+
+def add_layout_breaks(
+    staff: ET.Element,
+    measures_per_line: int,
+    num_lines_per_page: int,
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+) -> ET.Element:
+    """
+    Add rehearsal mark, double bar, regular line breaks and page breaks to `staff` in one pass.
+    """
+    with stage("layout/index"):
+        index = MeasureIndex(staff)
+    with stage("layout/plan"):
+        plan = plan_layout_breaks(index, measures_per_line, num_lines_per_page, page_planner, line_planner)
+    with stage("layout/apply"):
+        apply_layout_plan(index, plan)
+    return staff
+
+
+def _has_second_layout_break(measure: ET.Element) -> bool:
+    # Only matters for measures that came in with more than one LayoutBreak (eg. line + section)
+    return sum(1 for child in measure if child.tag == "LayoutBreak") > 1
+
+
+def _build_lines(has_lb: list[bool]) -> list[range]:
+    """
+    Split measure indices into lines, the same way `MeasureIndex.lines()` does
+    (ie. if the last measure has a line break, there is an empty line at the end)
+    """
+    lines = []
+    start = 0
+    for i, lb in enumerate(has_lb):
+        if lb:
+            lines.append(range(start, i + 1))
+            start = i + 1
+    lines.append(range(start, len(has_lb)))
+    return lines
@@ -1,86 +1,185 @@
-import shutil
-import argparse
 import sys
+import io
+import os
+from contextlib import nullcontext
+from functools import partial
+from typing import TYPE_CHECKING, Iterator
 
 import xml.etree.ElementTree as ET
 
-from .utils import Style, FormattingParams
+from .utils import Style, FormattingParams, LayoutEngine, LinePlanner, PagePlanner
 from .utils import set_score_properties
-from .formatting import add_styles_to_score_and_parts
-from .formatting import (
-    prep_mm_rests,
-    add_rehearsal_mark_line_breaks,
-    add_double_bar_line_breaks,
-    add_regular_line_breaks,
-    final_pass_through,
-    new_add_page_breaks,
-    cleanup_mm_rests,
-    add_broadway_header,
-    add_part_name,
-)
-from .file_processing import unpack_mscz_to_tempdir
+from .instrumentation import stage, count, collect, is_collecting, run_collected, merge_profile
+from .xml_backend import get_xml_backend
 from .file_inspect import (
     ScoreInfo,
+    TITLE_BOX_PROPERTIES,
     get_all_properties,
     set_all_properties,
+    scan_score_info,
 )
 
 from logging import getLogger
 
+# Only needed for the CLI, for optional features (streaming, minimal_diff, the result cache), or once a score actually
+# gets formatted (zipfile, the layout / formatting passes, the worker pool), so they're imported where they're used to
+# keep `import musescore_part_formatter.main` (and every CLI's startup) quick
+if TYPE_CHECKING:
+    import argparse
+    from .mscx_stream import MscxStream
+    from .minimal_diff import SourceTracker
+    from .result_cache import ResultCache
 
 LOGGER = getLogger("PartFormatter")
 
+# num_lines_per_page candidates when predicting (see `format_mscz()`), ties go to the first one
+PREDICT_LINES_PER_PAGE = (8, 7)
+
+# layout options the CLIs fill in when they're not passed (and not predicted, see `formatting_params_from_args()`)
+CLI_LAYOUT_DEFAULTS = {
+    "num_measures_per_line_score": 4,
+    "num_measures_per_line_part": 6,
+    "num_lines_per_page": 7,
+}
+
+
+def _format_score_tree(
+    tree: ET.ElementTree, params: FormattingParams, is_part: bool = False
+) -> None:
+    """Add the score properties, layout breaks and header text to a parsed mscx file"""
+    root = tree.getroot()
+    score = root.find("Score")
+    if score is None:
+        raise ValueError("No <Score> tag found in the XML.")
+
+    _format_score(score, params, is_part)
+
+
+def _format_score(score: ET.Element, params: FormattingParams, is_part: bool = False) -> None:
+    """
+    Formats a <Score>, only uses its metaTags and first staff
+    (so it also works on `MscxStream.partial_score()`)
+    """
+    score_properties = {
+        "albumTitle": params["show_title"],
+        "trackNum": params["show_number"],
+        "versionNum": params["version_num"],
+    }
+
+    set_score_properties(score, score_properties)
+
+    staves = score.findall("Staff")
+
+    staff = staves[0]  # noqa  -- only add layout breaks to the first staff
+    if is_part:
+        measures_per_line = params["num_measures_per_line_part"]
+    else:
+        measures_per_line = params["num_measures_per_line_score"]
+
+    from .formatting import add_layout_breaks_multipass, add_broadway_header, add_part_name
+    from .layout import add_layout_breaks
+
+    layout_engine = LayoutEngine(params.get("layout_engine", LayoutEngine.FUSED))
+    page_planner = PagePlanner(params.get("page_planner", PagePlanner.GREEDY))
+    line_planner = LinePlanner(params.get("line_planner", LinePlanner.GREEDY))
+    if layout_engine == LayoutEngine.REFERENCE:
+        add_layout_breaks_multipass(
+            staff, measures_per_line, params["num_lines_per_page"], page_planner, line_planner
+        )
+    else:
+        add_layout_breaks(staff, measures_per_line, params["num_lines_per_page"], page_planner, line_planner)
+    with stage("header"):
+        if params["selected_style"] == Style.BROADWAY:
+            add_broadway_header(staff, params["show_number"], params["show_title"])
+        add_part_name(staff)
+
+
+def _serialize_tree(tree: ET.ElementTree) -> bytes:
+    return get_xml_backend().tostring(tree)
+
+
+def _write_tree(tree: ET.ElementTree, tracker: "SourceTracker | None") -> bytes:
+    """Serialize a tree, or just splice in its changes if it's being tracked"""
+    with stage("serialize"):
+        if tracker is not None:
+            return tracker.tostring()
+        return _serialize_tree(tree)
+
+
+def _parse(data: bytes, minimal_diff: bool = False) -> tuple[ET.ElementTree, "SourceTracker | None"]:
+    with stage("parse"):
+        tree = get_xml_backend().fromstring(data)
+        tracker = _track(tree, data) if minimal_diff else None
+    return tree, tracker
+
+
+def _track(tree: ET.ElementTree, data: bytes) -> "SourceTracker":
+    from .minimal_diff import SourceTracker
+
+    return SourceTracker(tree.getroot(), data)
+
+
+def _open_stream(fp: io.BufferedIOBase) -> "MscxStream":
+    from .mscx_stream import MscxStream
+
+    with stage("parse"):
+        stream = MscxStream(fp)
+        stream.partial_score()
+    return stream
+
+
+def _write_stream(stream: "MscxStream", dst: io.BufferedIOBase) -> None:
+    with stage("serialize"):
+        stream.write(dst)
+
 
 def format_mscx(
-    mscx_path: str, params: FormattingParams, is_part: bool = False
+    mscx_path: str,
+    params: FormattingParams,
+    is_part: bool = False,
+    streaming: bool = False,
+    minimal_diff: bool = False,
 ) -> bool:
     """
     Takes in an (uncompressed) musescore file, processes it, and outputs it in place
     This is usually only used internally by `format_mscz()`, but if the user wants to format a mscx file, why not let them?
 
+    With `streaming`, only the parts of the file that get formatted are parsed and everything else is copied over as is
+    (see `mscx_stream.py`), which keeps memory down for big scores.
+
+    With `minimal_diff`, only the elements that changed are written, the rest of the file is kept byte for byte instead
+    of being re-indented (see `minimal_diff.py`). Streaming always does this.
+
     Returns:
     - True if processing completed successfully
     - False if an error occurred
 
     """
     try:
-        parser = ET.XMLParser()
-        tree = ET.parse(mscx_path, parser)
-        root = tree.getroot()
-        score = root.find("Score")
-        if score is None:
-            raise ValueError("No <Score> tag found in the XML.")
-
-        score_properties = {
-            "albumTitle": params["show_title"],
-            "trackNum": params["show_number"],
-            "versionNum": params["version_num"],
-        }
-
-        set_score_properties(score, score_properties)
-
-        staves = score.findall("Staff")
-
-        staff = staves[0]  # noqa  -- only add layout breaks to the first staff
-        prep_mm_rests(
-            staff,
-        )
-        add_rehearsal_mark_line_breaks(staff)
-        add_double_bar_line_breaks(staff)
-        if is_part:
-            add_regular_line_breaks(staff, params["num_measures_per_line_part"])
+        if streaming:
+            with open(mscx_path, "rb") as src:
+                stream = _open_stream(src)
+                _format_score(stream.partial_score(), params, is_part)
+                # can't write over the file while it's still being read
+                import tempfile
+                import shutil
+
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(mscx_path)))
+                try:
+                    with os.fdopen(fd, "wb") as dst:
+                        _write_stream(stream, dst)
+                    shutil.copymode(mscx_path, tmp_path)  # mkstemp makes it 0o600, keep the file's own mode
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+            os.replace(tmp_path, mscx_path)
         else:
-            add_regular_line_breaks(staff, params["num_measures_per_line_score"])
-        final_pass_through(staff)
-        new_add_page_breaks(staff, params["num_lines_per_page"])
-        cleanup_mm_rests(staff)
-        if params["selected_style"] == Style.BROADWAY:
-            add_broadway_header(staff, params["show_number"], params["show_title"])
-        add_part_name(staff)
+            with open(mscx_path, "rb") as f:
+                data = f.read()
+            data = format_mscx_bytes(data, params, is_part, minimal_diff=minimal_diff)
 
-        with open(mscx_path, "wb") as f:
-            ET.indent(tree, space="  ", level=0)
-            tree.write(f, encoding="utf-8", xml_declaration=True)
+            with open(mscx_path, "wb") as f:
+                f.write(data)
         LOGGER.info(f"Output written to {mscx_path}")
         return True
 
@@ -89,8 +188,38 @@ def format_mscx(
         return False
 
 
+def format_mscx_bytes(
+    mscx_data: bytes,
+    params: FormattingParams,
+    is_part: bool = False,
+    streaming: bool = False,
+    minimal_diff: bool = False,
+) -> bytes:
+    """
+    Same as `format_mscx()`, but takes in the contents of a mscx file and returns the formatted contents
+    """
+    if streaming:
+        stream = _open_stream(io.BytesIO(mscx_data))
+        _format_score(stream.partial_score(), params, is_part)
+        out = io.BytesIO()
+        _write_stream(stream, out)
+        return out.getvalue()
+
+    tree, tracker = _parse(mscx_data, minimal_diff)
+    _format_score_tree(tree, params, is_part)
+    return _write_tree(tree, tracker)
+
+
 def format_mscz(
-    input_path: str, output_path: str, params: dict[str, str], predict: bool = False
+    input_path: str,
+    output_path: str,
+    params: dict[str, str],
+    predict: bool = False,
+    max_workers: int | None = None,
+    streaming: bool = False,
+    minimal_diff: bool = False,
+    use_cache: bool = True,
+    incremental: bool = False,
 ) -> bool:
     """
     Takes in a (compressed) musescore file, processes it, and outputs it to the path specified by `output_path`
@@ -101,8 +230,72 @@ def format_mscz(
 
     If predict is true, if a value is not passed in, the predicted value is used. if values are passed in they are used
     if predict is false, if a value is not passed in, a default vlue is used
+    (num_measures_per_line_part, and num_lines_per_page if it isn't passed in either, are picked by trying candidates on
+    the parts, see `estimating_formatting_params.predict_layout_params()`)
+
+    If max_workers is more than 1, the parts (Excerpts/) are formatted in parallel on that many workers
+    (see `parallel.make_executor()`), otherwise everything is formatted one after another.
+
+    If streaming is true, the mscx files are never fully parsed and the archive is read and written one member at a time
+    (see `_format_mscz_streaming()`), if minimal_diff is true only the elements that changed are written
+    (see `format_mscx()`)
+
+    If a result cache is set up (see `result_cache.py`), a score that has already been formatted with the same params
+    is copied straight out of it. Pass use_cache=False to skip the cache for this call.
+    With incremental (and a result cache), each formatted mscx is cached too, so if the score changed only the mscx files
+    that are different get formatted again. Without a result cache incremental does nothing, and a warning is logged.
     """
+    prepped_params = prep_formatting_params(params, predict)
+
+    try:
+        predicting = predict and "num_measures_per_line_part" not in params
+
+        cache = _get_result_cache() if use_cache else None
+        if incremental and cache is None:
+            LOGGER.warning("incremental needs a result cache (see result_cache.py), formatting every mscx")
+        if cache is not None:
+            # before formatting, output_path can be input_path
+            from .result_cache import cache_key
+
+            # the prediction only depends on the input and the params, so it's keyed on those (before predicting,
+            # which has to plan every part) instead of on what it predicts
+            options = {"streaming": streaming, "minimal_diff": minimal_diff}
+            if predicting:
+                options["predict"] = True
+            key = cache_key(input_path, prepped_params, **options)
+            if cache.get(key, output_path):
+                count("cache_hits")
+                LOGGER.info(f"Output for {input_path} copied from the result cache to {output_path}")
+                return True
+            count("cache_misses")
+
+        if predicting:
+            prepped_params = predict_formatting_params(input_path, params, prepped_params)
+
+        success = _format_mscz(
+            input_path,
+            output_path,
+            prepped_params,
+            max_workers,
+            streaming,
+            minimal_diff,
+            member_cache=cache if incremental else None,
+        )
+        if success and cache is not None:
+            cache.put(key, output_path)
+        return success
 
+    except Exception:
+        LOGGER.exception("Failed to process %s", input_path)
+        return False
+
+
+def prep_formatting_params(
+    params: dict[str, str], predict: bool = False
+) -> FormattingParams:
+    """
+    Fill in defaults for any formatting params that weren't passed in (see `format_mscz()`)
+    """
     # unpack params
     style_name = (
         params["selected_style"] if params.get("selected_style") else "broadway"
@@ -123,6 +316,9 @@ def format_mscz(
             "num_lines_per_page": params.get(
                 "num_lines_per_page", 8
             ),  # predict? this could pob be fixed tho
+            "layout_engine": params.get("layout_engine", LayoutEngine.FUSED),
+            "line_planner": params.get("line_planner", LinePlanner.GREEDY),
+            "page_planner": params.get("page_planner", PagePlanner.GREEDY),
         }
     else:
         prepped_params: FormattingParams = {
@@ -133,62 +329,325 @@ def format_mscz(
             "num_measures_per_line_part": params.get("num_measures_per_line_part", 6),
             "num_measures_per_line_score": params.get("num_measures_per_line_score", 4),
             "num_lines_per_page": params.get("num_lines_per_page", 8),
+            "layout_engine": params.get("layout_engine", LayoutEngine.FUSED),
+            "line_planner": params.get("line_planner", LinePlanner.GREEDY),
+            "page_planner": params.get("page_planner", PagePlanner.GREEDY),
         }
 
     # do prediction logic
 
-    shutil.copyfile(input_path, output_path)
+    return prepped_params
 
-    score_info = get_score_attributes(input_path)
 
-    try:
-        with unpack_mscz_to_tempdir(output_path) as (work_dir, mscx_files):
-            add_styles_to_score_and_parts(
+def _format_mscz(
+    input_path: str,
+    output_path: str,
+    prepped_params: FormattingParams,
+    max_workers: int | None = None,
+    streaming: bool = False,
+    minimal_diff: bool = False,
+    member_cache: "ResultCache | None" = None,
+) -> bool:
+    """
+    Does the actual work for `format_mscz()`. Raises if anything goes wrong,
+    returns False if there was nothing to format.
+    mscx files that are in `member_cache` aren't formatted again (and the ones that are get added to it)
+    """
+    if streaming:
+        return _format_mscz_streaming(input_path, output_path, prepped_params, max_workers, minimal_diff, member_cache)
+
+    from .formatting import add_styles_to_mscz_members
+    from .file_processing import rewrite_mscz
+    from .parallel import make_executor
+
+    found_mscx = False
+
+    def format_members(members: dict[str, bytes]) -> dict[str, bytes]:
+        nonlocal found_mscx
+        mscx_names = [name for name in members if name.endswith(".mscx")]
+        found_mscx = bool(mscx_names)
+
+        cached = {}
+        if member_cache is not None:
+            from .result_cache import member_cache_key
+
+            keys = {
+                name: member_cache_key(
+                    members[name],
+                    prepped_params,
+                    is_part="Excerpts" in name,
+                    streaming=streaming,
+                    minimal_diff=minimal_diff,
+                )
+                for name in mscx_names
+            }
+            for name in mscx_names:
+                data = member_cache.get_member(keys[name])
+                if data is not None:
+                    cached[name] = data
+            count("member_cache_hits", len(cached))
+            count("member_cache_misses", len(mscx_names) - len(cached))
+
+        # The main score is only parsed once: the same tree is inspected (for the style params) and then formatted
+        main_name = _find_main_score(mscx_names)
+        main_tree = None
+        main_tracker = None
+        main_stream = None
+        score_info = {}
+        if main_name in cached:
+            # still needs inspecting for the style params, which only takes its metaTags and first staff
+            score_info = _open_stream(io.BytesIO(members[main_name])).score_info()
+        elif main_name is not None and streaming:
+            main_stream = _open_stream(io.BytesIO(members[main_name]))
+            score_info = main_stream.score_info()
+        elif main_name is not None:
+            main_tree, main_tracker = _parse(members[main_name], minimal_diff)
+            score_info = _get_score_info(main_tree)
+
+        with stage("style"):
+            res = add_styles_to_mscz_members(
                 prepped_params["selected_style"],  # type-ignore
-                work_dir,
+                members,
                 score_info=score_info,
             )
+        res.update(cached)
 
-            if not mscx_files:
-                LOGGER.warning("No .mscx files found in the provided mscz file.")
-                return False
+        other_names = [name for name in mscx_names if name != main_name and name not in cached]
+        executor = None
+        if max_workers is not None and max_workers > 1 and other_names:
+            executor = make_executor(min(max_workers, len(other_names)))
 
-            for mscx_path in mscx_files:
-                LOGGER.info(f"Processing {mscx_path}...")
-                if "Excerpts" in mscx_path:
-                    format_mscx(mscx_path, prepped_params, is_part=True)
+        # workers can't see this process's collector, so they collect their own and it gets merged in
+        collecting = executor is not None and is_collecting()
+        format_part = partial(run_collected, format_mscx_bytes) if collecting else format_mscx_bytes
+        try:
+            if executor is not None:
+                # start on the parts while the main score is formatted here
+                futures = {
+                    name: executor.submit(
+                        format_part,
+                        members[name],
+                        prepped_params,
+                        is_part="Excerpts" in name,
+                        streaming=streaming,
+                        minimal_diff=minimal_diff,
+                    )
+                    for name in other_names
+                }
+
+            if main_stream is not None:
+                LOGGER.info(f"Processing {main_name}...")
+                _format_score(main_stream.partial_score(), prepped_params, is_part="Excerpts" in main_name)
+                out = io.BytesIO()
+                _write_stream(main_stream, out)
+                res[main_name] = out.getvalue()
+            elif main_tree is not None:
+                LOGGER.info(f"Processing {main_name}...")
+                _format_score_tree(main_tree, prepped_params, is_part="Excerpts" in main_name)
+                res[main_name] = _write_tree(main_tree, main_tracker)
+
+            for name in other_names:
+                LOGGER.info(f"Processing {name}...")
+                if collecting:
+                    res[name], profile = futures[name].result()
+                    merge_profile(profile)
+                elif executor is not None:
+                    res[name] = futures[name].result()
                 else:
-                    format_mscx(mscx_path, prepped_params, is_part=False)
+                    res[name] = format_mscx_bytes(
+                        members[name],
+                        prepped_params,
+                        is_part="Excerpts" in name,
+                        streaming=streaming,
+                        minimal_diff=minimal_diff,
+                    )
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        if member_cache is not None:
+            member_cache.put_members({keys[name]: res[name] for name in mscx_names if name not in cached})
+        return res
+
+    rewrite_mscz(input_path, output_path, format_members)
+
+    if not found_mscx:
+        LOGGER.warning("No .mscx files found in the provided mscz file.")
+        return False
 
-    except Exception:
-        LOGGER.exception("Failed to process %s", input_path)
+    return True
+
+
+def _format_mscz_streaming(
+    input_path: str,
+    output_path: str,
+    prepped_params: FormattingParams,
+    max_workers: int | None = None,
+    minimal_diff: bool = False,
+    member_cache: "ResultCache | None" = None,
+) -> bool:
+    """
+    `_format_mscz(..., streaming=True)`: the archive is read, formatted and written one member at a time, with the output
+    going to a temp file on disk (see `file_processing.stream_rewrite_mscz()`), so memory doesn't grow with the number of
+    parts. With max_workers, up to that many mscx files are formatted (and held in memory) at once
+    """
+    from collections import deque
+    from concurrent.futures import Future
+    import zipfile
+
+    from .formatting import render_style_bytes
+    from .file_processing import stream_rewrite_mscz
+    from .parallel import make_executor
+
+    # the styles need the main score's info, and the .mss members can come before it in the archive
+    with zipfile.ZipFile(input_path, "r") as z:
+        mscx_names = [name for name in z.namelist() if name.endswith(".mscx")]
+        main_name = _find_main_score(mscx_names)
+        score_info = {}
+        if main_name is not None:
+            with stage("unzip"):
+                main_data = z.read(main_name)
+            score_info = _open_stream(io.BytesIO(main_data)).score_info()
+            del main_data
+
+    executor = None
+    if max_workers is not None and max_workers > 1 and len(mscx_names) > 1:
+        executor = make_executor(min(max_workers, len(mscx_names)))
+    collecting = executor is not None and is_collecting()
+    format_job = partial(run_collected, format_mscx_bytes) if collecting else format_mscx_bytes
+    if member_cache is not None:
+        from .result_cache import member_cache_key
+
+    def start(name: str, data: bytes) -> tuple[str | None, "bytes | Future"]:
+        """(member cache key, formatted contents or the future of them)"""
+        if name.lower().endswith(".mss"):
+            with stage("style"):
+                res = render_style_bytes(prepped_params["selected_style"], "Excerpts" in name, score_info)
+            LOGGER.info(f"Replaced {'part' if 'Excerpts' in name else 'score'} style: {name}")
+            return None, res
+
+        key = None
+        options = {"is_part": "Excerpts" in name, "streaming": True, "minimal_diff": minimal_diff}
+        if member_cache is not None:
+            key = member_cache_key(data, prepped_params, **options)
+            cached = member_cache.get_member(key)
+            count("member_cache_hits" if cached is not None else "member_cache_misses")
+            if cached is not None:
+                return None, cached
+
+        LOGGER.info(f"Processing {name}...")
+        if executor is not None:
+            return key, executor.submit(format_job, data, prepped_params, **options)
+        return key, format_mscx_bytes(data, prepped_params, **options)
+
+    def finish(name: str, key: str | None, res: "bytes | Future") -> tuple[str, bytes]:
+        if isinstance(res, Future):
+            res = res.result()
+            if collecting:
+                res, profile = res
+                merge_profile(profile)
+        if key is not None:
+            member_cache.put_members({key: res})
+        return name, res
+
+    def format_members(members: Iterator[tuple[str, bytes]]) -> Iterator[tuple[str, bytes]]:
+        # keep up to max_workers members in flight, and hand them back in archive order
+        window = deque()
+        for name, data in members:
+            window.append((name, *start(name, data)))
+            while window and (len(window) > (max_workers or 1) or not isinstance(window[0][2], Future)):
+                yield finish(*window.popleft())
+        while window:
+            yield finish(*window.popleft())
+
+    try:
+        stream_rewrite_mscz(input_path, output_path, format_members)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if not mscx_names:
+        LOGGER.warning("No .mscx files found in the provided mscz file.")
         return False
 
     return True
 
 
-def get_score_attributes(input_path: str) -> ScoreInfo:
+def predict_formatting_params(
+    input_path: str, params: dict[str, str], prepped_params: FormattingParams
+) -> FormattingParams:
+    """
+    `prepped_params` (from `prep_formatting_params(params)`), with the layout params that `params` doesn't set picked by
+    trying candidates on the score's parts (see `format_mscz()`)
+    """
+    if "num_measures_per_line_part" in params:
+        return prepped_params
+    return {**prepped_params, **_predict_layout_params(input_path, params, prepped_params)}
+
+
+def _predict_layout_params(
+    input_path: str, params: dict[str, str], prepped_params: FormattingParams
+) -> dict[str, int]:
+    from .estimating_formatting_params import predict_layout_params
+
+    lines_per_page = (prepped_params["num_lines_per_page"],)
+    if "num_lines_per_page" not in params:
+        lines_per_page = PREDICT_LINES_PER_PAGE
+    with stage("predict"):
+        return predict_layout_params(
+            input_path,
+            lines_per_page,
+            PagePlanner(prepped_params.get("page_planner", PagePlanner.GREEDY)),
+            LinePlanner(prepped_params.get("line_planner", LinePlanner.GREEDY)),
+        )
+
+
+def _get_result_cache() -> "ResultCache | None":
+    from .result_cache import get_result_cache
+
+    return get_result_cache()
+
+
+def _find_main_score(mscx_names: list[str]) -> str | None:
+    """The main (conductor) score is the first mscx that isn't in Excerpts/"""
+    for name in mscx_names:
+        if "Excerpts" not in name:
+            return name
+    return None
+
+
+def _get_score_info(tree: ET.ElementTree) -> ScoreInfo:
+    score = tree.getroot().find("Score")
+    if score is None:
+        raise ValueError("No <Score> tag found in the XML.")
+    return get_all_properties(score)
+
+
+def get_score_attributes(input_path: str, metadata_only: bool = True) -> ScoreInfo:
     """
-    Takes in a mscz file, and parses the score
+    Takes in a mscz file, and parses the score.
+    With `metadata_only` (the default), only the main score is read, straight out of the archive, and only up to the end
+    of its first staff (see `file_inspect.scan_score_info()`). Otherwise the whole archive is extracted and parsed
     """
+    if metadata_only:
+        import zipfile
+
+        with zipfile.ZipFile(input_path, "r") as z:
+            main_name = _find_main_score([name for name in z.namelist() if name.endswith(".mscx")])
+            if main_name is None:
+                raise ValueError(f"No main score found in {input_path}")
+            with stage("parse"), z.open(main_name) as f:
+                return scan_score_info(f)
+
+    from .file_processing import unpack_mscz_to_tempdir
 
     res = {}
 
     with unpack_mscz_to_tempdir(input_path, repack=False) as (work_dir, mscx_files):
         try:
-            parser = ET.XMLParser()
-            target = ""
-            for mscx_path in mscx_files:
-                if "Excerpts" not in mscx_path:
-                    target = mscx_path
-                    break
-            tree = ET.parse(target, parser)
-            root = tree.getroot()
-            score = root.find("Score")
-            if score is None:
-                raise ValueError("No <Score> tag found in the XML.")
-
-            res = get_all_properties(score)
+            target = _find_main_score(mscx_files) or ""
+            tree = get_xml_backend().parse(target)
+            res = _get_score_info(tree)
 
         except Exception:
             raise
@@ -196,7 +655,15 @@ def get_score_attributes(input_path: str) -> ScoreInfo:
     return res  # noqa
 
 
-def set_score_attributes(input_path: str, score_properties: ScoreInfo) -> None:
+def set_score_attributes(
+    input_path: str, score_properties: ScoreInfo, minimal_diff: bool = False
+) -> None:
+    """
+    Set the title box / meta properties of a mscz's main score, in place.
+    With `minimal_diff`, only the changed elements are rewritten (see `format_mscx()`)
+    """
+    from .file_processing import unpack_mscz_to_tempdir
+
     with unpack_mscz_to_tempdir(input_path) as (work_dir, mscx_files):
         try:
             target = ""
@@ -204,8 +671,10 @@ def set_score_attributes(input_path: str, score_properties: ScoreInfo) -> None:
                 if "Excerpts" not in mscx_path:
                     target = mscx_path
                     break
-            # TODO: Remove any instances of ET.parse(target, parser), as we do not need our own parser
-            tree = ET.parse(target)
+            with open(target, "rb") as f:
+                data = f.read()
+            tree = get_xml_backend().fromstring(data)
+            tracker = _track(tree, data) if minimal_diff else None
             root = tree.getroot()
             score = root.find("Score")
             if score is None:
@@ -214,31 +683,66 @@ def set_score_attributes(input_path: str, score_properties: ScoreInfo) -> None:
             set_all_properties(score, score_properties)
 
             with open(target, "wb") as f:
-                ET.indent(tree, space="  ", level=0)
-                tree.write(f, encoding="utf-8", xml_declaration=True)
-            LOGGER.info(f"Output written to {mscx_path}")
-            print("Made it here")
+                f.write(_write_tree(tree, tracker))
+            LOGGER.info(f"Output written to {target}")
 
         except Exception:
             raise
 
 
-def main():
+def check_stamp_properties(properties: dict[str, str]) -> None:
+    """Raise a ValueError if `stamp_mscz()` can't set one of `properties` (meta_* or title box styles only)"""
+    for name in properties:
+        if not (name.startswith("meta_") and len(name) > len("meta_")) and name not in TITLE_BOX_PROPERTIES:
+            raise ValueError(
+                f"Can't set {name!r}, only meta_* and title box ({', '.join(TITLE_BOX_PROPERTIES)}) properties"
+            )
+
+
+def stamp_mscx_bytes(mscx_data: bytes, properties: dict[str, str]) -> bytes | None:
     """
-    Command-line interface for formatting MuseScore files (.mscz).
-    Example:
-        python -m musescore_part_formatter.main input.mscz output.mscz \
-            --style broadway \
-            --show-title "My Song" \
-            --show-number "01" \
-            --num-measures-per-line-score 4 \
-            --num-measures-per-line-part 6 \
-            --num-lines-per-page 7
+    Set the metaTags / title box text of a mscx file's contents, without any formatting.
+    Only the changed elements are rewritten (see `mscx_stream.py`). Returns None if nothing changed.
+    A score without a title box (an excerpt can be missing one) only gets its metaTags set
     """
-    parser = argparse.ArgumentParser(description="Format a MuseScore file (.mscz).")
+    stream = _open_stream(io.BytesIO(mscx_data))
+    set_all_properties(stream.partial_score(), properties, debug=False)
+    out = io.BytesIO()
+    _write_stream(stream, out)
+    res = out.getvalue()
+    return None if res == mscx_data else res
 
-    parser.add_argument("input", help="Path to input .mscz file")
-    parser.add_argument("output", help="Path to output .mscz file")
+
+def stamp_mscz(input_path: str, properties: dict[str, str], output_path: str | None = None) -> list[str]:
+    """
+    Restamp the title / subtitle / composer / meta_* properties of a mscz's main score and every one of its excerpts,
+    without formatting anything (see `stamp_mscx_bytes()`). Written in place unless `output_path` is given.
+    Members that didn't change (and everything that isn't a .mscx) are copied over still compressed.
+
+    Returns the names of the members that changed
+    """
+    from .file_processing import rewrite_mscz
+
+    check_stamp_properties(properties)
+    changed: list[str] = []
+
+    def stamp_members(members: dict[str, bytes]) -> dict[str, bytes]:
+        res = {}
+        for name, data in members.items():
+            if not name.endswith(".mscx"):
+                continue
+            stamped = stamp_mscx_bytes(data, properties)
+            if stamped is not None:
+                res[name] = stamped
+        changed.extend(res)
+        return res
+
+    rewrite_mscz(input_path, output_path or input_path, stamp_members)
+    return changed
+
+
+def add_formatting_arguments(parser: "argparse.ArgumentParser") -> None:
+    """Add the formatting param options (--style, --show-title, ...) to a CLI parser"""
     parser.add_argument(
         "--style",
         dest="selected_style",
@@ -257,36 +761,150 @@ def main():
     parser.add_argument(
         "--num-measures-per-line-score",
         type=int,
-        default=4,
+        default=None,
         help="Number of measures per line in the full score (default: 4)",
     )
     parser.add_argument(
         "--num-measures-per-line-part",
         type=int,
-        default=6,
+        default=None,
         help="Number of measures per line in parts (default: 6)",
     )
     parser.add_argument(
         "--num-lines-per-page",
         type=int,
-        default=7,
+        default=None,
         help="Number of lines per page (default: 7)",
     )
+    parser.add_argument(
+        "--layout-engine",
+        dest="layout_engine",
+        choices=[e.value for e in LayoutEngine],
+        default=LayoutEngine.FUSED.value,
+        help="Layout break implementation, 'reference' runs the original one pass per rule version (default: fused)",
+    )
+    parser.add_argument(
+        "--line-planner",
+        dest="line_planner",
+        choices=[e.value for e in LinePlanner],
+        default=LinePlanner.GREEDY.value,
+        help="How line breaks are picked, 'optimal' minimizes a cost per rehearsal section (default: greedy)",
+    )
+    parser.add_argument(
+        "--page-planner",
+        dest="page_planner",
+        choices=[e.value for e in PagePlanner],
+        default=PagePlanner.GREEDY.value,
+        help="How page breaks are picked, 'optimal' minimizes a cost over the whole part (default: greedy)",
+    )
 
-    args = parser.parse_args()
 
+def formatting_params_from_args(args: "argparse.Namespace", predict: bool = False) -> FormattingParams:
+    """
+    The formatting params from `add_formatting_arguments()`'s options. The layout options that weren't passed get the
+    CLI defaults, unless `predict` is true, then they're left out so `format_mscz(predict=True)` picks them
+    """
     params: FormattingParams = {
         "selected_style": args.selected_style,
         "show_title": args.show_title,
         "show_number": args.show_number,
         "version_num": args.version_num,
-        "num_measures_per_line_score": args.num_measures_per_line_score,
-        "num_measures_per_line_part": args.num_measures_per_line_part,
-        "num_lines_per_page": args.num_lines_per_page,
+        "layout_engine": args.layout_engine,
+        "line_planner": args.line_planner,
+        "page_planner": args.page_planner,
     }
+    for key, default in CLI_LAYOUT_DEFAULTS.items():
+        value = getattr(args, key)
+        if value is not None:
+            params[key] = value
+        elif not predict:
+            params[key] = default
+    return params
+
+
+def main():
+    """
+    Command-line interface for formatting MuseScore files (.mscz).
+    Example:
+        python -m musescore_part_formatter.main input.mscz output.mscz \
+            --style broadway \
+            --show-title "My Song" \
+            --show-number "01" \
+            --num-measures-per-line-score 4 \
+            --num-measures-per-line-part 6 \
+            --num-lines-per-page 7
+    """
+    import argparse
+    import json
+
+    from .result_cache import ResultCache, set_result_cache
+
+    parser = argparse.ArgumentParser(description="Format a MuseScore file (.mscz).")
+
+    parser.add_argument("input", help="Path to input .mscz file")
+    parser.add_argument("output", help="Path to output .mscz file")
+    add_formatting_arguments(parser)
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Format the parts in parallel on this many workers (default: one after another)",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Only parse the parts of each mscx that get formatted, for very large scores",
+    )
+    parser.add_argument(
+        "--minimal-diff",
+        action="store_true",
+        help="Only rewrite the elements that changed instead of re-indenting the whole file",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        default=None,
+        help="Write per stage timings and counters to this JSON file (see instrumentation.py)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Keep formatted scores in this directory, and reuse them for identical input + params (see result_cache.py)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't use the result cache, even if one is set up",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Also cache each formatted mscx, so only the parts that changed since last time get formatted",
+    )
+
+    args = parser.parse_args()
+
+    params = formatting_params_from_args(args)
+    if args.cache_dir:
+        set_result_cache(ResultCache(args.cache_dir))
+    if args.incremental and (args.no_cache or _get_result_cache() is None):
+        parser.error("--incremental needs a result cache (--cache-dir, and not --no-cache)")
 
     try:
-        success = format_mscz(args.input, args.output, params)
+        with collect() if args.profile else nullcontext() as profile:
+            success = format_mscz(
+                args.input,
+                args.output,
+                params,
+                max_workers=args.max_workers,
+                streaming=args.streaming,
+                minimal_diff=args.minimal_diff,
+                use_cache=not args.no_cache,
+                incremental=args.incremental,
+            )
+        if profile is not None:
+            with open(args.profile, "w") as f:
+                json.dump(profile.to_dict(), f, indent=2)
         if success:
             print(f"✅ Successfully formatted score: {args.output}")
         else:
@@ -0,0 +1,141 @@
+"""
+Compact index of the measures in a staff.
+
+Built with one walk over the staff, then shared by all of the layout break passes so they don't have to
+keep calling find()/findall() on the tree. Measures are referred to by their index among the staff's
+<Measure> tags (NOT their position in the staff, which also has VBoxes etc.)
+"""
+
+from array import array
+import xml.etree.ElementTree as ET
+
+from .utils import _add_line_break_to_measure, _add_page_break_to_measure
+from .instrumentation import count
+
+# Flags
+REHEARSAL_MARK = 1 << 0  # <RehearsalMark> in the first <voice>
+BARLINE = 1 << 1  # <BarLine> in the first <voice>
+LAYOUT_BREAK = 1 << 2  # measure has at least one <LayoutBreak>
+MM_REST_START = 1 << 3  # measure has a `len` attribute, ie. it is a multimeasure rest
+IN_MM_REST = 1 << 4  # measure is one of the measures covered by an earlier multimeasure rest
+MEASURE_REHEARSAL_MARK = 1 << 5  # <RehearsalMark> directly under <Measure>
+MEASURE_BARLINE = 1 << 6  # <BarLine> directly under <Measure>
+
+
+class MeasureIndex:
+    """
+    Per measure:
+    - positions[i]: position of the measure in the staff
+    - flags[i]: bitmask of the flags above
+    - mm_length[i]: length of the multimeasure rest starting at this measure (0 if it doesn't start one)
+    - mm_start[i]: index of the closest multimeasure rest start at or before this measure (-1 if none)
+
+    Use the add/remove methods to change layout breaks so the tree and the index stay in sync.
+    """
+
+    __slots__ = ("staff", "measures", "positions", "flags", "mm_length", "mm_start")
+
+    def __init__(self, staff: ET.Element):
+        self.staff = staff
+        self.measures: list[ET.Element] = []
+        self.positions = array("i")
+        self.flags = bytearray()
+        self.mm_length = array("i")
+        self.mm_start = array("i")
+
+        measures_to_mark = 0
+        last_mm_start = -1
+        for pos, elem in enumerate(staff):
+            if elem.tag != "Measure":
+                continue
+
+            flags = 0
+            length = 0
+            if measures_to_mark > 0:
+                flags |= IN_MM_REST
+                measures_to_mark -= 1
+            if elem.attrib.get("len"):
+                flags |= MM_REST_START
+                length = int(elem.find("multiMeasureRest").text)
+                measures_to_mark = length - 1
+                last_mm_start = len(self.measures)
+
+            first_voice = None
+            for child in elem:
+                tag = child.tag
+                if tag == "LayoutBreak":
+                    flags |= LAYOUT_BREAK
+                elif tag == "BarLine":
+                    flags |= MEASURE_BARLINE
+                elif tag == "RehearsalMark":
+                    flags |= MEASURE_REHEARSAL_MARK
+                elif tag == "voice" and first_voice is None:
+                    first_voice = child
+
+            if first_voice is not None:
+                if first_voice.find("RehearsalMark") is not None:
+                    flags |= REHEARSAL_MARK
+                if first_voice.find("BarLine") is not None:
+                    flags |= BARLINE
+
+            self.measures.append(elem)
+            self.positions.append(pos)
+            self.flags.append(flags)
+            self.mm_length.append(length)
+            self.mm_start.append(last_mm_start)
+        count("measures_visited", len(self.measures))
+
+    def __len__(self) -> int:
+        return len(self.measures)
+
+    def has(self, i: int, flag: int) -> bool:
+        return bool(self.flags[i] & flag)
+
+    def has_line_break(self, i: int) -> bool:
+        return bool(self.flags[i] & LAYOUT_BREAK)
+
+    def in_mm_rest(self, i: int) -> bool:
+        return bool(self.flags[i] & IN_MM_REST)
+
+    def prev_element(self, i: int) -> ET.Element | None:
+        """Element right before measure i in the staff (can be a VBox etc.)"""
+        pos = self.positions[i]
+        return self.staff[pos - 1] if pos > 0 else None
+
+    def lines(self) -> list[range]:
+        """
+        Split measure indices into lines at every layout break.
+        If the last measure has a layout break, the last line is empty
+        """
+        lines = []
+        start = 0
+        flags = self.flags
+        for i in range(len(flags)):
+            if flags[i] & LAYOUT_BREAK:
+                lines.append(range(start, i + 1))
+                start = i + 1
+        lines.append(range(start, len(flags)))
+        return lines
+
+    # -- Changing the tree --
+    def add_line_break(self, i: int) -> None:
+        """Add a line break to measure i, if it doesn't already have one"""
+        if not self.flags[i] & LAYOUT_BREAK:
+            _add_line_break_to_measure(self.measures[i])
+            self.flags[i] |= LAYOUT_BREAK
+
+    def remove_line_break(self, i: int) -> None:
+        """Remove (the first) layout break from measure i"""
+        measure = self.measures[i]
+        layout_breaks = [child for child in measure if child.tag == "LayoutBreak"]
+        if layout_breaks:
+            subtype = layout_breaks[0].find("subtype")
+            is_page = subtype is not None and subtype.text == "page"
+            count("page_breaks_removed" if is_page else "line_breaks_removed")
+            measure.remove(layout_breaks[0])
+        if len(layout_breaks) <= 1:
+            self.flags[i] &= ~LAYOUT_BREAK
+
+    def add_page_break(self, i: int) -> None:
+        _add_page_break_to_measure(self.measures[i])
+        self.flags[i] |= LAYOUT_BREAK
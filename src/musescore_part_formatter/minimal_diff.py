@@ -0,0 +1,252 @@
+"""
+Minimal-diff output writing.
+
+Serializing a whole tree re-indents (and re-escapes) every element, so adding a few LayoutBreaks shows up as a diff of
+the entire file. `SourceTracker` remembers where each element of a parsed tree came from in the source bytes and what it
+looked like, so that after the tree has been edited, `patches()` can work out the byte ranges that actually need to change:
+- unchanged elements are left alone
+- new children are inserted next to an unchanged sibling, indented like it
+- removed children are cut out, along with the whitespace before them
+- elements whose tag / attributes / text changed (or whose children got reordered) are serialized again
+
+Only tails are never looked at, nothing in the formatter sets them.
+"""
+
+from array import array
+from typing import BinaryIO
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+import io
+import re
+
+from .xml_backend import get_xml_backend
+
+CHUNK_SIZE = 1 << 16
+
+# (start, end, replacement) -- bytes [start, end) of the source are replaced, start == end is an insertion
+Patch = tuple[int, int, bytes]
+
+_WHITESPACE = b" \t\r\n"
+_START_TAG = re.compile(rb"<[^/!?]")
+# markup that can have a raw "<" in it
+_OPAQUE_MARKUP = (b"<!--", b"<![CDATA[", b"<!DOCTYPE")
+_END_CHUNK_SIZE = 1 << 10
+
+
+def splice(src: BinaryIO, dst: BinaryIO, patches: list[Patch]) -> None:
+    """
+    Copy `src` to `dst` in chunks, replacing the patched byte ranges.
+    Patches must not overlap, they're applied in (start, end) order
+    """
+    pos = 0
+    src.seek(0)
+    for start, end, data in sorted(patches, key=lambda p: (p[0], p[1])):
+        if start < pos:
+            raise ValueError(f"Overlapping patches at byte {start}")
+        _copy(src, dst, start - pos)
+        dst.write(data)
+        src.seek(end)
+        pos = end
+    while chunk := src.read(CHUNK_SIZE):
+        dst.write(chunk)
+
+
+def _copy(src: BinaryIO, dst: BinaryIO, size: int) -> None:
+    while size > 0:
+        chunk = src.read(min(size, CHUNK_SIZE))
+        if not chunk:
+            break
+        dst.write(chunk)
+        size -= len(chunk)
+
+
+def element_starts(source: bytes) -> array:
+    """
+    Where each element starts, in document order.
+    That's the same order as `root.iter()`, so the two can be zipped together
+    """
+    # Outside of comments / CDATA / DOCTYPEs / PIs, a "<" that isn't followed by "/" always starts an element,
+    # so in the usual case a regex finds them all a lot faster than running expat with a Python callback per element
+    if not any(markup in source for markup in _OPAQUE_MARKUP) and source.count(b"<?") <= 1:
+        return array("q", (match.start() for match in _START_TAG.finditer(source)))
+
+    parser = xml.parsers.expat.ParserCreate()
+    starts = array("q")
+    parser.StartElementHandler = lambda name, attrs: starts.append(parser.CurrentByteIndex)
+    parser.Parse(source, True)
+    return starts
+
+
+class _ElementEnd(Exception):
+    pass
+
+
+def _element_end(source: bytes, start: int) -> int:
+    """End of the element that starts at `start` (just after its end tag)"""
+    parser = xml.parsers.expat.ParserCreate()
+    depth = 0
+    events = 0  # since the element started
+
+    def start_element(name, attrs):
+        nonlocal depth, events
+        depth += 1
+        events += 1
+
+    def end_element(name):
+        nonlocal depth, events
+        depth -= 1
+        events += 1
+        if depth == 0:
+            # expat reports the end of an element at the start of its end tag, or just after "/>" for an empty one
+            raise _ElementEnd(start + parser.CurrentByteIndex, events)
+
+    def character_data(data):
+        nonlocal events
+        events += 1
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+
+    view = memoryview(source)
+    pos = start
+    size = _END_CHUNK_SIZE  # most patched elements are tiny, so start small and grow
+    try:
+        while pos < len(source):
+            parser.Parse(view[pos:pos + size], False)
+            pos += size
+            size *= 2
+        parser.Parse(b"", True)
+    except _ElementEnd as e:
+        end_event, events = e.args
+        if events == 2 and source[end_event - 2:end_event] == b"/>":
+            return end_event
+        return source.index(b">", end_event) + 1
+    raise ValueError(f"Unterminated element at byte {start}")
+
+
+def _leading_whitespace(source: bytes, pos: int) -> bytes:
+    i = pos
+    while i > 0 and source[i - 1] in _WHITESPACE:
+        i -= 1
+    return source[i:pos]
+
+
+def _indent_level(whitespace: bytes) -> int | None:
+    """How deep an element is, going by the (2 space) indentation before it. None if it isn't on its own line"""
+    if b"\n" not in whitespace:
+        return None
+    return len(whitespace.rsplit(b"\n", 1)[1]) // 2
+
+
+def _elements(parent) -> list:
+    # lxml also has comments / processing instructions as children, they're never changed so just leave them be
+    return [child for child in parent if isinstance(child.tag, str)]
+
+
+class SourceTracker:
+    """
+    Tracks the changes made to `root` (which was parsed from `source`) so they can be spliced into `source`.
+    Make the tracker BEFORE changing the tree. `offset` is added to every patch, for when `source` is a slice of a bigger file
+    """
+
+    def __init__(self, root: ET.Element, source: bytes, offset: int = 0):
+        self.root = root
+        self.source = source
+        self.offset = offset
+
+        starts = element_starts(source)
+        # elem -> (where it starts in the source, tag, attributes, text, children)
+        self._original = {}
+        elements = list(root.iter())
+        # filtering out comments / PIs is slow, only bother when there are some
+        self._children = list if all(isinstance(elem.tag, str) for elem in elements) else _elements
+        if self._children is _elements:
+            elements = [elem for elem in elements if isinstance(elem.tag, str)]
+        if len(elements) != len(starts):
+            raise ValueError("Tree doesn't match its source")
+        for start, elem in zip(starts, elements):
+            self._original[elem] = (start, elem.tag, dict(elem.attrib), elem.text, self._children(elem))
+        # ends are only needed for the (few) elements that get patched, so they're found as they're needed
+        self._ends = {}
+
+    def _span(self, elem) -> tuple[int, int]:
+        start = self._original[elem][0]
+        if start not in self._ends:
+            self._ends[start] = _element_end(self.source, start)
+        return start, self._ends[start]
+
+    def _patch(self, start: int, end: int, data: bytes) -> Patch:
+        return start + self.offset, end + self.offset, data
+
+    def _serialize(self, elem, level: int | None) -> bytes:
+        return get_xml_backend().element_tostring(elem, level=level)
+
+    def _replace(self, elem) -> Patch:
+        start, end = self._span(elem)
+        level = _indent_level(_leading_whitespace(self.source, start))
+        return self._patch(start, end, self._serialize(elem, level))
+
+    def patches(self) -> list[Patch]:
+        patches = []
+        stack = [self.root]
+        while stack:
+            elem = stack.pop()
+            _, tag, attrib, text, original_children = self._original[elem]
+            if elem.tag != tag or elem.text != text or dict(elem.attrib) != attrib:
+                patches.append(self._replace(elem))
+                continue
+
+            children = self._children(elem)
+            if children == original_children:
+                stack.extend(children)
+                continue
+
+            kept = [child for child in children if child in self._original]
+            kept_ids = set(map(id, kept))
+            if not kept or kept != [child for child in original_children if id(child) in kept_ids]:
+                # nothing to line new children up against / reordered, just redo the whole element
+                patches.append(self._replace(elem))
+                continue
+
+            for child in original_children:
+                if id(child) not in kept_ids:
+                    start, end = self._span(child)
+                    start -= len(_leading_whitespace(self.source, start))
+                    patches.append(self._patch(start, end, b""))
+
+            patches.extend(self._insertions(children))
+            stack.extend(kept)
+        return patches
+
+    def _insertions(self, children: list) -> list[Patch]:
+        """Patches for the new children, each one goes before the next kept sibling (or after the last one)"""
+        patches = []
+        pending = []
+        last_kept = None
+        for child in children:
+            if child not in self._original:
+                pending.append(child)
+                continue
+            if pending:
+                start, _ = self._span(child)
+                whitespace = _leading_whitespace(self.source, start)
+                level = _indent_level(whitespace)
+                data = b"".join(self._serialize(new, level) + whitespace for new in pending)
+                patches.append(self._patch(start, start, data))
+                pending = []
+            last_kept = child
+
+        if pending:
+            start, end = self._span(last_kept)
+            whitespace = _leading_whitespace(self.source, start)
+            level = _indent_level(whitespace)
+            data = b"".join(whitespace + self._serialize(new, level) for new in pending)
+            patches.append(self._patch(end, end, data))
+        return patches
+
+    def tostring(self) -> bytes:
+        """`source` with the changes spliced in"""
+        out = io.BytesIO()
+        splice(io.BytesIO(self.source), out, self.patches())
+        return out.getvalue()
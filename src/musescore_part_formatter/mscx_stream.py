@@ -0,0 +1,201 @@
+"""
+Streaming mscx rewriting, for scores too big to comfortably hold as a tree.
+
+The formatter only ever changes the <Score>'s metaTags and its first <Staff>, so instead of parsing the whole document:
+1. scan it once with expat (no tree), recording the byte offsets of those elements and counting the Parts / Staves
+2. parse just those elements into a small stand-in <Score> (see `MscxStream.partial_score()`)
+3. copy the document to the output in chunks, splicing in the changes (see `minimal_diff.py`)
+
+Everything else (the other staves, Parts, ...) is copied over byte for byte, so memory doesn't grow with the number of staves.
+"""
+
+from dataclasses import dataclass, field
+from typing import BinaryIO
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+
+from .xml_backend import get_xml_backend
+from .file_inspect import ScoreInfo, get_all_properties
+from .minimal_diff import CHUNK_SIZE, Patch, SourceTracker, splice
+
+
+@dataclass
+class MscxOffsets:
+    """Where things are in a mscx file, [start, end) byte ranges"""
+
+    score_start_tag_end: int = -1  # just after <Score>, where metaTags go if there aren't any yet
+    meta_tags: list[tuple[int, int]] = field(default_factory=list)  # <metaTag> children of <Score>
+    first_staff: tuple[int, int] | None = None  # first <Staff> child of <Score>
+    num_parts: int = 0
+    num_staves: int = 0
+
+
+class _Scanner:
+    """expat handlers for `scan_mscx()`, end offsets are resolved afterwards"""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.depth = 0
+        self.in_score = False
+        self.seen_score = False
+        self.current_start = -1  # start of the tracked element we're in
+        self.score_start = -1
+        self.meta_tags: list[tuple[int, int]] = []  # (start, offset of the end tag)
+        self.first_staff: tuple[int, int] | None = None
+        self.num_parts = 0
+        self.num_staves = 0
+
+    def start(self, name, attrs):
+        self.depth += 1
+        if self.depth == 2 and name == "Score" and not self.seen_score:
+            self.in_score = self.seen_score = True
+            self.score_start = self.parser.CurrentByteIndex
+        elif self.depth == 3 and self.in_score:
+            if name == "metaTag":
+                self.current_start = self.parser.CurrentByteIndex
+            elif name == "Part":
+                self.num_parts += 1
+            elif name == "Staff":
+                self.num_staves += 1
+                if self.num_staves == 1:
+                    self.current_start = self.parser.CurrentByteIndex
+
+    def end(self, name):
+        if self.depth == 2 and self.in_score:
+            self.in_score = False
+        elif self.depth == 3 and self.in_score:
+            if name == "metaTag":
+                self.meta_tags.append((self.current_start, self.parser.CurrentByteIndex))
+            elif name == "Staff" and self.first_staff is None:
+                self.first_staff = (self.current_start, self.parser.CurrentByteIndex)
+        self.depth -= 1
+
+
+def _find_tag_end(fp: BinaryIO, offset: int) -> int:
+    """Offset just after the first '>' at or after `offset`"""
+    fp.seek(offset)
+    pos = offset
+    while chunk := fp.read(256):
+        i = chunk.find(b">")
+        if i != -1:
+            return pos + i + 1
+        pos += len(chunk)
+    raise ValueError(f"Unterminated tag at byte {offset}")
+
+
+def _element_end(fp: BinaryIO, start: int, end_event: int) -> int:
+    """
+    End of an element, given its start and where expat reported its end:
+    the start of the end tag, or just after the start tag if the element is empty (<tag/>)
+    """
+    start_tag_end = _find_tag_end(fp, start)
+    if end_event == start_tag_end and read_range(fp, end_event - 2, end_event) == b"/>":
+        return end_event
+    return _find_tag_end(fp, end_event)
+
+
+def scan_mscx(fp: BinaryIO) -> MscxOffsets:
+    """Find the Score's metaTags and first Staff in a (seekable) mscx file without building a tree"""
+    parser = xml.parsers.expat.ParserCreate()
+    scanner = _Scanner(parser)
+    parser.StartElementHandler = scanner.start
+    parser.EndElementHandler = scanner.end
+
+    fp.seek(0)
+    while chunk := fp.read(CHUNK_SIZE):
+        parser.Parse(chunk, False)
+    parser.Parse(b"", True)
+
+    if scanner.score_start == -1:
+        raise ValueError("No <Score> tag found in the XML.")
+
+    offsets = MscxOffsets(
+        score_start_tag_end=_find_tag_end(fp, scanner.score_start),
+        num_parts=scanner.num_parts,
+        num_staves=scanner.num_staves,
+    )
+    offsets.meta_tags = [
+        (start, _element_end(fp, start, end)) for start, end in scanner.meta_tags
+    ]
+    if scanner.first_staff is not None:
+        start, end = scanner.first_staff
+        offsets.first_staff = (start, _element_end(fp, start, end))
+    return offsets
+
+
+def read_range(fp: BinaryIO, start: int, end: int) -> bytes:
+    fp.seek(start)
+    return fp.read(end - start)
+
+
+class MscxStream:
+    """
+    A mscx file that's only been scanned, not parsed.
+
+    `partial_score()` is a <Score> holding (copies of) just the metaTags and the first Staff, which is enough for
+    `file_inspect`'s getters and for formatting. Change it in place, then `write()` splices the changes into the original.
+    """
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
+        self.offsets = scan_mscx(fp)
+        self._score: ET.Element | None = None
+        self._meta_tags: list[ET.Element] = []
+        self._meta_text: list[str | None] = []
+        self._staff_tracker: SourceTracker | None = None
+
+    def partial_score(self) -> ET.Element:
+        if self._score is None:
+            meta_data = b"".join(read_range(self.fp, start, end) for start, end in self.offsets.meta_tags)
+            staff_data = b""
+            if self.offsets.first_staff is not None:
+                staff_data = read_range(self.fp, *self.offsets.first_staff)
+            self._score = get_xml_backend().fromstring(b"<Score>" + meta_data + staff_data + b"</Score>").getroot()
+
+            children = list(self._score)
+            self._meta_tags = children[: len(self.offsets.meta_tags)]
+            self._meta_text = [tag.text for tag in self._meta_tags]
+            if self.offsets.first_staff is not None:
+                # only the bits of the staff that change get written
+                self._staff_tracker = SourceTracker(
+                    children[-1], staff_data, offset=self.offsets.first_staff[0]
+                )
+        return self._score
+
+    def score_info(self) -> ScoreInfo:
+        """Same as `file_inspect.get_all_properties()` on the whole score"""
+        res = get_all_properties(self.partial_score())
+        res["num_instruments"] = self.offsets.num_parts
+        res["num_staves"] = self.offsets.num_staves
+        return res
+
+    def patches(self) -> list[Patch]:
+        """Patches for whatever changed in `partial_score()` (metaTags that changed / were added, and the staff)"""
+        score = self.partial_score()
+        backend = get_xml_backend()
+        patches = []
+
+        for tag, text, (start, end) in zip(self._meta_tags, self._meta_text, self.offsets.meta_tags):
+            if tag.text != text:
+                patches.append((start, end, backend.element_tostring(tag)))
+
+        # set_score_properties() puts new metaTags after the existing ones
+        added = b"".join(
+            b"\n" + _indent(2) + backend.element_tostring(tag)
+            for tag in score.findall("metaTag")
+            if tag not in self._meta_tags
+        )
+        if added:
+            anchor = self.offsets.meta_tags[-1][1] if self.offsets.meta_tags else self.offsets.score_start_tag_end
+            patches.append((anchor, anchor, added))
+
+        if self._staff_tracker is not None:
+            patches.extend(self._staff_tracker.patches())
+        return patches
+
+    def write(self, dst: BinaryIO) -> None:
+        splice(self.fp, dst, self.patches())
+
+
+def _indent(level: int) -> bytes:
+    return b"  " * level
@@ -0,0 +1,188 @@
+"""
+Break planning by dynamic programming
+
+The greedy passes count measures / lines, then patch things up (`formatting.final_pass_through()` for short lines,
+looking a line or two either side for a better page break). These instead pick the breaks with the lowest total cost.
+
+Line breaks (`plan_line_breaks()`), for each section between the breaks that have to be there (rehearsal marks, double
+bars, existing breaks):
+- a multimeasure rest is one unit, like a measure, and can't be split
+- each line costs the square of how far it is from `measures_per_line` units (twice that if it's over), plus a little
+  if it's an odd number of units (phrases come in 2s and 4s), plus a lot if it's only one or two units
+
+Page breaks (`plan_page_breaks()`), over the whole staff:
+- each page costs the square of how many lines short of full it is (the last page only has to be half full, so the
+  score doesn't end on a page turn for a line or two)
+- each break costs a penalty unless it's at a natural boundary: before a rehearsal mark, after a double bar, or just
+  before a run of multimeasure rest lines. Breaking between two lines of rests costs a little, anywhere else costs more
+
+Lines and pages have a most they can hold, so each break point only looks back that far:
+O(measures * measures per line) and O(lines * lines per page)
+"""
+
+from typing import Sequence
+
+from .measure_index import (
+    MeasureIndex,
+    REHEARSAL_MARK,
+    BARLINE,
+    MM_REST_START,
+    IN_MM_REST,
+    MEASURE_REHEARSAL_MARK,
+    MEASURE_BARLINE,
+)
+
+# Line costs, in units of "one measure off measures_per_line"
+MAX_LINE_OVERFLOW = 2  # a line can hold this many more units than measures_per_line
+ODD_LINE_PENALTY = 1
+SHORT_LINE_PENALTY = 8  # lines of one or two units
+SHORT_LINE = 2
+
+# Page costs, in units of "one line short on a page"
+PAGE_BREAK_PENALTY = 3  # break that isn't at a boundary (so a page can end up to a line short to get to one)
+REST_RUN_PENALTY = 1  # break between two lines of multimeasure rests (fine to turn there, but better before them)
+
+_SECTION_START = REHEARSAL_MARK | MEASURE_REHEARSAL_MARK
+_SECTION_END = BARLINE | MEASURE_BARLINE
+_REST = MM_REST_START | IN_MM_REST
+
+
+def line_cost(num_units: int, measures_per_line: int) -> int:
+    if num_units <= measures_per_line:
+        cost = (measures_per_line - num_units) ** 2
+    else:
+        cost = 2 * (num_units - measures_per_line) ** 2
+    if num_units % 2:
+        cost += ODD_LINE_PENALTY
+    if num_units <= SHORT_LINE:
+        cost += SHORT_LINE_PENALTY
+    return cost
+
+
+def _units(index: MeasureIndex, has_lb: Sequence[bool], start: int, end: int) -> list[int]:
+    """
+    Last measure of each unit in measures [start, end): a measure, or a whole multimeasure rest (unless there's a
+    break in the middle of it)
+    """
+    flags = index.flags
+    res = []
+    for i in range(start, end):
+        if i + 1 < end and flags[i + 1] & IN_MM_REST and not has_lb[i]:
+            continue
+        res.append(i)
+    return res
+
+
+def _plan_section(unit_ends: list[int], measures_per_line: int) -> list[int]:
+    """Line breaks (measures) for one section, not including the one at the end of it"""
+    num_units = len(unit_ends)
+    max_units = measures_per_line + MAX_LINE_OVERFLOW
+    costs = [line_cost(k, measures_per_line) for k in range(max_units + 1)]
+
+    # best[j]: cost of laying out units[:j] with a line ending after unit j - 1, start[j]: first unit of that line
+    best = [0] * (num_units + 1)
+    start = [0] * (num_units + 1)
+    for j in range(1, num_units + 1):
+        best_cost = None
+        for i in range(max(0, j - max_units), j):
+            cost = best[i] + costs[j - i]
+            if best_cost is None or cost <= best_cost:  # ties go to fuller lines first
+                best_cost = cost
+                start[j] = i
+        best[j] = best_cost
+
+    breaks = []
+    j = start[num_units]
+    while j > 0:
+        breaks.append(unit_ends[j - 1])
+        j = start[j]
+    breaks.reverse()
+    return breaks
+
+
+def plan_line_breaks(index: MeasureIndex, has_lb: Sequence[bool], measures_per_line: int) -> list[int]:
+    """
+    Measures to add line breaks to (see the module docstring). `has_lb` is which measures already have (or are getting)
+    one, those split the staff into sections that are planned separately
+    """
+    measures_per_line = max(1, measures_per_line)
+    breaks = []
+    start = 0
+    num_measures = len(index)
+    for end in range(num_measures):
+        if has_lb[end] or end == num_measures - 1:
+            breaks.extend(_plan_section(_units(index, has_lb, start, end + 1), measures_per_line))
+            start = end + 1
+    return breaks
+
+
+def page_capacities(num_lines_per_page: int) -> tuple[int, int]:
+    """
+    Most lines on (the first page, every other page). The title takes up room on the first page, so it holds one
+    less (same as the greedy pass, which breaks after `num_lines_per_page` lines, then every `num_lines_per_page + 1`)
+    """
+    first = max(1, num_lines_per_page)
+    return first, first + 1
+
+
+def _is_rest_line(flags: bytearray, line: range) -> bool:
+    return all(flags[i] & _REST for i in line)
+
+
+def page_break_penalty(index: MeasureIndex, lines: list[range], i: int) -> int:
+    """Cost of a page break after lines[i] (there has to be a next line)"""
+    flags = index.flags
+    last = lines[i][-1]
+    next_first = lines[i + 1][0]
+    if flags[last] & _SECTION_END or flags[next_first] & _SECTION_START:
+        return 0
+    if flags[next_first] & MM_REST_START:
+        if not _is_rest_line(flags, lines[i]):
+            return 0  # start of a run of rests
+        return REST_RUN_PENALTY
+    return PAGE_BREAK_PENALTY
+
+
+def plan_page_breaks(index: MeasureIndex, lines: list[range], num_lines_per_page: int) -> list[int]:
+    """
+    Measures to turn into page breaks (the last measure of the last line on every page but the last), see the module
+    docstring. `lines` is the staff split at its line breaks (see `MeasureIndex.lines()`)
+    """
+    lines = [line for line in lines if line]
+    num_lines = len(lines)
+    if num_lines == 0:
+        return []
+
+    first_capacity, capacity = page_capacities(num_lines_per_page)
+    penalties = [page_break_penalty(index, lines, i) for i in range(num_lines - 1)]
+
+    # best[j]: cost of laying out lines[:j] with a page ending after lines[j - 1]
+    # start[j]: first line of that page
+    inf = float("inf")
+    best = [0.0] + [inf] * num_lines
+    start = [0] * (num_lines + 1)
+    for j in range(1, num_lines + 1):
+        is_last = j == num_lines
+        for i in range(max(0, j - capacity), j):
+            if best[i] == inf:
+                continue
+            page_capacity = first_capacity if i == 0 else capacity
+            num_page_lines = j - i
+            if num_page_lines > page_capacity:
+                continue
+            if is_last:
+                cost = best[i] + max(0, (page_capacity + 1) // 2 - num_page_lines) ** 2
+            else:
+                cost = best[i] + (page_capacity - num_page_lines) ** 2 + penalties[j - 1]
+            if cost <= best[j]:  # ties go to fuller pages first
+                best[j] = cost
+                start[j] = i
+
+    pages = []
+    j = num_lines
+    while j > 0:
+        j = start[j]
+        if j > 0:
+            pages.append(lines[j - 1][-1])
+    pages.reverse()
+    return pages
@@ -0,0 +1,57 @@
+"""
+Helpers for running formatting work in parallel
+"""
+
+import sys
+from concurrent.futures import (
+    Executor,
+    FIRST_COMPLETED,
+    as_completed,
+    wait,
+)
+from typing import Any, Callable, Iterable, Iterator
+
+
+def is_free_threaded() -> bool:
+    """True when running on a free-threaded (no GIL) build of python"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def make_executor(
+    max_workers: int | None = None, initializer: Callable[[], Any] | None = None
+) -> Executor:
+    """
+    Process pool normally. On free-threaded builds threads actually run in parallel,
+    so use a thread pool there and skip pickling scores back and forth between processes.
+    max_workers=None uses the executor's default (based on the number of CPUs).
+    `initializer` is run once in each worker when it starts
+    """
+    # imported here, the process pool pulls in all of multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if is_free_threaded():
+        return ThreadPoolExecutor(max_workers=max_workers, initializer=initializer)
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=initializer)
+
+
+def map_unordered(
+    executor: Executor,
+    fn: Callable[..., Any],
+    jobs: Iterable[tuple],
+    max_pending: int,
+) -> Iterator[Any]:
+    """
+    Run `fn(*job)` for every job on `executor`, yielding results as they finish (not in job order).
+    Only `max_pending` jobs are submitted at a time, so huge batches don't all sit in the executor's queue at once.
+    """
+    pending = set()
+    for job in jobs:
+        pending.add(executor.submit(fn, *job))
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    for future in as_completed(pending):
+        yield future.result()
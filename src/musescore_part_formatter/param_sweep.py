@@ -0,0 +1,197 @@
+"""
+Layout parameter sweep: try many (measures per line, lines per page) candidates on a staff, from a single parse
+
+Formatting a copy of a part for every candidate parses the file and walks the staff every time. Planning the breaks
+(`layout.plan_layout_breaks()`) only reads the `MeasureIndex`, so the staff is parsed and indexed once, every candidate is
+planned against that same index, and the plans are scored without changing the tree or writing anything.
+
+Each candidate gets a `CandidateScore`, lower cost is better:
+- line balance: how unevenly the music lines are filled (variance of the units on them, a multimeasure rest is one unit)
+- short lines: music lines of one or two units
+- pages: each one costs `PAGE_COST`, and a last page with only a line or two on it costs the same as in `optimal_layout`
+- page turns away from a boundary (rehearsal mark, double bar, start of a run of rests, see `optimal_layout.py`)
+- with a target measures per line (eg. the time signature's usual one), how far the average line is from it
+
+Lines that are nothing but multimeasure rests don't count as music lines.
+"""
+
+from dataclasses import dataclass
+from itertools import product
+from statistics import fmean, pvariance
+from typing import Iterable, Iterator
+import xml.etree.ElementTree as ET
+import io
+import zipfile
+
+from .utils import LinePlanner, PagePlanner
+from .instrumentation import stage, count
+from .layout import plan_layout_breaks
+from .measure_index import MeasureIndex, IN_MM_REST
+from .mscx_stream import MscxStream
+from .optimal_layout import (
+    SHORT_LINE,
+    SHORT_LINE_PENALTY,
+    PAGE_BREAK_PENALTY,
+    page_break_penalty,
+    page_capacities,
+    _is_rest_line,
+)
+
+SWEEP_MEASURES_PER_LINE = (4, 5, 6, 7, 8)
+SWEEP_LINES_PER_PAGE = (8,)
+
+# in units of line balance (one unit of variance)
+PAGE_COST = 4
+DENSITY_COST = 4  # per (unit off the target measures per line) ** 2
+
+
+@dataclass(frozen=True)
+class CandidateScore:
+    measures_per_line: int
+    num_lines_per_page: int
+    num_lines: int
+    num_pages: int
+    mean_line_units: float  # average units on a music line
+    line_balance: float  # variance of the units on the music lines
+    short_lines: int
+    page_breaks: int
+    boundary_page_breaks: int  # page breaks at a rehearsal mark, double bar or start of a run of rests
+    last_page_lines: int
+    cost: float
+
+
+def candidates(
+    measures_per_line: Iterable[int] = SWEEP_MEASURES_PER_LINE,
+    lines_per_page: Iterable[int] = SWEEP_LINES_PER_PAGE,
+) -> list[tuple[int, int]]:
+    """Every (measures per line, lines per page) combination"""
+    return list(product(measures_per_line, lines_per_page))
+
+
+def _line_units(flags: bytearray, line: range) -> int:
+    return sum(1 for i in line if i == line.start or not flags[i] & IN_MM_REST)
+
+
+def score_candidate(
+    index: MeasureIndex,
+    measures_per_line: int,
+    num_lines_per_page: int,
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+    target_measures_per_line: int | None = None,
+) -> CandidateScore:
+    """Plan the breaks for one candidate (without applying them) and score the result, see the module docstring"""
+    plan = plan_layout_breaks(index, measures_per_line, num_lines_per_page, page_planner, line_planner)
+    flags = index.flags
+    lines = [line for line in plan.lines if line]
+
+    units = [_line_units(flags, line) for line in lines if not _is_rest_line(flags, line)]
+    mean_line_units = fmean(units) if units else 0.0
+    line_balance = pvariance(units, mean_line_units) if len(units) > 1 else 0.0
+    short_lines = sum(1 for n in units if n <= SHORT_LINE)
+
+    page_ends = set(plan.pages)
+    page_breaks = boundary_page_breaks = 0
+    last_page_lines = 0
+    for i, line in enumerate(lines):
+        last_page_lines += 1
+        if i + 1 < len(lines) and line[-1] in page_ends:
+            page_breaks += 1
+            if page_break_penalty(index, lines, i) == 0:
+                boundary_page_breaks += 1
+            last_page_lines = 0
+    num_pages = page_breaks + 1 if lines else 0
+
+    cost = line_balance + SHORT_LINE_PENALTY * short_lines + PAGE_COST * num_pages
+    cost += PAGE_BREAK_PENALTY * (page_breaks - boundary_page_breaks)
+    if num_pages > 1:
+        capacity = page_capacities(num_lines_per_page)[1]
+        cost += max(0, (capacity + 1) // 2 - last_page_lines) ** 2
+    if target_measures_per_line is not None and units:
+        cost += DENSITY_COST * (mean_line_units - target_measures_per_line) ** 2
+
+    return CandidateScore(
+        measures_per_line=measures_per_line,
+        num_lines_per_page=num_lines_per_page,
+        num_lines=len(lines),
+        num_pages=num_pages,
+        mean_line_units=mean_line_units,
+        line_balance=line_balance,
+        short_lines=short_lines,
+        page_breaks=page_breaks,
+        boundary_page_breaks=boundary_page_breaks,
+        last_page_lines=last_page_lines,
+        cost=cost,
+    )
+
+
+def _rank_key(result: CandidateScore) -> tuple:
+    return (result.cost, result.num_pages, result.measures_per_line, result.num_lines_per_page)
+
+
+def sweep_index(
+    index: MeasureIndex,
+    candidates: Iterable[tuple[int, int]],
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+    target_measures_per_line: int | None = None,
+) -> list[CandidateScore]:
+    """Score every (measures per line, lines per page) candidate against `index`, best first"""
+    with stage("layout/sweep"):
+        res = [
+            score_candidate(index, mpl, nlpp, page_planner, line_planner, target_measures_per_line)
+            for mpl, nlpp in candidates
+        ]
+    count("sweep_candidates", len(res))
+    return sorted(res, key=_rank_key)
+
+
+def sweep_score(
+    score: ET.Element,
+    candidates: Iterable[tuple[int, int]],
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+    target_measures_per_line: int | None = None,
+) -> list[CandidateScore]:
+    """
+    `sweep_index()` on a <Score>'s first staff (the one that gets the layout breaks),
+    so it also works on `MscxStream.partial_score()`
+    """
+    staff = score.find("Staff")
+    if staff is None:
+        raise ValueError("No <Staff> found in the score")
+    with stage("layout/index"):
+        index = MeasureIndex(staff)
+    return sweep_index(index, candidates, page_planner, line_planner, target_measures_per_line)
+
+
+def partial_score(mscx_data: bytes) -> ET.Element:
+    """A mscx file's <Score>, with only its metaTags and first staff parsed (see `mscx_stream.py`)"""
+    with stage("parse"):
+        return MscxStream(io.BytesIO(mscx_data)).partial_score()
+
+
+def mscz_scores(input_path: str, parts_only: bool = True) -> Iterator[tuple[str, ET.Element]]:
+    """(member name, `partial_score()`) of each part of a mscz (and the main score too, unless `parts_only`)"""
+    with zipfile.ZipFile(input_path, "r") as z:
+        for name in z.namelist():
+            if not name.endswith(".mscx") or (parts_only and "Excerpts" not in name):
+                continue
+            with stage("unzip"):
+                data = z.read(name)
+            yield name, partial_score(data)
+
+
+def sweep_mscz(
+    input_path: str,
+    candidates: Iterable[tuple[int, int]],
+    page_planner: PagePlanner = PagePlanner.GREEDY,
+    line_planner: LinePlanner = LinePlanner.GREEDY,
+    parts_only: bool = True,
+) -> dict[str, list[CandidateScore]]:
+    """`sweep_score()` on each part of a mscz (see `mscz_scores()`), by member name. Nothing is written"""
+    candidates = list(candidates)
+    return {
+        name: sweep_score(score, candidates, page_planner, line_planner)
+        for name, score in mscz_scores(input_path, parts_only)
+    }
@@ -0,0 +1,213 @@
+"""
+On-disk cache of formatted .mscz files.
+
+Entries are keyed by a hash of everything that goes into the output: the input archive's bytes, the (prepped) formatting
+params, the package version, the style templates and the XML backend, so an identical resubmission gets the stored
+archive back without formatting anything. Entries are plain files in one directory, the least recently used ones are
+deleted once it gets bigger than `max_bytes`.
+
+With `format_mscz(..., incremental=True)`, each formatted .mscx member is stored too (keyed on the member's bytes instead
+of the archive's), so when only some parts of a resubmitted score changed, only those get formatted again.
+
+Off by default. Set the MUSESCORE_PART_FORMATTER_CACHE_DIR environment variable (and optionally
+MUSESCORE_PART_FORMATTER_CACHE_MAX_BYTES), or call `set_result_cache()`. `format_mscz(..., use_cache=False)` skips it
+for one call.
+"""
+
+from functools import lru_cache
+from typing import Any
+from enum import Enum
+import tempfile
+import hashlib
+import shutil
+import json
+import os
+
+from . import utils
+from .xml_backend import get_xml_backend
+
+CACHE_DIR_ENV_VAR = "MUSESCORE_PART_FORMATTER_CACHE_DIR"
+CACHE_MAX_BYTES_ENV_VAR = "MUSESCORE_PART_FORMATTER_CACHE_MAX_BYTES"
+DEFAULT_MAX_BYTES = 1 << 30
+
+ARCHIVE_SUFFIX = ".mscz"
+MEMBER_SUFFIX = ".mscx"
+
+
+def _package_version() -> str:
+    from importlib import metadata  # slow to import, only needed once the cache is used
+
+    try:
+        return metadata.version("musescore-part-formatter")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+@lru_cache(maxsize=1)
+def _style_templates_digest() -> str:
+    digest = hashlib.sha256()
+    for path in (
+        utils.BROADWAY_SCORE_STYLE_PATH,
+        utils.BROADWAY_PART_STYLE_PATH,
+        utils.JAZZ_SCORE_STYLE_PATH,
+        utils.JAZZ_PART_STYLE_PATH,
+    ):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _normalized(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def cache_key(input_path: str, params: dict[str, Any], **options: Any) -> str:
+    """
+    Key for formatting `input_path` with (prepped) `params`.
+    `options` are any other arguments that change the output (eg. streaming=True)
+    """
+    with open(input_path, "rb") as f:
+        input_digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return _key(input_digest, params, options)
+
+
+def member_cache_key(data: bytes, params: dict[str, Any], **options: Any) -> str:
+    """Key for formatting one .mscx member (see `cache_key()`), `options` should include is_part"""
+    return _key(hashlib.sha256(data).hexdigest(), params, options)
+
+
+def _key(input_digest: str, params: dict[str, Any], options: dict[str, Any]) -> str:
+    key = {
+        "input": input_digest,
+        "params": {name: _normalized(value) for name, value in params.items()},
+        "options": {name: _normalized(value) for name, value in options.items()},
+        "version": _package_version(),
+        "styles": _style_templates_digest(),
+        "xml_backend": get_xml_backend().name,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, suffix: str = ARCHIVE_SUFFIX) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key: str, output_path: str) -> bool:
+        """Copy the entry for `key` to `output_path`. Returns False if there isn't one"""
+        path = self._path(key)
+        try:
+            os.utime(path)  # mark as recently used
+            _copy_atomic(path, output_path)
+        except FileNotFoundError:  # never cached, or evicted (maybe by another process)
+            return False
+        return True
+
+    def put(self, key: str, result_path: str) -> None:
+        """Store a copy of `result_path` under `key`, then evict old entries if the cache is too big"""
+        _copy_atomic(result_path, self._path(key))
+        self.evict()
+
+    def get_member(self, key: str) -> bytes | None:
+        """Formatted contents of a .mscx member (see `member_cache_key()`), None if it isn't cached"""
+        path = self._path(key, MEMBER_SUFFIX)
+        try:
+            os.utime(path)
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_members(self, members: dict[str, bytes]) -> None:
+        """Store formatted .mscx members by key, then evict old entries if the cache is too big"""
+        for key, data in members.items():
+            _write_atomic(self._path(key, MEMBER_SUFFIX), data)
+        self.evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """(last used, size, path) of every entry, oldest first"""
+        res = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((ARCHIVE_SUFFIX, MEMBER_SUFFIX)):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            res.append((stat.st_mtime, stat.st_size, entry.path))
+        res.sort()
+        return res
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> None:
+        """Delete the least recently used entries until the cache fits in `max_bytes`"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _copy_atomic(src: str, dst: str) -> None:
+    """Copy through a temp file, so nobody ever sees half a file at `dst` (which gets the usual permissions)"""
+    fd, tmp_path = utils.mkstemp_for_output(os.path.dirname(os.path.abspath(dst)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            shutil.copyfileobj(f, out)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+_default_cache: ResultCache | None = None
+_default_cache_loaded = False
+
+
+def get_result_cache() -> ResultCache | None:
+    """The cache `format_mscz()` uses (from the environment variables unless `set_result_cache()` was called)"""
+    global _default_cache, _default_cache_loaded
+    if not _default_cache_loaded:
+        directory = os.environ.get(CACHE_DIR_ENV_VAR)
+        if directory:
+            max_bytes = int(os.environ.get(CACHE_MAX_BYTES_ENV_VAR) or DEFAULT_MAX_BYTES)
+            _default_cache = ResultCache(directory, max_bytes)
+        _default_cache_loaded = True
+    return _default_cache
+
+
+def set_result_cache(cache: ResultCache | None) -> None:
+    """Change the cache `format_mscz()` uses, None turns it off"""
+    global _default_cache, _default_cache_loaded
+    _default_cache = cache
+    _default_cache_loaded = True
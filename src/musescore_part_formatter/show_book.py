@@ -0,0 +1,196 @@
+"""
+Show-book mode: format every song in a show as one job, from a manifest
+
+Example:
+    python -m musescore_part_formatter.show_book show.json --output-dir book/ --max-workers 4
+
+The manifest holds the formatting params every song shares, and the songs (with anything that's different for them):
+    {
+        "show_title": "My Show",
+        "version_num": "1.0.0",
+        "selected_style": "broadway",
+        "songs": [
+            {"input": "01 Overture.mscz", "show_number": "1"},
+            {"input": "02 Opening.mscz", "show_number": "2", "num_lines_per_page": 7},
+            {"input": "02a Playoff.mscz", "show_number": "2A", "output": "02A Playoff.mscz"}
+        ]
+    }
+"songs" can also be a mapping of input -> overrides. A song without a show_number gets its (1 based) position.
+Relative inputs are relative to the manifest, outputs to --output-dir (default: the input's file name).
+
+Every song runs on one worker pool, with each worker's style cache warmed up before it starts. The songs' albumTitle /
+trackNum / versionNum are set from show_title / show_number / version_num, like `format_mscz()` does for one file.
+A summary manifest (`SUMMARY_FILENAME`) is written to --output-dir at the end, with a row per song in manifest order.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+from typing import Any, Iterator
+
+from .utils import FormattingParams, Style
+from .batch import BatchFileResult, _format_one
+from .main import prep_formatting_params
+from .parallel import make_executor, map_unordered
+
+SUMMARY_FILENAME = "show-book.json"
+
+# manifest keys that aren't formatting params
+SONG_KEYS = ("input", "output")
+# formatting params that end up as text in the score, a manifest can have them as numbers (eg. "show_number": 3)
+TEXT_PARAMS = ("selected_style", "show_title", "show_number", "version_num")
+
+
+class ShowSongResult(BatchFileResult):
+    show_number: str
+    show_title: str
+
+
+def load_manifest(manifest_path: str) -> dict[str, Any]:
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _songs(manifest: dict[str, Any]) -> list[dict[str, Any]]:
+    songs = manifest.get("songs")
+    if isinstance(songs, dict):
+        songs = [{"input": input_path, **(overrides or {})} for input_path, overrides in songs.items()]
+    if not songs:
+        raise ValueError("The manifest doesn't have any songs")
+    for song in songs:
+        if not song.get("input"):
+            raise ValueError(f"Song without an input in the manifest: {song}")
+    return songs
+
+
+def _plan_songs(manifest: dict[str, Any], output_dir: str, base_dir: str = ".") -> list[tuple[str, str, dict[str, Any]]]:
+    """(input path, output path, params as given) for every song in the manifest, in manifest order"""
+    shared = {name: value for name, value in manifest.items() if name != "songs"}
+    songs = []
+    outputs = set()
+    for position, song in enumerate(_songs(manifest), start=1):
+        params = {"show_number": str(position), **shared}
+        params.update((name, value) for name, value in song.items() if name not in SONG_KEYS)
+        params.update((name, str(params[name])) for name in TEXT_PARAMS if params.get(name) is not None)
+
+        input_path = os.path.join(base_dir, song["input"])
+        output_path = os.path.join(output_dir, song.get("output") or os.path.basename(song["input"]))
+        if os.path.abspath(output_path) in outputs:
+            raise ValueError(f"More than one song would be written to {output_path}")
+        outputs.add(os.path.abspath(output_path))
+        songs.append((input_path, output_path, params))
+    return songs
+
+
+def plan_show(
+    manifest: dict[str, Any], output_dir: str, base_dir: str = ".", predict: bool = False
+) -> list[tuple[str, str, FormattingParams]]:
+    """(input path, output path, prepped params) for every song in the manifest, in manifest order"""
+    return [
+        (input_path, output_path, prep_formatting_params(params, predict))
+        for input_path, output_path, params in _plan_songs(manifest, output_dir, base_dir)
+    ]
+
+
+def _format_song(
+    input_path: str, output_path: str, params: FormattingParams, predict_from: dict[str, Any] | None = None
+) -> ShowSongResult:
+    result = _format_one(input_path, output_path, params, predict_from)
+    return {**result, "show_number": params["show_number"], "show_title": params["show_title"]}
+
+
+def format_show(
+    manifest: dict[str, Any],
+    output_dir: str,
+    base_dir: str = ".",
+    predict: bool = False,
+    max_workers: int | None = None,
+) -> Iterator[ShowSongResult]:
+    """
+    Format every song in `manifest` (see the module docstring) into `output_dir`.
+    Yields one result per song as they finish. A song failing doesn't stop the rest of the show.
+
+    With `predict`, the layout params that neither the song nor the show sets are predicted for each song
+    (see `main.format_mscz()`).
+
+    max_workers=1 runs everything in this process, otherwise songs are spread over a pool
+    (default size: number of CPUs)
+    """
+    jobs = [
+        (input_path, output_path, prep_formatting_params(params, predict), params if predict else None)
+        for input_path, output_path, params in _plan_songs(manifest, output_dir, base_dir)
+    ]
+
+    if max_workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield _format_song(*job)
+        return
+
+    from .formatting import warm_style_cache  # only needed once there's a pool to warm up
+
+    styles = {Style(params["selected_style"]) for _, _, params, _ in jobs}
+    with make_executor(max_workers, initializer=partial(warm_style_cache, styles)) as executor:
+        max_pending = 2 * (max_workers or os.cpu_count() or 1)
+        yield from map_unordered(executor, _format_song, jobs, max_pending)
+
+
+def summarize_show(
+    manifest: dict[str, Any], results: list[ShowSongResult], seconds: float, base_dir: str = "."
+) -> dict:
+    """Summary manifest: the shared params, then a row per song (in manifest order)"""
+    order = {os.path.join(base_dir, song["input"]): i for i, song in enumerate(_songs(manifest))}
+    results = sorted(results, key=lambda r: order.get(r["input"], len(order)))
+    failed = [r for r in results if not r["ok"]]
+    return {
+        "show": {name: value for name, value in manifest.items() if name != "songs"},
+        "total": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "seconds": round(seconds, 4),
+        "songs": results,
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Format every song in a show (a manifest of .mscz files).")
+    parser.add_argument("manifest", help="Show manifest (JSON)")
+    parser.add_argument("--output-dir", required=True, help="Directory to write formatted songs to")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Number of songs to format at once (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--predict", action="store_true", help="Predict the formatting params the manifest doesn't set"
+    )
+    args = parser.parse_args(argv)
+
+    manifest = load_manifest(args.manifest)
+    base_dir = os.path.dirname(args.manifest)
+
+    start = time.perf_counter()
+    results = []
+    for result in format_show(
+        manifest, args.output_dir, base_dir, predict=args.predict, max_workers=args.max_workers
+    ):
+        results.append(result)
+        if result["ok"]:
+            print(f"✅ {result['show_number']} {result['input']} ({result['seconds']}s)", file=sys.stderr)
+        else:
+            print(f"❌ {result['show_number']} {result['input']}: {result['error']}", file=sys.stderr)
+
+    summary = summarize_show(manifest, results, time.perf_counter() - start, base_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, SUMMARY_FILENAME), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
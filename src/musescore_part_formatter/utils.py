@@ -1,12 +1,15 @@
 # Utils file contains barebones definitions
 # Like adding page breaks and adding styles and stuff that is not logic based
 
-from typing import TypedDict
+from typing import TypedDict, NotRequired, TYPE_CHECKING
 from enum import Enum
 import xml.etree.ElementTree as ET
+import os
 
-import importlib.resources as resources
-from pathlib import Path
+if TYPE_CHECKING:
+    from pathlib import Path
+
+from .instrumentation import count
 
 from logging import getLogger
 
@@ -19,19 +22,45 @@ NUM_LINES_PER_PAGE = 8
 CONDUCTOR_SCORE_PART_NAME = "CONDUCTOR SCORE"
 
 
-def get_resource_path(filename: str) -> Path:
+def mkstemp_for_output(dir: str, suffix: str = "") -> tuple[int, str]:
+    """
+    Like `tempfile.mkstemp()`, for a temp file that gets moved into place as an output: it's created with the
+    permissions a plain `open()` would give it (0o666 minus the umask) instead of mkstemp's 0o600
+    """
+    flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    for _ in range(100):
+        path = os.path.join(dir, f"tmp{os.urandom(6).hex()}{suffix}")
+        try:
+            return os.open(path, flags, 0o666), path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No unused temp file name found in {dir}")
+
+
+def get_resource_path(filename: str) -> "Path":
     """
     Returns a filesystem path to a resource inside musescore_part_formatter/resources.
     Works both when installed and in editable/development mode.
     """
+    import importlib.resources as resources  # slow to import, and only needed once a style gets written
+
     return resources.files("musescore_part_formatter.resources").joinpath(filename)
 
 
-# Define constants as resource paths
-BROADWAY_SCORE_STYLE_PATH = get_resource_path("broadway_score.mss")
-BROADWAY_PART_STYLE_PATH = get_resource_path("broadway_part.mss")
-JAZZ_SCORE_STYLE_PATH = get_resource_path("jazz_score.mss")
-JAZZ_PART_STYLE_PATH = get_resource_path("jazz_part.mss")
+# Resource path constants, looked up the first time they're used (see __getattr__ below)
+_RESOURCE_FILENAMES = {
+    "BROADWAY_SCORE_STYLE_PATH": "broadway_score.mss",
+    "BROADWAY_PART_STYLE_PATH": "broadway_part.mss",
+    "JAZZ_SCORE_STYLE_PATH": "jazz_score.mss",
+    "JAZZ_PART_STYLE_PATH": "jazz_part.mss",
+}
+
+
+def __getattr__(name: str) -> "Path":
+    if name in _RESOURCE_FILENAMES:
+        path = globals()[name] = get_resource_path(_RESOURCE_FILENAMES[name])
+        return path
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Style(Enum):
@@ -39,6 +68,21 @@ class Style(Enum):
     JAZZ = "jazz"
 
 
+class LayoutEngine(Enum):
+    FUSED = "fused"  # single pass, see layout.py
+    REFERENCE = "reference"  # one pass per rule, see formatting.py
+
+
+class LinePlanner(Enum):
+    GREEDY = "greedy"  # count to measures_per_line, then fix up short lines, see formatting.add_regular_line_breaks()
+    OPTIMAL = "optimal"  # lowest cost line breaks per section, see optimal_layout.py
+
+
+class PagePlanner(Enum):
+    GREEDY = "greedy"  # count lines, then look around for a better spot, see formatting.new_add_page_breaks()
+    OPTIMAL = "optimal"  # lowest cost set of page breaks, see optimal_layout.py
+
+
 class FormattingParams(TypedDict):
     selected_style: str | Style
     show_title: str
@@ -47,6 +91,9 @@ class FormattingParams(TypedDict):
     num_measures_per_line_score: int
     num_measures_per_line_part: int
     num_lines_per_page: int
+    layout_engine: NotRequired[str | LayoutEngine]
+    line_planner: NotRequired[str | LinePlanner]
+    page_planner: NotRequired[str | PagePlanner]
 
 
 LOGGER = getLogger("PartFormatter")
@@ -54,53 +101,56 @@ LOGGER = getLogger("PartFormatter")
 # HELPER FNS
 
 
-def _make_show_number_text(show_number: str) -> ET.Element:
-    txt = ET.Element("Text")
-    style = ET.SubElement(txt, "style")
-    style.text = "user_2"
-    text = ET.SubElement(txt, "text")
-    text.text = show_number
-    return txt
+def _new_element(parent: ET.Element, tag: str) -> ET.Element:
+    """
+    New element made by the same XML backend as `parent` (ElementTree or lxml, see xml_backend.py)
+    Elements from one can't be added to a tree from the other.
+    """
+    return parent.makeelement(tag, {})
 
 
-def _make_show_title_text(show_title: str) -> ET.Element:
-    txt = ET.Element("Text")
-    style = ET.SubElement(txt, "style")
-    style.text = "user_3"
-    text = ET.SubElement(txt, "text")
-    text.text = show_title
-    return txt
+def _sub_element(parent: ET.Element, tag: str, text: str | None = None) -> ET.Element:
+    child = _new_element(parent, tag)
+    child.text = text
+    parent.append(child)
+    return child
 
 
-def _make_part_name_text(part_name: str) -> ET.Element:
-    txt = ET.Element("Text")
-    style = ET.SubElement(txt, "style")
-    style.text = "instrument_excerpt"
-    text = ET.SubElement(txt, "text")
-    text.text = part_name
+def _make_text(parent: ET.Element, style_name: str, value: str) -> ET.Element:
+    txt = _new_element(parent, "Text")
+    _sub_element(txt, "style", style_name)
+    _sub_element(txt, "text", value)
     return txt
 
 
-def _make_line_break() -> ET.Element:
-    lb = ET.Element("LayoutBreak")
-    subtype = ET.SubElement(lb, "subtype")
-    subtype.text = "line"
+def _make_show_number_text(parent: ET.Element, show_number: str) -> ET.Element:
+    return _make_text(parent, "user_2", show_number)
+
+
+def _make_show_title_text(parent: ET.Element, show_title: str) -> ET.Element:
+    return _make_text(parent, "user_3", show_title)
+
+
+def _make_part_name_text(parent: ET.Element, part_name: str) -> ET.Element:
+    return _make_text(parent, "instrument_excerpt", part_name)
+
+
+def _make_line_break(parent: ET.Element) -> ET.Element:
+    lb = _new_element(parent, "LayoutBreak")
+    _sub_element(lb, "subtype", "line")
     return lb
 
 
-def _make_page_break() -> ET.Element:
-    pb = ET.Element("LayoutBreak")
-    subtype = ET.SubElement(pb, "subtype")
-    subtype.text = "page"
+def _make_page_break(parent: ET.Element) -> ET.Element:
+    pb = _new_element(parent, "LayoutBreak")
+    _sub_element(pb, "subtype", "page")
     return pb
 
 
-def _make_double_bar() -> ET.Element:
-    db = ET.Element("BarLine")
-    subtype = ET.SubElement(db, "subtype")
-    subtype.text = "double"
-    linked = ET.SubElement(db, "Linked")
-    linked.text = "\n"
+def _make_double_bar(parent: ET.Element) -> ET.Element:
+    db = _new_element(parent, "BarLine")
+    _sub_element(db, "subtype", "double")
+    _sub_element(db, "Linked", "\n")
     return db
 
 
@@ -110,7 +160,8 @@ def _add_line_break_to_measure(measure: ET.Element) -> None:
         if elem.tag == "voice":
             break
         index += 1
-    measure.insert(index, _make_line_break())
+    measure.insert(index, _make_line_break(measure))
+    count("line_breaks_added")
 
 
 def _measure_has_line_break(measure: ET.Element) -> bool:
@@ -126,8 +177,11 @@ def _add_page_break_to_measure(measure: ET.Element) -> None:
     # if line break already there, replace with a page break
     if measure.find("LayoutBreak") is not None:
         measure.find("LayoutBreak").find("subtype").text = "page"
+        count("line_breaks_to_page_breaks")
         return
 
+    count("page_breaks_added")
+
     LOGGER.warning("added a page break to a bar that did not have a line break!")
     index = 0
     for elem in measure:
@@ -135,12 +189,12 @@ def _add_page_break_to_measure(measure: ET.Element) -> None:
             break
         index += 1
 
-    measure.insert(index, _make_page_break())
+    measure.insert(index, _make_page_break(measure))
 
 
 def _add_double_bar_to_measure(measure: ET.Element) -> None:
     # Add the double bar as the very last tag in the measure
-    measure.append(_make_double_bar())
+    measure.append(_make_double_bar(measure))
 
 
 def _measure_has_double_bar(measure: ET.Element) -> bool:
@@ -167,7 +221,7 @@ def set_score_properties(score, properties):
         if tag is not None:
             tag.text = v
         else:
-            new_tag = ET.Element("metaTag")
+            new_tag = _new_element(score, "metaTag")
             new_tag.set("name", k)
             new_tag.text = v
             score.insert(insert_index, new_tag)
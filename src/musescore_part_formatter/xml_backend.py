@@ -0,0 +1,147 @@
+"""
+XML backends for reading and writing mscx files.
+
+lxml is used when it is installed (parsing and serializing are a lot faster, see benchmarks/xml_backend.py),
+otherwise the standard library's xml.etree.ElementTree. Both give back ElementTree style trees, so the rest of the code
+doesn't care which one it gets (just make new elements with `utils._new_element()`, not ET.Element()).
+
+To force one, set the MUSESCORE_PART_FORMATTER_XML_BACKEND environment variable to "stdlib" or "lxml",
+or call `set_xml_backend()`.
+"""
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+import io
+import os
+import xml.etree.ElementTree as ET
+
+XML_BACKEND_ENV_VAR = "MUSESCORE_PART_FORMATTER_XML_BACKEND"
+
+
+@lru_cache(maxsize=1)
+def _lxml_etree():
+    """lxml.etree, or None if it isn't installed. Imported the first time a backend is picked, it's slow to import"""
+    try:
+        from lxml import etree
+    except ImportError:  # optional dependency: pip install musescore-part-formatter[lxml]
+        return None
+    return etree
+
+
+class XMLBackend(ABC):
+    name = ""
+
+    @abstractmethod
+    def parse(self, path: str):
+        """Parse a file, returns an ElementTree"""
+
+    @abstractmethod
+    def fromstring(self, data: bytes):
+        """Parse a document held in memory, returns an ElementTree"""
+
+    @abstractmethod
+    def tostring(self, tree) -> bytes:
+        """Indent + serialize a whole document (with the xml declaration)"""
+
+    @abstractmethod
+    def element_tostring(self, elem, level: int | None = None) -> bytes:
+        """
+        Serialize one element (without its tail or an xml declaration).
+        If `level` is given, its contents are indented as if it were that deep in the document
+        """
+
+
+class StdlibBackend(XMLBackend):
+    name = "stdlib"
+
+    def parse(self, path: str) -> ET.ElementTree:
+        return ET.parse(path, ET.XMLParser())
+
+    def fromstring(self, data: bytes) -> ET.ElementTree:
+        return ET.ElementTree(ET.fromstring(data))
+
+    def tostring(self, tree: ET.ElementTree) -> bytes:
+        ET.indent(tree, space="  ", level=0)
+        buffer = io.BytesIO()
+        tree.write(buffer, encoding="utf-8", xml_declaration=True)
+        return buffer.getvalue()
+
+    def element_tostring(self, elem: ET.Element, level: int | None = None) -> bytes:
+        if level is not None:
+            ET.indent(elem, space="  ", level=level)
+        tail, elem.tail = elem.tail, None
+        try:
+            return ET.tostring(elem, encoding="utf-8")
+        finally:
+            elem.tail = tail
+
+
+class LxmlBackend(XMLBackend):
+    name = "lxml"
+
+    def __init__(self):
+        if _lxml_etree() is None:
+            raise ImportError("lxml is not installed")
+
+    @property
+    def etree(self):
+        return _lxml_etree()
+
+    def _parser(self):
+        # scores can be big, and never need external entities
+        return self.etree.XMLParser(huge_tree=True, resolve_entities=False, no_network=True)
+
+    def parse(self, path: str):
+        return self.etree.parse(path, self._parser())
+
+    def fromstring(self, data: bytes):
+        return self.etree.fromstring(data, self._parser()).getroottree()
+
+    def tostring(self, tree) -> bytes:
+        self.etree.indent(tree, space="  ", level=0)
+        return self.etree.tostring(tree, encoding="utf-8", xml_declaration=True)
+
+    def element_tostring(self, elem, level: int | None = None) -> bytes:
+        if level is not None:
+            self.etree.indent(elem, space="  ", level=level)
+        return self.etree.tostring(elem, encoding="utf-8", xml_declaration=False, with_tail=False)
+
+
+_BACKENDS = {
+    StdlibBackend.name: StdlibBackend,
+    LxmlBackend.name: LxmlBackend,
+}
+
+_default_backend: XMLBackend | None = None
+
+
+def available_xml_backends() -> list[str]:
+    return [name for name in _BACKENDS if name != LxmlBackend.name or _lxml_etree() is not None]
+
+
+def get_xml_backend(name: str | None = None) -> XMLBackend:
+    """
+    Get a backend by name, or the default one:
+    the environment variable if set, otherwise lxml if it's installed, otherwise the stdlib
+    """
+    global _default_backend
+    if name is not None:
+        if name not in _BACKENDS:
+            raise ValueError(f"Unsupported XML backend: {name}")
+        return _BACKENDS[name]()
+
+    if _default_backend is None:
+        env_name = os.environ.get(XML_BACKEND_ENV_VAR)
+        if env_name:
+            _default_backend = get_xml_backend(env_name)
+        elif _lxml_etree() is not None:
+            _default_backend = LxmlBackend()
+        else:
+            _default_backend = StdlibBackend()
+    return _default_backend
+
+
+def set_xml_backend(name: str | None) -> None:
+    """Change the default backend (None goes back to picking one automatically)"""
+    global _default_backend
+    _default_backend = None if name is None else get_xml_backend(name)
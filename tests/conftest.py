@@ -1,6 +1,9 @@
 import pytest
 import os
 import shutil
+import stat
+import tempfile
+import zipfile
 
 # =======================
 # Test Constants
@@ -9,6 +12,25 @@ import shutil
 OUTPUT_DIRECTORY = "tests/processing"
 
 
+def pytest_addoption(parser):
+    parser.addoption(
+        "--timing", action="store_true", help="Also run the wall clock tests (marked timing), flaky on a busy machine"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "timing: wall clock limits, only run with --timing")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--timing"):
+        return
+    skip = pytest.mark.skip(reason="wall clock test, run with --timing")
+    for item in items:
+        if "timing" in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.fixture(scope="module", autouse=True)
 def cleanup_processed_scores():
     #Before all tests run
@@ -18,4 +40,39 @@ def cleanup_processed_scores():
 
     #After all tests run
     # clean up temp-processed directory
-    shutil.rmtree(OUTPUT_DIRECTORY)
\ No newline at end of file
+    shutil.rmtree(OUTPUT_DIRECTORY)
+
+
+@pytest.fixture
+def workdir():
+    """A temp directory, removed after the test"""
+    with tempfile.TemporaryDirectory() as workdir:
+        yield workdir
+
+
+@pytest.fixture
+def umask_022():
+    """Run the test with a 022 umask, so new files are 0o644"""
+    previous = os.umask(0o022)
+    yield
+    os.umask(previous)
+
+
+# =======================
+# Helpers (import them with `from conftest import ...`)
+# =======================
+
+
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def mscx_members(path: str) -> dict[str, bytes]:
+    """Contents of every .mscx in a .mscz, by member name"""
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name) for name in z.namelist() if name.endswith(".mscx")}
+
+
+def file_mode(path: str) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
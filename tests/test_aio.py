@@ -0,0 +1,126 @@
+import pytest
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from musescore_part_formatter import aio, format_mscz
+from musescore_part_formatter.aio import AsyncFormatter
+from musescore_part_formatter.main import get_score_attributes
+from conftest import file_mode, read_bytes
+
+MUSESCORE_PATH = "tests/test-data/New-Test-Score.mscz"
+
+PARAMS = {"selected_style": "broadway", "show_title": "TEST Show", "show_number": "1"}
+
+
+def test_async_matches_sync(workdir):
+    expected_path = os.path.join(workdir, "expected.mscz")
+    assert format_mscz(MUSESCORE_PATH, expected_path, PARAMS, use_cache=False)
+
+    async def run():
+        async with AsyncFormatter(ThreadPoolExecutor(2)) as formatter:
+            outputs = [os.path.join(workdir, f"{i}.mscz") for i in range(3)]
+            results = await asyncio.gather(
+                *(formatter.format_mscz(MUSESCORE_PATH, path, PARAMS, use_cache=False) for path in outputs)
+            )
+            info = await formatter.get_score_attributes(outputs[0])
+        return outputs, results, info
+
+    outputs, results, info = asyncio.run(run())
+    assert results == [True, True, True]
+    for path in outputs:
+        assert read_bytes(path) == read_bytes(expected_path)
+    assert info == get_score_attributes(expected_path)
+    assert sorted(os.listdir(workdir)) == ["0.mscz", "1.mscz", "2.mscz", "expected.mscz"], "no temp files left"
+
+
+def test_max_concurrency():
+    running = 0
+    most_running = 0
+    lock = threading.Lock()
+
+    def job():
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    async def run():
+        async with AsyncFormatter(ThreadPoolExecutor(8), max_concurrency=2) as formatter:
+            await asyncio.gather(*(formatter._run(job) for _ in range(8)))
+
+    asyncio.run(run())
+    assert most_running == 2
+
+
+def test_cancel_running_format(workdir, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_format_mscz(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return format_mscz(*args, **kwargs)
+
+    monkeypatch.setattr(aio, "format_mscz", slow_format_mscz)
+    output_path = os.path.join(workdir, "out.mscz")
+    executor = ThreadPoolExecutor(1)
+
+    async def run():
+        formatter = AsyncFormatter(executor, max_concurrency=1)
+        running = asyncio.create_task(formatter.format_mscz(MUSESCORE_PATH, output_path, PARAMS))
+        queued = asyncio.create_task(formatter.format_mscz(MUSESCORE_PATH, output_path, PARAMS))
+        await asyncio.to_thread(started.wait, 5)
+
+        running.cancel()
+        queued.cancel()
+        for task in (running, queued):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(run())
+    release.set()
+    executor.shutdown()
+    assert os.listdir(workdir) == [], "cancelled output (and its temp file) shouldn't be left behind"
+
+
+def test_file_system_calls_off_the_loop(workdir, monkeypatch):
+    threads = {}
+
+    def record(name, fn):
+        def wrapper(*args, **kwargs):
+            threads.setdefault(name, set()).add(threading.get_ident())
+            return fn(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(aio, "mkstemp_for_output", record("mkstemp", aio.mkstemp_for_output))
+    monkeypatch.setattr(aio.os, "replace", record("replace", aio.os.replace))
+    output_path = os.path.join(workdir, "out.mscz")
+
+    async def run():
+        async with AsyncFormatter(ThreadPoolExecutor(1)) as formatter:
+            assert await formatter.format_mscz(MUSESCORE_PATH, output_path, PARAMS, use_cache=False)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert set(threads) == {"mkstemp", "replace"}
+    assert all(loop_thread not in idents for idents in threads.values())
+    assert os.listdir(workdir) == ["out.mscz"]
+
+
+def test_output_file_mode(workdir, umask_022):
+    expected_path = os.path.join(workdir, "expected.mscz")
+    output_path = os.path.join(workdir, "out.mscz")
+    assert format_mscz(MUSESCORE_PATH, expected_path, PARAMS, use_cache=False)
+
+    async def run():
+        async with AsyncFormatter(ThreadPoolExecutor(1)) as formatter:
+            assert await formatter.format_mscz(MUSESCORE_PATH, output_path, PARAMS, use_cache=False)
+
+    asyncio.run(run())
+    assert file_mode(output_path) == file_mode(expected_path) == 0o644
@@ -0,0 +1,198 @@
+import pytest
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+import csv
+
+from musescore_part_formatter.batch import collect_inputs, format_batch, inspect_batch, stamp_batch, main
+from musescore_part_formatter.main import get_score_attributes, format_mscz
+from musescore_part_formatter.formatting import clear_style_cache
+from musescore_part_formatter.estimating_formatting_params import predict_layout_params
+from conftest import mscx_members
+
+PARAMS = {
+    "selected_style": "broadway",
+    "show_title": "TEST Show",
+    "show_number": "1",
+    "version_num": "1.0.0",
+}
+
+
+@pytest.fixture
+def score_dir():
+    """A small library: two scores at the top level, one in a sub directory, and a broken file"""
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "act-2"))
+        shutil.copy("tests/test-data/Test-Parts-NMPL.mscz", workdir)
+        shutil.copy("tests/test-data/TEST_mm_rests.mscz", workdir)
+        shutil.copy("tests/test-data/Test-Score.mscz", os.path.join(workdir, "act-2"))
+        with open(os.path.join(workdir, "act-2", "broken.mscz"), "w") as f:
+            f.write("not a zip file")
+        yield workdir
+
+
+def test_collect_inputs(score_dir):
+    res = collect_inputs(
+        [score_dir, os.path.join(score_dir, "*.mscz"), os.path.join(score_dir, "act-2", "Test-Score.mscz")]
+    )
+    rel_paths = sorted(rel for _, rel in res)
+    assert rel_paths == [
+        "TEST_mm_rests.mscz",
+        "Test-Parts-NMPL.mscz",
+        os.path.join("act-2", "Test-Score.mscz"),
+        os.path.join("act-2", "broken.mscz"),
+    ]
+
+
+@pytest.mark.parametrize("max_workers", (1, 2))
+def test_format_batch(score_dir, max_workers):
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = list(format_batch([score_dir], output_dir, PARAMS, max_workers=max_workers))
+        by_name = {os.path.basename(r["input"]): r for r in results}
+
+        assert len(results) == 4
+        assert not by_name["broken.mscz"]["ok"]
+        assert "BadZipFile" in by_name["broken.mscz"]["error"]
+
+        for name in ("Test-Parts-NMPL.mscz", "TEST_mm_rests.mscz", "Test-Score.mscz"):
+            assert by_name[name]["ok"], by_name[name]
+            assert zipfile.is_zipfile(by_name[name]["output"])
+        assert by_name["Test-Score.mscz"]["output"] == os.path.join(output_dir, "act-2", "Test-Score.mscz")
+
+
+@pytest.mark.parametrize("max_workers", (1, 2))
+def test_format_batch_predict(score_dir, max_workers):
+    input_path = os.path.join(score_dir, "TEST_mm_rests.mscz")
+    with tempfile.TemporaryDirectory() as output_dir:
+        (result,) = format_batch([input_path], output_dir, PARAMS, predict=True, max_workers=max_workers)
+        assert result["ok"], result
+
+        expected_path = os.path.join(output_dir, "expected.mscz")
+        params = {**PARAMS, **predict_layout_params(input_path, (8, 7))}
+        assert format_mscz(input_path, expected_path, params, use_cache=False)
+        assert mscx_members(result["output"]) == mscx_members(expected_path)
+
+
+def test_format_batch_duplicate_outputs(score_dir):
+    shutil.copy(os.path.join(score_dir, "act-2", "Test-Score.mscz"), os.path.join(score_dir, "Test-Score.mscz"))
+    inputs = [os.path.join(score_dir, "Test-Score.mscz"), os.path.join(score_dir, "act-2", "Test-Score.mscz")]
+    with tempfile.TemporaryDirectory() as output_dir:
+        with pytest.raises(ValueError, match="Test-Score.mscz"):
+            list(format_batch(inputs, output_dir, PARAMS))
+        assert os.listdir(output_dir) == []
+
+        with pytest.raises(SystemExit) as e:
+            main(["format", *inputs, "--output-dir", output_dir])
+        assert e.value.code == 2
+        with pytest.raises(ValueError):
+            list(stamp_batch(inputs, {"composer": "x"}, output_dir))
+
+
+def test_batch_cli_summary(score_dir):
+    with tempfile.TemporaryDirectory() as output_dir:
+        summary_path = os.path.join(output_dir, "summary.json")
+        with pytest.raises(SystemExit) as e:
+            main(["format", score_dir, "--output-dir", output_dir, "--summary", summary_path, "--max-workers", "2"])
+        assert e.value.code == 1  # broken.mscz failed
+
+        with open(summary_path) as f:
+            summary = json.load(f)
+        assert summary["total"] == 4
+        assert summary["succeeded"] == 3
+        assert summary["failed"] == 1
+        assert all("seconds" in r for r in summary["files"])
+
+
+def test_batch_cli_summary_stdout(score_dir, capfd):
+    clear_style_cache()  # so the styles get rendered (again) while formatting
+    with tempfile.TemporaryDirectory() as output_dir:
+        with pytest.raises(SystemExit):
+            main(["format", score_dir, "--output-dir", output_dir, "--max-workers", "2"])
+
+    # nothing else (including from the workers) ends up in the JSON summary
+    summary = json.loads(capfd.readouterr().out)
+    assert summary["total"] == 4
+    assert summary["succeeded"] == 3
+
+
+@pytest.mark.parametrize("max_workers", (1, 2))
+def test_inspect_batch(score_dir, max_workers):
+    results = list(inspect_batch([score_dir], max_workers=max_workers))
+    by_name = {os.path.basename(r["input"]): r for r in results}
+
+    assert len(results) == 4
+    assert not by_name["broken.mscz"]["ok"]
+    assert by_name["broken.mscz"]["info"] is None
+    assert "BadZipFile" in by_name["broken.mscz"]["error"]
+
+    for name in ("Test-Parts-NMPL.mscz", "TEST_mm_rests.mscz", "Test-Score.mscz"):
+        result = by_name[name]
+        assert result["ok"] and result["error"] is None
+        assert result["info"] == get_score_attributes(result["input"])
+
+
+@pytest.mark.parametrize("output_format", ("jsonl", "csv"))
+def test_batch_cli_inspect(score_dir, output_format):
+    output_path = os.path.join(score_dir, f"library.{output_format}")
+    with pytest.raises(SystemExit) as e:
+        main(["inspect", score_dir, "--format", output_format, "--output", output_path, "--max-workers", "2"])
+    assert e.value.code == 1  # broken.mscz failed
+
+    with open(output_path, newline="") as f:
+        if output_format == "jsonl":
+            rows = [json.loads(line) for line in f]
+        else:
+            rows = list(csv.DictReader(f))
+    by_name = {os.path.basename(r["input"]): r for r in rows}
+    assert len(rows) == 4
+
+    score_path = os.path.join(score_dir, "act-2", "Test-Score.mscz")
+    if output_format == "jsonl":
+        assert by_name["Test-Score.mscz"]["info"] == get_score_attributes(score_path)
+        assert by_name["broken.mscz"]["ok"] is False
+    else:
+        assert by_name["Test-Score.mscz"]["title"] == "Test Score"
+        assert by_name["Test-Score.mscz"]["num_staves"] == "6"
+        assert by_name["Test-Score.mscz"]["time_signatures"] == "4/4"
+        assert by_name["broken.mscz"]["ok"] == "False"
+        assert "BadZipFile" in by_name["broken.mscz"]["error"]
+
+
+@pytest.mark.parametrize("max_workers", (1, 2))
+def test_stamp_batch(score_dir, max_workers):
+    properties = {"composer": "Someone Else", "meta_composer": "Someone Else"}
+    results = list(stamp_batch([score_dir], properties, max_workers=max_workers))
+    by_name = {os.path.basename(r["input"]): r for r in results}
+
+    assert len(results) == 4
+    assert not by_name["broken.mscz"]["ok"]
+    assert "BadZipFile" in by_name["broken.mscz"]["error"]
+
+    for name in ("Test-Parts-NMPL.mscz", "TEST_mm_rests.mscz", "Test-Score.mscz"):
+        result = by_name[name]
+        assert result["ok"] and result["output"] == result["input"]
+        assert result["changed"]
+        info = get_score_attributes(result["input"])
+        assert info["meta_composer"] == "Someone Else"
+
+
+def test_batch_cli_stamp(score_dir):
+    with tempfile.TemporaryDirectory() as output_dir:
+        summary_path = os.path.join(output_dir, "summary.json")
+        pattern = os.path.join(score_dir, "*.mscz")
+        main(["stamp", pattern, "--set", "title=New Title", "--output-dir", output_dir, "--summary", summary_path])
+
+        with open(summary_path) as f:
+            summary = json.load(f)
+        assert summary["total"] == summary["succeeded"] == 2
+        for result in summary["files"]:
+            info = get_score_attributes(os.path.join(output_dir, os.path.basename(result["input"])))
+            assert info["title"] == "New Title"
+
+
+def test_batch_cli_stamp_bad_property(score_dir):
+    with pytest.raises(SystemExit) as e:
+        main(["stamp", score_dir, "--set", "num_staves=3"])
+    assert e.value.code == 2
@@ -0,0 +1,104 @@
+import pytest
+import json
+import os
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+from benchmarks.suite import compare, run_scenario
+from benchmarks.synthetic import SyntheticScoreSpec, write_synthetic_mscz
+from musescore_part_formatter.main import format_mscz, get_score_attributes
+
+SPEC = SyntheticScoreSpec(
+    num_measures=48, num_parts=2, mm_rest_density=0.5, rehearsal_every=8, time_sig_change_every=12, seed=1
+)
+
+
+def _staves(path: str) -> dict[str, ET.Element]:
+    """member name -> last <Staff> (the one with the measures of the last part), of every mscx in a mscz"""
+    with zipfile.ZipFile(path) as z:
+        return {
+            name: ET.fromstring(z.read(name)).find("Score").findall("Staff")[-1]
+            for name in z.namelist()
+            if name.endswith(".mscx")
+        }
+
+
+@pytest.fixture
+def synthetic_mscz():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "synthetic.mscz")
+        write_synthetic_mscz(path, SPEC)
+        yield path
+
+
+def test_synthetic_score(synthetic_mscz):
+    staves = _staves(synthetic_mscz)
+    assert len(staves) == 1 + SPEC.num_parts
+
+    for name, staff in staves.items():
+        measures = staff.findall("Measure")
+        assert len(measures) == SPEC.num_measures, name
+
+        marks = [i for i, measure in enumerate(measures) if measure.find("voice/RehearsalMark") is not None]
+        assert marks == list(range(SPEC.rehearsal_every, SPEC.num_measures, SPEC.rehearsal_every)), name
+        for i in marks:  # with a double bar before each one
+            assert measures[i - 1].find("voice/BarLine/subtype").text == "double", name
+
+        time_sigs = [i for i, measure in enumerate(measures) if measure.find("voice/TimeSig") is not None]
+        assert time_sigs == list(range(0, SPEC.num_measures, SPEC.time_sig_change_every)), name
+
+        mm_rests = [int(mm.text) for mm in staff.findall("Measure/multiMeasureRest")]
+        if "Excerpts" in name:
+            assert mm_rests and all(length >= 2 for length in mm_rests), name
+        else:
+            assert mm_rests == [], "only the parts get multimeasure rests"
+
+    attributes = get_score_attributes(synthetic_mscz)
+    assert attributes["title"] == "Synthetic Score"
+    assert attributes["num_instruments"] == SPEC.num_parts
+    assert attributes["time_signatures"] == ["4/4", "3/4", "6/8", "2/2"]
+
+
+def test_synthetic_score_without_extras():
+    spec = SyntheticScoreSpec(num_measures=32, num_parts=1, mm_rest_density=0, rehearsal_every=0)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "synthetic.mscz")
+        write_synthetic_mscz(path, spec)
+        for staff in _staves(path).values():
+            assert staff.find("Measure/multiMeasureRest") is None
+            assert staff.find("Measure/voice/RehearsalMark") is None
+        assert get_score_attributes(path)["time_signatures"] == ["4/4"]
+
+
+def test_format_synthetic_score(synthetic_mscz):
+    output_path = os.path.join(os.path.dirname(synthetic_mscz), "formatted.mscz")
+    assert format_mscz(synthetic_mscz, output_path, {"show_title": "Benchmark Show"}, use_cache=False)
+
+    assert get_score_attributes(output_path)["time_signatures"] == get_score_attributes(synthetic_mscz)["time_signatures"]
+    for name, staff in _staves(output_path).items():
+        if "Excerpts" not in name:  # only the parts get layout breaks
+            continue
+        subtypes = [lb.find("subtype").text for lb in staff.iter("LayoutBreak")]
+        assert "line" in subtypes, name
+        # a line break before every rehearsal mark
+        measures = staff.findall("Measure")
+        for i in range(SPEC.rehearsal_every, SPEC.num_measures, SPEC.rehearsal_every):
+            assert measures[i - 1].find("LayoutBreak") is not None, (name, i)
+
+
+def test_suite_run_scenario():
+    spec = SyntheticScoreSpec(num_measures=16, num_parts=2, time_sig_change_every=8)
+    results = run_scenario("tiny", spec, repeat=1, max_workers=None)
+    benchmarks = {r["benchmark"] for r in results}
+    assert {"score/parse", "part/layout/sweep", "format_mscz", "inspect/get_score_attributes"} <= benchmarks
+    assert all(r["scenario"] == "tiny" and r["repeat"] == 1 and r["spec"] == spec.to_dict() for r in results)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        old_path, new_path = os.path.join(workdir, "old.json"), os.path.join(workdir, "new.json")
+        with open(old_path, "w") as f:
+            json.dump({"results": results}, f)
+        with open(new_path, "w") as f:
+            json.dump({"results": [{**r, "median": r["median"] * 2} for r in results]}, f)
+        assert compare(old_path, old_path, 1.15)
+        assert not compare(old_path, new_path, 1.15)
@@ -0,0 +1,131 @@
+import pytest
+import asyncio
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from musescore_part_formatter import aio, format_mscz
+from musescore_part_formatter.daemon import FormatterDaemon, DaemonClient, DaemonError
+from musescore_part_formatter.main import get_score_attributes
+from conftest import mscx_members
+
+MUSESCORE_PATH = "tests/test-data/New-Test-Score.mscz"
+
+PARAMS = {"selected_style": "broadway", "show_title": "TEST Show", "show_number": "1"}
+
+
+@pytest.fixture
+def daemon(workdir):
+    """Daemon on a unix socket in a background thread (jobs run on threads, to keep the test quick)"""
+    executor = ThreadPoolExecutor(2)
+    daemon = FormatterDaemon(max_workers=2, queue_size=1, timeout=10, executor=executor)
+    socket_path = os.path.join(workdir, "daemon.sock")
+    thread = threading.Thread(target=asyncio.run, args=(daemon.serve(socket_path),))
+    thread.start()
+    assert daemon.ready.wait(5)
+    yield daemon, DaemonClient(socket_path, timeout=10)
+    daemon.stop()
+    thread.join(5)
+    executor.shutdown()
+    assert not os.path.exists(socket_path)
+
+
+def test_format_inspect_stats(daemon, workdir):
+    _, client = daemon
+    output_path = os.path.join(workdir, "out.mscz")
+    expected_path = os.path.join(workdir, "expected.mscz")
+
+    assert client.format_mscz(MUSESCORE_PATH, output_path, PARAMS, use_cache=False) == output_path
+    assert format_mscz(MUSESCORE_PATH, expected_path, PARAMS, use_cache=False)
+    assert mscx_members(output_path) == mscx_members(expected_path)
+
+    assert client.get_score_attributes(output_path) == get_score_attributes(expected_path)
+
+    stats = client.stats()
+    assert stats["completed"] == 2
+    assert stats["failed"] == stats["timed_out"] == stats["rejected"] == 0
+    assert stats["latency"]["p50"] is not None
+
+
+def test_errors(daemon, workdir):
+    _, client = daemon
+    with pytest.raises(DaemonError, match="Unknown command"):
+        client.request({"command": "explode"})
+    with pytest.raises(DaemonError, match="Unknown options"):
+        client.format_mscz(MUSESCORE_PATH, os.path.join(workdir, "out.mscz"), PARAMS, fast=True)
+    with pytest.raises(DaemonError, match="Formatting failed"):
+        client.format_mscz(os.path.join(workdir, "missing.mscz"), os.path.join(workdir, "out.mscz"), PARAMS)
+    assert client.stats()["failed"] == 2
+
+
+def test_timeout_and_full_queue(daemon, workdir, monkeypatch):
+    _, client = daemon
+    release = threading.Event()
+
+    def slow_format_mscz(*args, **kwargs):
+        release.wait(5)
+        return format_mscz(*args, **kwargs)
+
+    monkeypatch.setattr(aio, "format_mscz", slow_format_mscz)
+
+    # 2 running + 1 queued, the next one is turned down
+    errors = []
+
+    def submit(i):
+        try:
+            client.format_mscz(MUSESCORE_PATH, os.path.join(workdir, f"{i}.mscz"), PARAMS, timeout=0.5)
+        except DaemonError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while client.stats()["queued"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    with pytest.raises(DaemonError, match="queue is full"):
+        client.format_mscz(MUSESCORE_PATH, os.path.join(workdir, "rejected.mscz"), PARAMS)
+    for thread in threads:
+        thread.join(5)
+    release.set()
+
+    assert len(errors) == 3 and all("longer than 0.5s" in e for e in errors)
+    stats = client.stats()
+    assert stats["timed_out"] == 3
+    assert stats["rejected"] == 1
+
+
+def test_serve_only_replaces_stale_sockets(daemon, workdir):
+    running, _ = daemon
+    not_a_socket = os.path.join(workdir, "out.mscz")
+    with open(not_a_socket, "wb") as f:
+        f.write(b"keep me")
+    with pytest.raises(DaemonError, match="isn't a socket"):
+        asyncio.run(FormatterDaemon(max_workers=1, executor=ThreadPoolExecutor(1)).serve(not_a_socket))
+    with open(not_a_socket, "rb") as f:
+        assert f.read() == b"keep me"
+
+    # the daemon fixture is listening on this one
+    live_socket = os.path.join(workdir, "daemon.sock")
+    with pytest.raises(DaemonError, match="already listening"):
+        asyncio.run(FormatterDaemon(max_workers=1, executor=ThreadPoolExecutor(1)).serve(live_socket))
+    assert DaemonClient(live_socket, timeout=10).stats()["completed"] == 0
+
+    # left over from a daemon that didn't shut down cleanly
+    stale_socket = os.path.join(workdir, "stale.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(stale_socket)
+    executor = ThreadPoolExecutor(1)
+    stale = FormatterDaemon(max_workers=1, executor=executor)
+    thread = threading.Thread(target=asyncio.run, args=(stale.serve(stale_socket),))
+    thread.start()
+    try:
+        assert stale.ready.wait(5)
+        assert DaemonClient(stale_socket, timeout=10).stats()["completed"] == 0
+    finally:
+        stale.stop()
+        thread.join(5)
+        executor.shutdown()
@@ -1,8 +1,13 @@
 import pytest
 import shutil
 import tempfile
+import glob
+import io
+import zipfile
+import xml.etree.ElementTree as ET
 
-from musescore_part_formatter.main import get_score_attributes, set_score_attributes
+from musescore_part_formatter.main import get_score_attributes, set_score_attributes, stamp_mscz, stamp_mscx_bytes
+from musescore_part_formatter.file_inspect import get_all_properties, scan_score_info
 
 MUSESCORE_PATH = "tests/test-data/New-Test-Score.mscz"
 
@@ -104,3 +109,100 @@ def test_set_score_meta_properties(musescore_path):
 
     for k in properties_to_set.keys():
         assert res[k] == properties_to_set[k], res
+
+
+@pytest.mark.parametrize("input_path", sorted(glob.glob("tests/test-data/*.mscz")))
+def test_metadata_only_matches_full_parse(input_path):
+    assert get_score_attributes(input_path) == get_score_attributes(input_path, metadata_only=False)
+
+
+# No <Staff> definitions in the Part, so the scan has to read to the end to count the staves
+UNUSUAL_MSCX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<museScore version="4.20">
+  <Score>
+    <metaTag name="workTitle">Title &amp; <!-- comment -->More</metaTag>
+    <metaTag name="arranger"></metaTag>
+    <metaTag name="source">ignored</metaTag>
+    <Part id="1"><trackName>Piano</trackName></Part>
+    <Staff id="1">
+      <VBox>
+        <Text><style>title</style><text><b>Bold</b> title</text></Text>
+        <Text><style>composer</style><text>Someone</text></Text>
+      </VBox>
+      <Measure>
+        <voice><TimeSig><sigN>3</sigN><sigD>4</sigD></TimeSig><Chord><durationType/></Chord></voice>
+        <voice><TimeSig><sigN>6</sigN><sigD>8</sigD></TimeSig></voice>
+      </Measure>
+      <Measure><voice><TimeSig/><Rest/></voice></Measure>
+      <Measure><voice><Chord><sigN>1</sigN></Chord><TimeSig><sigN>5</sigN><sigD>4</sigD></TimeSig></voice></Measure>
+    </Staff>
+    <Staff id="2"><Measure><voice><TimeSig><sigN>2</sigN><sigD>2</sigD></TimeSig></voice></Measure></Staff>
+  </Score>
+</museScore>
+"""
+
+
+def test_scan_score_info_matches_tree():
+    expected = get_all_properties(ET.fromstring(UNUSUAL_MSCX).find("Score"))
+    assert expected["time_signatures"] == ["3/4", "5/4"] and expected["num_staves"] == 2
+    assert scan_score_info(io.BytesIO(UNUSUAL_MSCX)) == expected
+
+
+def test_scan_score_info_stops_early():
+    with zipfile.ZipFile(MUSESCORE_PATH) as z:
+        data = z.read("New-Test-Score.mscx")
+    fp = io.BytesIO(data)
+
+    res = scan_score_info(fp)
+    assert res["num_staves"] == 6 and res["time_signatures"] == ["4/4"]
+    assert fp.tell() < len(data) / 2, "should stop after the first staff"
+
+
+def _members(path: str) -> dict[str, bytes]:
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+
+def test_stamp_mscz(musescore_path):
+    before = _members(musescore_path)
+    properties = {"title": "New & Title", "composer": "New Composer", "meta_composer": "New Composer"}
+
+    changed = stamp_mscz(musescore_path, properties)
+
+    after = _members(musescore_path)
+    assert list(after) == list(before)
+    assert sorted(changed) == sorted(name for name in before if name.endswith(".mscx"))
+    assert [name for name in before if before[name] != after[name]] == [name for name in before if name in changed]
+
+    res = get_score_attributes(musescore_path)
+    for k, v in properties.items():
+        assert res[k] == v
+    for name in changed:
+        # only the stamped text changed, the rest is left byte for byte
+        restored = after[name].replace(b">New &amp; Title<", b">Test Score<")
+        restored = restored.replace(b">New Composer<", b">arr. Nicholas Biancolin<")
+        assert restored == before[name], name
+
+    assert stamp_mscz(musescore_path, properties) == []
+
+
+def test_stamp_mscz_to_output(musescore_path):
+    before = _members(musescore_path)
+    output_path = musescore_path.replace(".mscz", "-stamped.mscz")
+    stamp_mscz(musescore_path, {"meta_workTitle": "Other"}, output_path)
+
+    assert _members(musescore_path) == before
+    assert get_score_attributes(output_path)["meta_workTitle"] == "Other"
+
+
+def test_stamp_without_title_box():
+    data = UNUSUAL_MSCX.replace(b"<VBox>", b"<HBox>").replace(b"</VBox>", b"</HBox>")
+    assert stamp_mscx_bytes(data, {"title": "Ignored"}) is None
+    stamped = stamp_mscx_bytes(data, {"title": "Ignored", "meta_source": "Set"})
+    assert stamped == data.replace(b">ignored<", b">Set<")
+
+
+@pytest.mark.parametrize("properties", ({"instrument_excerpt": "Piano"}, {"meta_": "x"}, {"num_staves": 3}))
+def test_stamp_unknown_property(musescore_path, properties):
+    with pytest.raises(ValueError):
+        stamp_mscz(musescore_path, properties)
@@ -0,0 +1,179 @@
+import pytest
+import glob
+import shutil
+import tempfile
+import zipfile
+import os
+
+from musescore_part_formatter import file_processing
+from musescore_part_formatter.file_processing import (
+    rewrite_mscz,
+    stream_rewrite_mscz,
+    unpack_mscz_to_tempdir,
+    _read_raw_member,
+)
+
+MUSESCORE_PATH = "tests/test-data/Test-Parts-NMPL.mscz"
+
+
+def _read_members(path: str) -> dict[str, bytes]:
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+
+def test_rewrite_mscz_only_changes_returned_members():
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, "out.mscz")
+        seen = []
+
+        def rewrite(members):
+            seen.extend(members)
+            return {"score_style.mss": b"new style"}
+
+        rewrite_mscz(MUSESCORE_PATH, output_path, rewrite)
+
+        assert all(name.endswith((".mscx", ".mss")) for name in seen)
+
+        before = _read_members(MUSESCORE_PATH)
+        after = _read_members(output_path)
+        assert list(after) == list(before), "member order should be kept"
+        for name in before:
+            if name == "score_style.mss":
+                assert after[name] == b"new style"
+            else:
+                assert after[name] == before[name], name
+
+
+def test_rewrite_mscz_in_place():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = shutil.copy(MUSESCORE_PATH, workdir)
+        rewrite_mscz(path, path, lambda members: {"score_style.mss": b"new style"})
+        assert _read_members(path)["score_style.mss"] == b"new style"
+
+
+def test_rewrite_mscz_error_leaves_output_alone():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = shutil.copy(MUSESCORE_PATH, workdir)
+
+        def rewrite(members):
+            raise ValueError("bad score")
+
+        with pytest.raises(ValueError):
+            rewrite_mscz(path, path, rewrite)
+        assert _read_members(path) == _read_members(MUSESCORE_PATH)
+
+
+def _raw_members(path: str) -> dict[str, bytes]:
+    with zipfile.ZipFile(path) as z, open(path, "rb") as fp:
+        return {info.filename: _read_raw_member(fp, info) for info in z.infolist()}
+
+
+@pytest.mark.parametrize("passthrough", (True, False))
+def test_rewrite_mscz_passthrough(passthrough):
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, "out.mscz")
+        rewrite_mscz(
+            MUSESCORE_PATH,
+            output_path,
+            lambda members: {"score_style.mss": b"new style"},
+            passthrough=passthrough,
+        )
+
+        with zipfile.ZipFile(output_path) as z:
+            assert z.testzip() is None
+            infos = {info.filename: info for info in z.infolist()}
+        with zipfile.ZipFile(MUSESCORE_PATH) as z:
+            for info in z.infolist():
+                assert infos[info.filename].date_time == info.date_time
+
+        before = _raw_members(MUSESCORE_PATH)
+        after = _raw_members(output_path)
+        assert after["score_style.mss"] != before["score_style.mss"]
+        if passthrough:
+            for name in before:
+                if name != "score_style.mss":
+                    assert after[name] == before[name], name
+
+
+def test_stream_rewrite_mscz_one_member_at_a_time():
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, "out.mscz")
+        read = []
+        written = []
+
+        def rewrite(members):
+            for name, data in members:
+                read.append(name)
+                yield name, b"new style" if name == "score_style.mss" else None
+                written.append(name)
+
+        stream_rewrite_mscz(MUSESCORE_PATH, output_path, rewrite)
+        # members are read as they're asked for, in archive order
+        assert read == [name for name in _read_members(MUSESCORE_PATH) if name.endswith((".mscx", ".mss"))]
+        assert written == read[:-1]
+
+        with zipfile.ZipFile(output_path) as z:
+            assert z.testzip() is None
+        before = _raw_members(MUSESCORE_PATH)
+        after = _raw_members(output_path)
+        assert list(after) == list(before), "member order should be kept"
+        for name in before:
+            if name != "score_style.mss":
+                assert after[name] == before[name], name
+        assert _read_members(output_path)["score_style.mss"] == b"new style"
+        assert os.listdir(workdir) == ["out.mscz"], "no temp files left"
+
+
+def test_stream_rewrite_mscz_in_place_and_errors():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = shutil.copy(MUSESCORE_PATH, workdir)
+
+        def rewrite(members):
+            for name, _ in members:
+                if name.endswith(".mscx"):
+                    raise ValueError("bad score")
+                yield name, b"new style"
+
+        with pytest.raises(ValueError):
+            stream_rewrite_mscz(path, path, rewrite)
+        assert _read_members(path) == _read_members(MUSESCORE_PATH)
+        assert os.listdir(workdir) == [os.path.basename(path)], "no temp files left"
+
+        stream_rewrite_mscz(path, path, lambda members: ((name, b"new") for name, _ in members))
+        assert all(data == b"new" for name, data in _read_members(path).items() if name.endswith((".mscx", ".mss")))
+
+
+@pytest.mark.parametrize("raw_copies", (True, False))
+@pytest.mark.parametrize("path", sorted(glob.glob("tests/test-data/*.mscz")))
+def test_passthrough_round_trip(path, raw_copies, monkeypatch):
+    if not raw_copies:  # as if zipfile didn't have the internals raw copies go through
+        monkeypatch.setattr(file_processing, "_RAW_WRITE_ATTRS", (*file_processing._RAW_WRITE_ATTRS, "_gone"))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        rewritten = os.path.join(workdir, "rewritten.mscz")
+        streamed = os.path.join(workdir, "streamed.mscz")
+        rewrite_mscz(path, rewritten, lambda members: {})
+        stream_rewrite_mscz(path, streamed, lambda members: ((name, None) for name, _ in members))
+
+        for output_path in (rewritten, streamed):
+            with zipfile.ZipFile(output_path) as z:
+                assert z.testzip() is None
+            assert _read_members(output_path) == _read_members(path)
+            if raw_copies:
+                assert _raw_members(output_path) == _raw_members(path)
+
+
+def test_unpack_mscz_to_tempdir_keeps_unchanged_members():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = shutil.copy(MUSESCORE_PATH, workdir)
+        with unpack_mscz_to_tempdir(path) as (work_dir, mscx_files):
+            with open(os.path.join(work_dir, "score_style.mss"), "wb") as f:
+                f.write(b"new style")
+
+        assert list(_read_members(path)) == list(_read_members(MUSESCORE_PATH))
+        before = _raw_members(MUSESCORE_PATH)
+        after = _raw_members(path)
+        for name in before:
+            if name != "score_style.mss":
+                assert after[name] == before[name], name
+        assert _read_members(path)["score_style.mss"] == b"new style"
@@ -0,0 +1,79 @@
+import pytest
+import subprocess
+import sys
+
+
+def _imported_modules(statement: str) -> dict[str, int]:
+    """Modules imported by running `statement` in a fresh interpreter -> their cumulative import time (us)"""
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+@pytest.mark.parametrize(
+    "statement, not_imported",
+    [
+        (
+            "import musescore_part_formatter",
+            ["musescore_part_formatter.main", "musescore_part_formatter.formatting", "argparse", "lxml"],
+        ),
+        (
+            # every CLI (main, batch, daemon, show_book) starts with this
+            "import musescore_part_formatter.main",
+            [
+                "argparse",
+                "zipfile",
+                "dataclasses",
+                "lxml",
+                "lxml.etree",
+                "concurrent.futures",
+                "musescore_part_formatter.formatting",
+                "musescore_part_formatter.layout",
+                "musescore_part_formatter.file_processing",
+                "musescore_part_formatter.parallel",
+            ],
+        ),
+        (
+            "from musescore_part_formatter import format_mscz",
+            [
+                "argparse",
+                "multiprocessing",
+                "concurrent.futures.process",
+                "importlib.metadata",
+                "musescore_part_formatter.mscx_stream",
+                "musescore_part_formatter.minimal_diff",
+                "musescore_part_formatter.result_cache",
+            ],
+        ),
+    ],
+)
+def test_lazy_imports(statement, not_imported):
+    modules = _imported_modules(statement)
+    assert "musescore_part_formatter" in modules
+    for name in not_imported:
+        assert name not in modules, f"{statement!r} shouldn't import {name}"
+
+
+@pytest.mark.timing
+def test_package_import_time():
+    # generous, but catches something heavy being imported up front again (it was ~120ms)
+    modules = _imported_modules("import musescore_part_formatter")
+    assert modules["musescore_part_formatter"] < 50_000
+
+
+@pytest.mark.timing
+def test_main_import_time():
+    # every CLI pays this at startup (it was ~90ms with lxml, zipfile and the formatting passes imported up front)
+    modules = _imported_modules("import musescore_part_formatter.main")
+    assert modules["musescore_part_formatter.main"] < 75_000
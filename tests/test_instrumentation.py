@@ -0,0 +1,95 @@
+import pytest
+import os
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter import format_mscz
+from musescore_part_formatter.instrumentation import STAGES, COUNTERS, collect, stage, count, is_collecting
+from musescore_part_formatter.utils import LayoutEngine, _add_line_break_to_measure, _add_page_break_to_measure
+
+OUTPUT_DIRECTORY = "tests/processing"
+MUSESCORE_PATH = "tests/test-data/New-Test-Score.mscz"
+
+PARAMS = {"selected_style": "broadway", "show_title": "TEST Show", "show_number": "1"}
+
+
+def test_nothing_recorded_without_collector():
+    assert not is_collecting()
+    with stage("parse"):
+        count("measures_visited")
+
+    with collect() as profile:
+        assert is_collecting()
+    assert not is_collecting()
+    assert profile.stages == {} and profile.counters == {}
+
+
+def test_on_stage_callback():
+    seen = []
+    with collect(on_stage=lambda name, wall, cpu: seen.append(name)) as profile:
+        with stage("parse"):
+            pass
+        with stage("parse"):
+            pass
+    assert seen == ["parse", "parse"]
+    assert profile.stages["parse"].calls == 2
+
+
+@pytest.mark.parametrize("layout_engine", list(LayoutEngine))
+def test_format_mscz_profile(layout_engine):
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    with collect() as profile:
+        assert format_mscz(
+            MUSESCORE_PATH,
+            f"{OUTPUT_DIRECTORY}/New-Test-Score-profiled.mscz",
+            {**PARAMS, "layout_engine": layout_engine},
+        )
+
+    report = profile.to_dict()
+    for name in ("unzip", "parse", "style", "layout/index", "header", "serialize", "rezip"):
+        assert name in report["stages"], name
+    if layout_engine == LayoutEngine.FUSED:
+        assert "layout/plan" in report["stages"]
+    else:
+        assert "layout/regular" in report["stages"]
+    # one per mscx
+    assert report["stages"]["parse"]["calls"] == report["stages"]["serialize"]["calls"] > 1
+    assert report["counters"]["measures_visited"] > 0
+    assert report["counters"]["line_breaks_added"] > 0
+    # stages can nest (eg. predict runs parse and layout/index), so only each one on its own fits in the total
+    assert all(report["wall"] >= t["wall"] for t in report["stages"].values())
+
+
+def test_format_mscz_profile_merges_workers():
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    output_path = f"{OUTPUT_DIRECTORY}/New-Test-Score-profiled.mscz"
+    with collect() as serial:
+        assert format_mscz(MUSESCORE_PATH, output_path, PARAMS)
+    with collect() as parallel:
+        assert format_mscz(MUSESCORE_PATH, output_path, PARAMS, max_workers=2)
+
+    assert parallel.counters == serial.counters
+    assert parallel.stages["parse"].calls == serial.stages["parse"].calls
+
+
+def test_stages_and_counters_listed():
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    with collect() as profile:
+        assert format_mscz(
+            MUSESCORE_PATH, f"{OUTPUT_DIRECTORY}/New-Test-Score-profiled.mscz", PARAMS, predict=True, use_cache=False
+        )
+    assert {"predict", "layout/sweep"} <= set(profile.stages) <= set(STAGES)
+    assert {"sweep_candidates"} <= set(profile.counters) <= set(COUNTERS)
+
+
+def test_page_break_counters():
+    with_line_break = ET.fromstring("<Measure><voice/></Measure>")
+    _add_line_break_to_measure(with_line_break)
+    without = ET.fromstring("<Measure><voice/></Measure>")
+
+    with collect() as profile:
+        _add_page_break_to_measure(with_line_break)
+    assert profile.counters == {"line_breaks_to_page_breaks": 1}
+
+    with collect() as profile:
+        _add_page_break_to_measure(without)
+    assert profile.counters == {"page_breaks_added": 1}
@@ -0,0 +1,82 @@
+import pytest
+import copy
+import glob
+import random
+import zipfile
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter.formatting import add_layout_breaks_multipass
+from musescore_part_formatter.layout import add_layout_breaks
+from musescore_part_formatter.utils import LinePlanner, PagePlanner
+
+TEST_DATA_MSCZ = sorted(glob.glob("tests/test-data/*.mscz"))
+TEST_DATA_MSCX = sorted(glob.glob("tests/test-data/sample-mscx/*.mscx"))
+
+
+def _first_staves():
+    """(name, first staff) for every mscx in the test data"""
+    res = []
+    for path in TEST_DATA_MSCX:
+        score = ET.parse(path).getroot().find("Score")
+        res.append((path, score.find("Staff")))
+    for path in TEST_DATA_MSCZ:
+        with zipfile.ZipFile(path) as z:
+            for name in z.namelist():
+                if name.endswith(".mscx"):
+                    score = ET.fromstring(z.read(name)).find("Score")
+                    res.append((f"{path}:{name}", score.find("Staff")))
+    return res
+
+
+def _random_staff(seed: int) -> ET.Element:
+    """Build a staff with a random mix of rehearsal marks, double bars, mm rests and existing breaks"""
+    rng = random.Random(seed)
+    staff = ET.Element("Staff")
+    ET.SubElement(staff, "VBox")
+    i = 0
+    num_measures = rng.randint(8, 120)
+    while i < num_measures:
+        if i > 0 and rng.random() < 0.08:
+            # multimeasure rest: the mm rest measure, then the measures it covers
+            length = rng.randint(2, 9)
+            mm = ET.SubElement(staff, "Measure", {"len": f"{length * 4}/4"})
+            ET.SubElement(mm, "multiMeasureRest").text = str(length)
+            ET.SubElement(mm, "voice")
+            for _ in range(length):
+                ET.SubElement(ET.SubElement(staff, "Measure"), "voice")
+            i += length
+            continue
+
+        measure = ET.SubElement(staff, "Measure")
+        if rng.random() < 0.05:
+            lb = ET.SubElement(measure, "LayoutBreak")
+            ET.SubElement(lb, "subtype").text = "line"
+        voice = ET.SubElement(measure, "voice")
+        if rng.random() < 0.1:
+            ET.SubElement(voice, "RehearsalMark")
+        if rng.random() < 0.08:
+            ET.SubElement(voice, "BarLine")
+        ET.SubElement(voice, "Chord")
+        i += 1
+    return staff
+
+
+@pytest.mark.parametrize("line_planner", list(LinePlanner))
+@pytest.mark.parametrize("page_planner", list(PagePlanner))
+@pytest.mark.parametrize("nmpl, nlpp", [(4, 7), (6, 8), (3, 2), (8, 3)])
+def test_fused_layout_matches_multipass_on_test_data(nmpl, nlpp, page_planner, line_planner):
+    for name, staff in _first_staves():
+        expected = add_layout_breaks_multipass(copy.deepcopy(staff), nmpl, nlpp, page_planner, line_planner)
+        actual = add_layout_breaks(copy.deepcopy(staff), nmpl, nlpp, page_planner, line_planner)
+        assert ET.tostring(actual) == ET.tostring(expected), name
+
+
+@pytest.mark.parametrize("line_planner", list(LinePlanner))
+@pytest.mark.parametrize("page_planner", list(PagePlanner))
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("nmpl, nlpp", [(4, 7), (6, 8), (5, 3)])
+def test_fused_layout_matches_multipass_on_random_staves(seed, nmpl, nlpp, page_planner, line_planner):
+    staff = _random_staff(seed)
+    expected = add_layout_breaks_multipass(copy.deepcopy(staff), nmpl, nlpp, page_planner, line_planner)
+    actual = add_layout_breaks(copy.deepcopy(staff), nmpl, nlpp, page_planner, line_planner)
+    assert ET.tostring(actual) == ET.tostring(expected)
@@ -185,3 +185,54 @@ def test_part_and_score_line_breaks():
 
 def test_page_breaks_added_correctly():
     pass
+
+
+def test_format_mscz_parses_main_score_once(monkeypatch):
+    """format_mscz should get the score info from the tree it formats, not by unpacking/parsing the file again"""
+    from musescore_part_formatter import main
+
+    def fail(*args, **kwargs):
+        raise AssertionError("get_score_attributes should not be called by format_mscz")
+
+    monkeypatch.setattr(main, "get_score_attributes", fail)
+
+    params: FormattingParams = {
+        "num_measures_per_line_part": 6,
+        "num_measures_per_line_score": 4,
+        "selected_style": "broadway",
+        "show_title": "TEST Show",
+        "show_number": "1",
+        "num_lines_per_page": 7,
+        "version_num": "1.0.0",
+    }
+
+    processed = f"{OUTPUT_DIRECTORY}/Test-Parts-NMPL-parse-once.mscz"
+    assert format_mscz("tests/test-data/Test-Parts-NMPL.mscz", processed, params)
+
+    with zipfile.ZipFile(processed) as z:
+        score_style = z.read("score_style.mss").decode()
+    assert "DIVISI:staff_spacing" not in score_style
+
+
+def test_parallel_format_mscz_matches_serial():
+    params: FormattingParams = {
+        "num_measures_per_line_part": 6,
+        "num_measures_per_line_score": 4,
+        "selected_style": "jazz",
+        "show_title": "TEST Show",
+        "show_number": "1",
+        "num_lines_per_page": 7,
+        "version_num": "1.0.0",
+    }
+    serial = f"{OUTPUT_DIRECTORY}/New-Test-Score-serial.mscz"
+    parallel = f"{OUTPUT_DIRECTORY}/New-Test-Score-parallel.mscz"
+
+    assert format_mscz("tests/test-data/New-Test-Score.mscz", serial, params)
+    assert format_mscz(
+        "tests/test-data/New-Test-Score.mscz", parallel, params, max_workers=2
+    )
+
+    with zipfile.ZipFile(serial) as a, zipfile.ZipFile(parallel) as b:
+        assert a.namelist() == b.namelist()
+        for name in a.namelist():
+            assert a.read(name) == b.read(name), name
@@ -0,0 +1,48 @@
+import pytest
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter.measure_index import (
+    MeasureIndex,
+    BARLINE,
+    LAYOUT_BREAK,
+    MM_REST_START,
+)
+
+MM_RESTS_MSCX = "tests/test-data/sample-mscx/Test_Regular_Line_Breaks_with_mm_rests.mscx"
+
+
+@pytest.fixture
+def index():
+    staff = ET.parse(MM_RESTS_MSCX).getroot().find("Score").find("Staff")
+    return MeasureIndex(staff)
+
+
+def test_mm_rests_indexed(index):
+    # sample score has a 4 bar MM rest at measure 10 and an 8 bar one at measure 19
+    starts = [i for i in range(len(index)) if index.has(i, MM_REST_START)]
+    assert starts == [9, 18]
+    assert index.mm_length[9] == 4
+    assert index.mm_length[18] == 8
+
+    in_mm = [i for i in range(len(index)) if index.in_mm_rest(i)]
+    assert in_mm == [10, 11, 12] + list(range(19, 26))
+    assert all(index.mm_start[i] == 9 for i in range(9, 18))
+    assert index.mm_start[8] == -1
+
+
+def test_double_bar_indexed(index):
+    assert [i for i in range(len(index)) if index.has(i, BARLINE)] == [16]
+
+
+def test_line_breaks_kept_in_sync(index):
+    assert not index.has_line_break(3)
+    index.add_line_break(3)
+    index.add_line_break(3)
+    measure = index.measures[3]
+    assert index.has(3, LAYOUT_BREAK)
+    assert len(measure.findall("LayoutBreak")) == 1
+    assert [len(line) for line in index.lines()] == [4, len(index) - 4]
+
+    index.remove_line_break(3)
+    assert not index.has_line_break(3)
+    assert measure.find("LayoutBreak") is None
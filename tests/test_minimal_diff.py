@@ -0,0 +1,116 @@
+import pytest
+import difflib
+import copy
+import shutil
+import tempfile
+import os
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter.main import (
+    format_mscx_bytes,
+    prep_formatting_params,
+    set_score_attributes,
+)
+from musescore_part_formatter.layout import add_layout_breaks
+from musescore_part_formatter.minimal_diff import SourceTracker
+from musescore_part_formatter.xml_backend import get_xml_backend
+
+from test_layout import _random_staff
+from test_mscx_stream import _normalized
+from conftest import mscx_members
+
+MUSESCORE_PATH = "tests/test-data/New-Test-Score.mscz"
+
+
+def _indented(elem: ET.Element) -> bytes:
+    elem = copy.deepcopy(elem)
+    ET.indent(elem, space="  ")
+    return ET.tostring(elem)
+
+
+def test_tracker_leaves_untouched_document_alone():
+    data = mscx_members(MUSESCORE_PATH)["New-Test-Score.mscx"]
+    tree = get_xml_backend().fromstring(data)
+    tracker = SourceTracker(tree.getroot(), data)
+    assert tracker.patches() == []
+    assert tracker.tostring() == data
+
+
+def test_tracker_insert_remove_replace():
+    data = (
+        b"<Staff>\n"
+        b"  <Measure>\n"
+        b"    <LayoutBreak><subtype>line</subtype></LayoutBreak>\n"
+        b"    <voice/>\n"
+        b"  </Measure>\n"
+        b"  <Measure>\n"
+        b"    <voice/>\n"
+        b"  </Measure>\n"
+        b"</Staff>"
+    )
+    tree = get_xml_backend().fromstring(data)
+    staff = tree.getroot()
+    tracker = SourceTracker(staff, data)
+
+    first, second = staff.findall("Measure")
+    first.remove(first.find("LayoutBreak"))
+    new = second.makeelement("LayoutBreak", {})
+    subtype = new.makeelement("subtype", {})
+    subtype.text = "line"
+    new.append(subtype)
+    second.insert(0, new)
+    staff.set("id", "1")
+    assert len(tracker.patches()) == 1, "a changed attribute redoes the whole element"
+
+    staff.attrib.pop("id")
+    assert tracker.tostring() == (
+        b"<Staff>\n"
+        b"  <Measure>\n"
+        b"    <voice/>\n"
+        b"  </Measure>\n"
+        b"  <Measure>\n"
+        b"    <LayoutBreak>\n"
+        b"      <subtype>line</subtype>\n"
+        b"    </LayoutBreak>\n"
+        b"    <voice/>\n"
+        b"  </Measure>\n"
+        b"</Staff>"
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_tracker_matches_tree_on_random_staves(seed):
+    data = _indented(_random_staff(seed))
+    expected = add_layout_breaks(ET.fromstring(data), 4, 3)
+
+    tree = get_xml_backend().fromstring(data)
+    tracker = SourceTracker(tree.getroot(), data)
+    add_layout_breaks(tree.getroot(), 4, 3)
+    assert _normalized(tracker.tostring()) == _normalized(ET.tostring(expected))
+
+
+@pytest.mark.parametrize("style", ("jazz", "broadway"))
+def test_minimal_diff_matches_tree(style):
+    params = prep_formatting_params(
+        {"selected_style": style, "show_title": "TEST & Show", "show_number": "1"}
+    )
+    for name, data in mscx_members(MUSESCORE_PATH).items():
+        is_part = "Excerpts" in name
+        expected = format_mscx_bytes(data, params, is_part)
+        actual = format_mscx_bytes(data, params, is_part, minimal_diff=True)
+        assert _normalized(actual) == _normalized(expected), name
+        # everything but the metaTags, header and layout breaks is left as it was
+        removed = [line for line in difflib.ndiff(data.splitlines(), actual.splitlines()) if line.startswith("- ")]
+        assert len(removed) <= 3 * len(data.split(b"<LayoutBreak>")), name
+
+
+def test_set_score_attributes_minimal_diff():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "score.mscz")
+        shutil.copy(MUSESCORE_PATH, path)
+        before = mscx_members(path)["New-Test-Score.mscx"]
+
+        set_score_attributes(path, {"meta_composer": "Someone Else"}, minimal_diff=True)
+
+        after = mscx_members(path)["New-Test-Score.mscx"]
+        assert after.replace(b">Someone Else<", b">arr. Nicholas Biancolin<") == before
@@ -0,0 +1,169 @@
+import pytest
+import tempfile
+import shutil
+import io
+import os
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter import format_mscz, format_mscx
+from musescore_part_formatter.main import (
+    format_mscx_bytes,
+    prep_formatting_params,
+    _get_score_info,
+)
+from musescore_part_formatter.mscx_stream import MscxStream, scan_mscx, read_range
+from musescore_part_formatter.minimal_diff import splice
+from musescore_part_formatter.instrumentation import collect
+from musescore_part_formatter.result_cache import ResultCache, get_result_cache, set_result_cache
+from benchmarks.synthetic import SyntheticScoreSpec, write_synthetic_mscz
+from conftest import file_mode, mscx_members
+
+OUTPUT_DIRECTORY = "tests/processing"
+MUSESCORE_PATH = "tests/test-data/New-Test-Score.mscz"
+
+
+def _normalized(data: bytes) -> str:
+    """Canonical form of a document, ignoring indentation"""
+    root = ET.fromstring(data)
+    for elem in root.iter():
+        if elem.text is not None and not elem.text.strip():
+            elem.text = None
+        if elem.tail is not None and not elem.tail.strip():
+            elem.tail = None
+    return ET.canonicalize(ET.tostring(root, encoding="unicode"))
+
+
+def test_scan_mscx_finds_offsets():
+    data = (
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b"<museScore><Score><metaTag name=\"a\"></metaTag><metaTag name=\"b\"/>"
+        b"<Part><Staff id=\"1\"/></Part><Staff id=\"1\"><Measure/></Staff><Staff id=\"2\"/></Score></museScore>"
+    )
+    offsets = scan_mscx(io.BytesIO(data))
+    fp = io.BytesIO(data)
+
+    assert [read_range(fp, *r) for r in offsets.meta_tags] == [
+        b'<metaTag name="a"></metaTag>',
+        b'<metaTag name="b"/>',
+    ]
+    assert read_range(fp, *offsets.first_staff) == b'<Staff id="1"><Measure/></Staff>'
+    assert data[offsets.score_start_tag_end - len(b"<Score>"):offsets.score_start_tag_end] == b"<Score>"
+    assert offsets.num_parts == 1
+    assert offsets.num_staves == 2
+
+
+def test_splice():
+    out = io.BytesIO()
+    splice(io.BytesIO(b"0123456789"), out, [(8, 8, b"x"), (2, 4, b"ab")])
+    assert out.getvalue() == b"01ab4567x89"
+
+    with pytest.raises(ValueError):
+        splice(io.BytesIO(b"0123456789"), io.BytesIO(), [(2, 5, b""), (4, 6, b"")])
+
+
+@pytest.mark.parametrize("style", ("jazz", "broadway"))
+def test_streaming_matches_tree(style):
+    params = prep_formatting_params(
+        {"selected_style": style, "show_title": "TEST & Show", "show_number": "1"}
+    )
+    for name, data in mscx_members(MUSESCORE_PATH).items():
+        is_part = "Excerpts" in name
+        expected = format_mscx_bytes(data, params, is_part)
+        actual = format_mscx_bytes(data, params, is_part, streaming=True)
+        assert _normalized(actual) == _normalized(expected), name
+
+
+def test_streaming_passes_other_staves_through():
+    data = mscx_members(MUSESCORE_PATH)["New-Test-Score.mscx"]
+    params = prep_formatting_params({"show_title": "TEST Show"})
+    out = format_mscx_bytes(data, params, streaming=True)
+
+    offsets = scan_mscx(io.BytesIO(data))
+    rest = data[offsets.first_staff[1]:]
+    assert out.endswith(rest), "everything after the first staff should be copied as is"
+
+
+def test_stream_score_info_matches_tree():
+    from musescore_part_formatter.xml_backend import get_xml_backend
+
+    data = mscx_members(MUSESCORE_PATH)["New-Test-Score.mscx"]
+    expected = _get_score_info(get_xml_backend().fromstring(data))
+    assert MscxStream(io.BytesIO(data)).score_info() == expected
+
+
+def test_format_mscx_streaming_in_place():
+    filename = "Test_Regular_Line_Breaks.mscx"
+    params = prep_formatting_params({"show_title": "TEST Show"})
+    with open(f"tests/test-data/sample-mscx/{filename}", "rb") as f:
+        expected = format_mscx_bytes(f.read(), params)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(f"tests/test-data/sample-mscx/{filename}", workdir)
+        path = os.path.join(workdir, filename)
+        os.chmod(path, 0o644)
+        assert format_mscx(path, params, streaming=True)
+        with open(path, "rb") as f:
+            assert _normalized(f.read()) == _normalized(expected)
+        assert os.listdir(workdir) == [filename], "temp file should be cleaned up"
+        assert file_mode(path) == 0o644, "formatting in place shouldn't change the file's mode"
+
+
+def test_format_mscz_streaming():
+    params = {"selected_style": "broadway", "show_title": "TEST Show", "show_number": "1"}
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    tree_path = f"{OUTPUT_DIRECTORY}/New-Test-Score-tree.mscz"
+    stream_path = f"{OUTPUT_DIRECTORY}/New-Test-Score-streaming.mscz"
+
+    assert format_mscz(MUSESCORE_PATH, tree_path, params)
+    assert format_mscz(MUSESCORE_PATH, stream_path, params, streaming=True)
+
+    expected = mscx_members(tree_path)
+    actual = mscx_members(stream_path)
+    assert list(actual) == list(expected)
+    for name in expected:
+        assert _normalized(actual[name]) == _normalized(expected[name]), name
+
+
+@pytest.mark.parametrize("max_workers", (None, 2))
+def test_format_mscz_streaming_workers_and_member_cache(workdir, max_workers):
+    params = {"selected_style": "broadway", "show_title": "TEST Show", "show_number": "1"}
+    expected_path = os.path.join(workdir, "expected.mscz")
+    assert format_mscz(MUSESCORE_PATH, expected_path, params, streaming=True, use_cache=False)
+    num_mscx = len(mscx_members(MUSESCORE_PATH))
+
+    previous = get_result_cache()
+    cache_dir = os.path.join(workdir, "cache")
+    set_result_cache(ResultCache(cache_dir))
+    try:
+        for hits in (0, num_mscx):
+            output_path = os.path.join(workdir, "out.mscz")
+            with collect() as profile:
+                assert format_mscz(
+                    MUSESCORE_PATH, output_path, params, max_workers=max_workers, streaming=True, incremental=True
+                )
+            assert profile.counters.get("member_cache_hits", 0) == hits
+            assert mscx_members(output_path) == mscx_members(expected_path)
+            # so the next run only finds the mscx files in the cache
+            for name in os.listdir(cache_dir):
+                if name.endswith(".mscz"):
+                    os.remove(os.path.join(cache_dir, name))
+    finally:
+        set_result_cache(previous)
+
+
+def test_format_mscz_streaming_memory(workdir):
+    """Only a member or two is held in memory at once, instead of the whole score"""
+    path = os.path.join(workdir, "synthetic.mscz")
+    write_synthetic_mscz(path, SyntheticScoreSpec(num_measures=64, num_parts=32))
+
+    peaks = {}
+    for streaming in (False, True):
+        format_mscz(path, os.path.join(workdir, "out.mscz"), {}, streaming=streaming, use_cache=False)  # warm up
+        tracemalloc.start()
+        try:
+            assert format_mscz(path, os.path.join(workdir, "out.mscz"), {}, streaming=streaming, use_cache=False)
+            peaks[streaming] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert peaks[True] < 0.75 * peaks[False], peaks
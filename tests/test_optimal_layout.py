@@ -0,0 +1,162 @@
+import pytest
+import random
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter.measure_index import MeasureIndex, LAYOUT_BREAK, IN_MM_REST
+from musescore_part_formatter.optimal_layout import (
+    MAX_LINE_OVERFLOW,
+    page_capacities,
+    plan_line_breaks,
+    plan_page_breaks,
+)
+
+
+def _staff(line_kinds: list[str]) -> ET.Element:
+    """
+    One measure per line (every measure has a line break). Kinds:
+    "" plain, "mark" rehearsal mark, "double" double bar, "rest" two bar multimeasure rest (on a line of its own)
+    """
+    staff = ET.Element("Staff")
+    ET.SubElement(staff, "VBox")
+    for kind in line_kinds:
+        if kind == "rest":
+            mm = ET.SubElement(staff, "Measure", {"len": "8/4"})
+            ET.SubElement(mm, "multiMeasureRest").text = "2"
+            ET.SubElement(mm, "voice")
+            measure = ET.SubElement(staff, "Measure")
+            voice = ET.SubElement(measure, "voice")
+        else:
+            measure = ET.SubElement(staff, "Measure")
+            voice = ET.SubElement(measure, "voice")
+            if kind == "mark":
+                ET.SubElement(voice, "RehearsalMark")
+            elif kind == "double":
+                ET.SubElement(voice, "BarLine")
+        lb = ET.SubElement(measure, "LayoutBreak")
+        ET.SubElement(lb, "subtype").text = "line"
+    return staff
+
+
+def _pages(line_kinds: list[str], num_lines_per_page: int) -> list[int]:
+    """Number of lines on each page"""
+    index = MeasureIndex(_staff(line_kinds))
+    lines = [line for line in index.lines() if line]
+    breaks = set(plan_page_breaks(index, lines, num_lines_per_page))
+    res = [0]
+    for i, line in enumerate(lines):
+        res[-1] += 1
+        if line[-1] in breaks and i != len(lines) - 1:
+            res.append(0)
+    return res
+
+
+def test_full_pages_without_boundaries():
+    assert _pages([""] * 13, 4) == [4, 5, 4]
+
+
+def test_breaks_at_rehearsal_mark():
+    # one line short on the first page is cheaper than a break away from the rehearsal mark
+    kinds = [""] * 13
+    kinds[3] = "mark"
+    assert _pages(kinds, 4) == [3, 5, 5]
+
+
+def test_breaks_at_double_bar():
+    kinds = [""] * 13
+    kinds[4] = "double"
+    assert _pages(kinds, 4)[0] == 4
+    kinds[4], kinds[2] = "", "double"
+    assert _pages(kinds, 4)[0] == 3
+
+
+def test_breaks_before_run_of_rests():
+    kinds = [""] * 3 + ["rest"] * 3 + [""] * 5
+    assert _pages(kinds, 4)[0] == 3
+
+
+def test_no_short_last_page():
+    assert _pages([""] * 10, 4)[-1] >= 2  # rather than [4, 5, 1]
+    assert _pages([""] * 9, 4) == [4, 5]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pages_never_overfull(seed):
+    rng = random.Random(seed)
+    kinds = [rng.choice(["", "", "", "mark", "double", "rest"]) for _ in range(rng.randint(1, 200))]
+    num_lines_per_page = rng.randint(1, 10)
+    first_capacity, capacity = page_capacities(num_lines_per_page)
+
+    pages = _pages(kinds, num_lines_per_page)
+    assert sum(pages) == len(kinds)
+    assert pages[0] <= first_capacity
+    assert all(0 < n <= capacity for n in pages)
+
+
+def _section(measures: str) -> ET.Element:
+    """
+    Staff from a string: "." a measure, "|" a measure with a line break, a digit n an n bar multimeasure rest
+    """
+    staff = ET.Element("Staff")
+    ET.SubElement(staff, "VBox")
+    for c in measures:
+        measure = ET.SubElement(staff, "Measure")
+        if c.isdigit():
+            measure.set("len", f"{int(c) * 4}/4")
+            ET.SubElement(measure, "multiMeasureRest").text = c
+            ET.SubElement(measure, "voice")
+            for _ in range(int(c) - 1):
+                ET.SubElement(ET.SubElement(staff, "Measure"), "voice")
+            continue
+        if c == "|":
+            lb = ET.SubElement(measure, "LayoutBreak")
+            ET.SubElement(lb, "subtype").text = "line"
+        ET.SubElement(measure, "voice")
+    return staff
+
+
+def _line_units(measures: str, measures_per_line: int) -> list[int]:
+    """Number of units (measures, or whole multimeasure rests) on each line after planning"""
+    index = MeasureIndex(_section(measures))
+    has_lb = [bool(flags & LAYOUT_BREAK) for flags in index.flags]
+    for i in plan_line_breaks(index, has_lb, measures_per_line):
+        assert not has_lb[i]
+        has_lb[i] = True
+    res = [0]
+    for i, lb in enumerate(has_lb):
+        if not index.flags[i] & IN_MM_REST:
+            res[-1] += 1
+        if lb and i != len(has_lb) - 1:
+            res.append(0)
+    return res
+
+
+@pytest.mark.parametrize(
+    "measures, measures_per_line, expected",
+    [
+        ("........", 4, [4, 4]),
+        ("......", 4, [3, 3]),  # rather than 4 + 2
+        (".....", 4, [5]),  # rather than 4 + 1
+        ("..........", 4, [4, 3, 3]),
+        ("...|......", 4, [4, 3, 3]),  # sections are planned separately
+        ("..4.....", 4, [4, 4]),  # a multimeasure rest is one unit
+    ],
+)
+def test_line_breaks(measures, measures_per_line, expected):
+    assert _line_units(measures, measures_per_line) == expected
+
+
+def test_line_breaks_dont_split_mm_rests():
+    index = MeasureIndex(_section("." * 3 + "9" * 5 + "." * 3))
+    has_lb = [bool(flags & LAYOUT_BREAK) for flags in index.flags]
+    for i in plan_line_breaks(index, has_lb, 2):
+        assert i + 1 == len(index) or not index.flags[i + 1] & IN_MM_REST
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_lines_never_overfull(seed):
+    rng = random.Random(seed)
+    measures = "".join(rng.choice("......|3") for _ in range(rng.randint(1, 300)))
+    measures_per_line = rng.randint(1, 8)
+    units = _line_units(measures, measures_per_line)
+    assert sum(units) == len(measures)
+    assert all(n <= measures_per_line + MAX_LINE_OVERFLOW for n in units)
@@ -0,0 +1,94 @@
+import pytest
+import copy
+import os
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter.estimating_formatting_params import predict_layout_params
+from musescore_part_formatter.layout import add_layout_breaks
+from musescore_part_formatter.main import format_mscz
+from musescore_part_formatter.measure_index import MeasureIndex
+from musescore_part_formatter.param_sweep import candidates, mscz_scores, sweep_mscz, sweep_score
+from musescore_part_formatter.utils import LinePlanner, PagePlanner
+from conftest import mscx_members
+
+MUSESCORE_PATH = "tests/test-data/Test-Parts-NMPL.mscz"
+
+
+def _part_scores(path: str = MUSESCORE_PATH) -> list[tuple[str, ET.Element]]:
+    with zipfile.ZipFile(path) as z:
+        return [
+            (name, ET.fromstring(z.read(name)).find("Score"))
+            for name in z.namelist()
+            if name.endswith(".mscx") and "Excerpts" in name
+        ]
+
+
+def _pages(staff: ET.Element) -> int:
+    return 1 + sum(1 for lb in staff.iter("LayoutBreak") if lb.find("subtype").text == "page")
+
+
+@pytest.mark.parametrize("page_planner", list(PagePlanner))
+@pytest.mark.parametrize("line_planner", list(LinePlanner))
+def test_sweep_matches_formatting(page_planner, line_planner):
+    sweep_candidates = candidates(range(2, 9), (4, 8))
+    for name, score in _part_scores():
+        before = ET.tostring(score)
+        results = sweep_score(score, sweep_candidates, page_planner, line_planner)
+        assert ET.tostring(score) == before, "the sweep shouldn't change the score"
+        assert sorted((r.measures_per_line, r.num_lines_per_page) for r in results) == sorted(sweep_candidates)
+
+        for result in results:
+            staff = copy.deepcopy(score.find("Staff"))
+            add_layout_breaks(staff, result.measures_per_line, result.num_lines_per_page, page_planner, line_planner)
+            lines = [line for line in MeasureIndex(staff).lines() if line]
+            assert result.num_lines == len(lines), (name, result)
+            assert result.num_pages == _pages(staff), (name, result)
+
+
+def test_sweep_ranking():
+    for _, score in _part_scores():
+        results = sweep_score(score, candidates(range(1, 10), (2, 8)), target_measures_per_line=4)
+        costs = [r.cost for r in results]
+        assert costs == sorted(costs)
+        for result in results:
+            assert result.boundary_page_breaks <= result.page_breaks == result.num_pages - 1
+            assert 0 < result.last_page_lines <= result.num_lines
+
+
+def test_sweep_mscz():
+    with open(MUSESCORE_PATH, "rb") as f:
+        before = f.read()
+    results = sweep_mscz(MUSESCORE_PATH, candidates())
+
+    assert list(results) == [name for name, _ in _part_scores()]
+    for name, score in _part_scores():
+        assert results[name] == sweep_score(score, candidates())
+    with open(MUSESCORE_PATH, "rb") as f:
+        assert f.read() == before
+    assert [name for name, _ in mscz_scores(MUSESCORE_PATH, parts_only=False)][0] == "Test-Parts-NMPL.mscx"
+
+
+def test_predict_layout_params():
+    res = predict_layout_params(MUSESCORE_PATH, (8, 7))
+    assert set(res) == {"num_measures_per_line_part", "num_lines_per_page"}
+    assert res["num_lines_per_page"] in (8, 7)
+    assert 1 <= res["num_measures_per_line_part"] <= 10
+
+
+def test_format_mscz_predict():
+    with tempfile.TemporaryDirectory() as workdir:
+        predicted_path = os.path.join(workdir, "predicted.mscz")
+        expected_path = os.path.join(workdir, "expected.mscz")
+
+        assert format_mscz(MUSESCORE_PATH, predicted_path, {"num_lines_per_page": 7}, predict=True, use_cache=False)
+        params = {"num_lines_per_page": 7, **predict_layout_params(MUSESCORE_PATH, (7,))}
+        assert format_mscz(MUSESCORE_PATH, expected_path, params, use_cache=False)
+        assert mscx_members(predicted_path) == mscx_members(expected_path)
+
+        # passing it in turns the prediction off
+        params = {"num_measures_per_line_part": 3}
+        assert format_mscz(MUSESCORE_PATH, predicted_path, params, predict=True, use_cache=False)
+        assert format_mscz(MUSESCORE_PATH, expected_path, params, use_cache=False)
+        assert mscx_members(predicted_path) == mscx_members(expected_path)
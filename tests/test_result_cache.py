@@ -0,0 +1,177 @@
+import pytest
+import os
+import sys
+import zipfile
+
+from musescore_part_formatter import format_mscz
+from musescore_part_formatter.main import main
+from musescore_part_formatter.instrumentation import collect
+from musescore_part_formatter.result_cache import (
+    ResultCache,
+    cache_key,
+    get_result_cache,
+    set_result_cache,
+)
+from conftest import file_mode, mscx_members, read_bytes
+
+MUSESCORE_PATH = "tests/test-data/New-Test-Score.mscz"
+
+PARAMS = {"selected_style": "broadway", "show_title": "TEST Show", "show_number": "1"}
+
+
+@pytest.fixture
+def cache(workdir):
+    previous = get_result_cache()
+    cache = ResultCache(os.path.join(workdir, "cache"))
+    set_result_cache(cache)
+    yield cache
+    set_result_cache(previous)
+
+
+def test_cache_hit_returns_stored_output(cache, workdir):
+    first = os.path.join(workdir, "first.mscz")
+    second = os.path.join(workdir, "second.mscz")
+
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, first, PARAMS)
+    assert profile.counters["cache_misses"] == 1
+
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, second, PARAMS)
+    assert profile.counters == {"cache_hits": 1}, "nothing should be formatted on a hit"
+    assert read_bytes(second) == read_bytes(first)
+
+
+def test_cache_hit_file_mode(cache, workdir, umask_022):
+    uncached = os.path.join(workdir, "uncached.mscz")
+    miss = os.path.join(workdir, "miss.mscz")
+    hit = os.path.join(workdir, "hit.mscz")
+    assert format_mscz(MUSESCORE_PATH, uncached, PARAMS, use_cache=False)
+    assert format_mscz(MUSESCORE_PATH, miss, PARAMS)
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, hit, PARAMS)
+    assert profile.counters == {"cache_hits": 1}
+
+    assert file_mode(uncached) == file_mode(miss) == file_mode(hit) == 0o644
+
+
+def test_cache_hit_skips_prediction(cache, workdir):
+    first = os.path.join(workdir, "first.mscz")
+    second = os.path.join(workdir, "second.mscz")
+
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, first, PARAMS, predict=True)
+    assert "predict" in profile.stages
+
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, second, PARAMS, predict=True)
+    assert profile.counters == {"cache_hits": 1}
+    assert "predict" not in profile.stages
+    assert read_bytes(second) == read_bytes(first)
+
+    # not predicting is a different result
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, second, PARAMS)
+    assert profile.counters["cache_misses"] == 1
+
+
+def test_cache_key_changes_with_params_and_options(workdir):
+    from musescore_part_formatter.main import prep_formatting_params
+
+    params = prep_formatting_params(PARAMS)
+    key = cache_key(MUSESCORE_PATH, params)
+    assert key == cache_key(MUSESCORE_PATH, prep_formatting_params(dict(PARAMS)))
+    assert key != cache_key(MUSESCORE_PATH, {**params, "show_title": "Other Show"})
+    assert key != cache_key(MUSESCORE_PATH, params, streaming=True)
+
+    assert key != cache_key("tests/test-data/Test-Score.mscz", params)
+
+
+def test_cache_opt_out(cache, workdir):
+    output_path = os.path.join(workdir, "out.mscz")
+    assert format_mscz(MUSESCORE_PATH, output_path, PARAMS, use_cache=False)
+    assert cache.size() == 0
+
+    assert format_mscz(MUSESCORE_PATH, output_path, PARAMS)
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, output_path, PARAMS, use_cache=False)
+    assert "cache_hits" not in profile.counters
+
+
+def test_cache_evicts_least_recently_used(workdir):
+    cache = ResultCache(os.path.join(workdir, "cache"), max_bytes=250)
+    for i, key in enumerate("abc"):
+        path = os.path.join(workdir, key)
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+        cache.put(key, path)
+        entry = os.path.join(cache.directory, key + ".mscz")
+        os.utime(entry, (i, i))
+
+    # a, b and c don't fit, so a (the oldest) went when c was added. Using b makes c the oldest
+    assert not cache.get("a", os.path.join(workdir, "out"))
+    assert cache.get("b", os.path.join(workdir, "out"))
+    cache.put("d", os.path.join(workdir, "a"))
+
+    assert [cache.get(key, os.path.join(workdir, "out")) for key in "bcd"] == [True, False, True]
+    assert cache.size() <= 250
+
+
+def _change_one_part(src: str, dst: str) -> str:
+    """Copy of src with a different show title in one part"""
+    with zipfile.ZipFile(src) as z_in, zipfile.ZipFile(dst, "w", zipfile.ZIP_DEFLATED) as z_out:
+        part = next(name for name in z_in.namelist() if "Excerpts" in name and name.endswith(".mscx"))
+        for info in z_in.infolist():
+            data = z_in.read(info)
+            if info.filename == part:
+                data = data.replace(b"</Score>", b"  <metaTag name=\"extra\">x</metaTag>\n  </Score>", 1)
+            z_out.writestr(info, data)
+    return part
+
+
+def test_incremental_only_formats_changed_parts(cache, workdir):
+    revised = os.path.join(workdir, "revised.mscz")
+    changed = _change_one_part(MUSESCORE_PATH, revised)
+    num_mscx = len(mscx_members(MUSESCORE_PATH))
+
+    assert format_mscz(MUSESCORE_PATH, os.path.join(workdir, "first.mscz"), PARAMS, incremental=True)
+
+    output_path = os.path.join(workdir, "second.mscz")
+    with collect() as profile:
+        assert format_mscz(revised, output_path, PARAMS, incremental=True)
+    assert profile.counters["member_cache_misses"] == 1
+    assert profile.counters["member_cache_hits"] == num_mscx - 1
+    assert profile.stages["parse"].calls == 2, "the changed part, and the main score for its style params"
+
+    expected_path = os.path.join(workdir, "expected.mscz")
+    assert format_mscz(revised, expected_path, PARAMS, use_cache=False)
+    actual = mscx_members(output_path)
+    assert actual == mscx_members(expected_path)
+    assert b'name="extra"' in actual[changed]
+
+
+def test_incremental_without_cache_warns(cache, workdir, caplog):
+    with collect() as profile:
+        assert format_mscz(MUSESCORE_PATH, os.path.join(workdir, "out.mscz"), PARAMS, use_cache=False, incremental=True)
+    assert "incremental needs a result cache" in caplog.text
+    assert "member_cache_misses" not in profile.counters
+
+    caplog.clear()
+    assert format_mscz(MUSESCORE_PATH, os.path.join(workdir, "out.mscz"), PARAMS, incremental=True)
+    assert "incremental needs a result cache" not in caplog.text
+
+
+@pytest.mark.parametrize("flags", (["--no-cache"], []))
+def test_cli_incremental_without_cache(flags, workdir, monkeypatch, capsys):
+    previous = get_result_cache()
+    set_result_cache(None)
+    output_path = os.path.join(workdir, "out.mscz")
+    monkeypatch.setattr(sys, "argv", ["main.py", MUSESCORE_PATH, output_path, "--incremental", *flags])
+    try:
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    finally:
+        set_result_cache(previous)
+    assert exc_info.value.code == 2
+    assert "--incremental needs a result cache" in capsys.readouterr().err
+    assert not os.path.exists(output_path)
@@ -0,0 +1,139 @@
+import pytest
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter.show_book import (
+    SUMMARY_FILENAME,
+    format_show,
+    main,
+    plan_show,
+)
+from musescore_part_formatter.main import format_mscz
+from conftest import mscx_members
+
+MANIFEST = {
+    "show_title": "TEST Show",
+    "version_num": "1.0.0",
+    "selected_style": "broadway",
+    "songs": [
+        {"input": "Test-Score.mscz", "show_number": "1"},
+        {"input": "TEST_mm_rests.mscz", "show_number": "2A", "show_title": "Other Show"},
+        {"input": "Test-Parts-NMPL.mscz"},
+        {"input": "broken.mscz", "show_number": "4"},
+    ],
+}
+
+
+@pytest.fixture
+def show_dir():
+    """The songs (and a broken file) next to a manifest"""
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in ("Test-Score.mscz", "TEST_mm_rests.mscz", "Test-Parts-NMPL.mscz"):
+            shutil.copy(os.path.join("tests/test-data", name), workdir)
+        with open(os.path.join(workdir, "broken.mscz"), "w") as f:
+            f.write("not a zip file")
+        with open(os.path.join(workdir, "show.json"), "w") as f:
+            json.dump(MANIFEST, f)
+        yield workdir
+
+
+def _meta_tags(path: str) -> dict[str, str]:
+    """metaTags of the main score in a mscz"""
+    with zipfile.ZipFile(path) as z:
+        name = next(n for n in z.namelist() if n.endswith(".mscx") and "Excerpts" not in n)
+        score = ET.fromstring(z.read(name)).find("Score")
+    return {tag.get("name"): tag.text for tag in score.findall("metaTag")}
+
+
+def test_plan_show():
+    jobs = plan_show(
+        {"show_title": "Show", "num_lines_per_page": 6, "songs": {"a.mscz": {"num_lines_per_page": 5}, "b.mscz": None}},
+        "out",
+        base_dir="songs",
+    )
+    assert [(input_path, output_path) for input_path, output_path, _ in jobs] == [
+        (os.path.join("songs", "a.mscz"), os.path.join("out", "a.mscz")),
+        (os.path.join("songs", "b.mscz"), os.path.join("out", "b.mscz")),
+    ]
+    assert [params["show_number"] for _, _, params in jobs] == ["1", "2"]
+    assert [params["num_lines_per_page"] for _, _, params in jobs] == [5, 6]
+    assert all(params["show_title"] == "Show" for _, _, params in jobs)
+
+    with pytest.raises(ValueError, match="doesn't have any songs"):
+        plan_show({"show_title": "Show"}, "out")
+    with pytest.raises(ValueError, match="More than one song"):
+        plan_show({"songs": [{"input": "a/x.mscz"}, {"input": "b/x.mscz"}]}, "out")
+
+
+@pytest.mark.parametrize("max_workers", (1, 2))
+def test_format_show(show_dir, max_workers):
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = list(format_show(MANIFEST, output_dir, base_dir=show_dir, max_workers=max_workers))
+        by_number = {r["show_number"]: r for r in results}
+
+        assert len(results) == 4
+        assert not by_number["4"]["ok"] and "BadZipFile" in by_number["4"]["error"]
+        for number, title in (("1", "TEST Show"), ("2A", "Other Show"), ("3", "TEST Show")):
+            result = by_number[number]
+            assert result["ok"], result
+            assert result["show_title"] == title
+            meta = _meta_tags(result["output"])
+            assert meta["trackNum"] == number
+            assert meta["albumTitle"] == title
+            assert meta["versionNum"] == "1.0.0"
+
+
+def test_format_show_numeric_manifest_values(show_dir):
+    manifest = {
+        "show_title": 2024,
+        "version_num": 1.5,
+        "songs": [{"input": "Test-Score.mscz", "show_number": 3}, {"input": "TEST_mm_rests.mscz"}],
+    }
+    assert [params["show_number"] for _, _, params in plan_show(manifest, "out")] == ["3", "2"]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = list(format_show(manifest, output_dir, base_dir=show_dir, max_workers=1))
+        assert all(r["ok"] for r in results), results
+        meta = _meta_tags(os.path.join(output_dir, "Test-Score.mscz"))
+        assert (meta["albumTitle"], meta["trackNum"], meta["versionNum"]) == ("2024", "3", "1.5")
+
+
+@pytest.mark.parametrize("max_workers", (1, 2))
+def test_format_show_predict(show_dir, max_workers):
+    manifest = {
+        "show_title": "TEST Show",
+        "songs": [
+            {"input": "TEST_mm_rests.mscz", "output": "predicted.mscz"},
+            {"input": "TEST_mm_rests.mscz", "output": "set.mscz", "num_measures_per_line_part": 3},
+        ],
+    }
+    input_path = os.path.join(show_dir, "TEST_mm_rests.mscz")
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = list(format_show(manifest, output_dir, base_dir=show_dir, predict=True, max_workers=max_workers))
+        assert all(r["ok"] for r in results), results
+
+        for position, (name, params) in enumerate(
+            (("predicted.mscz", {}), ("set.mscz", {"num_measures_per_line_part": 3})), start=1
+        ):
+            expected_path = os.path.join(output_dir, "expected.mscz")
+            params = {"show_title": "TEST Show", "show_number": str(position), **params}
+            assert format_mscz(input_path, expected_path, params, predict=True, use_cache=False)
+            assert mscx_members(os.path.join(output_dir, name)) == mscx_members(expected_path), name
+
+
+def test_show_book_cli_summary(show_dir):
+    with tempfile.TemporaryDirectory() as output_dir:
+        with pytest.raises(SystemExit) as e:
+            main([os.path.join(show_dir, "show.json"), "--output-dir", output_dir, "--max-workers", "2"])
+        assert e.value.code == 1  # broken.mscz failed
+
+        with open(os.path.join(output_dir, SUMMARY_FILENAME)) as f:
+            summary = json.load(f)
+        assert summary["show"]["show_title"] == "TEST Show"
+        assert (summary["total"], summary["succeeded"], summary["failed"]) == (4, 3, 1)
+        assert [song["show_number"] for song in summary["songs"]] == ["1", "2A", "3", "4"]
+        assert os.path.exists(os.path.join(output_dir, "Test-Score.mscz"))
@@ -0,0 +1,35 @@
+import pytest
+
+from musescore_part_formatter.formatting import (
+    render_style_bytes,
+    clear_style_cache,
+    _render_style_cached,
+)
+from musescore_part_formatter.utils import Style
+
+
+@pytest.fixture(autouse=True)
+def empty_style_cache():
+    clear_style_cache()
+    yield
+    clear_style_cache()
+
+
+def test_style_rendered_once_per_key():
+    first = render_style_bytes(Style.BROADWAY, True)
+    second = render_style_bytes(Style.BROADWAY, True)
+    assert first is second
+    info = _render_style_cached.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("style", (Style.BROADWAY, Style.JAZZ))
+def test_style_cache_keyed_by_params(style):
+    six_staves = render_style_bytes(style, False, {"num_staves": 6})
+    twelve_staves = render_style_bytes(style, False, {"num_staves": 12})
+    part = render_style_bytes(style, True)
+
+    assert b"DIVISI:staff_spacing" not in six_staves
+    assert six_staves != twelve_staves
+    assert part not in (six_staves, twelve_staves)
+    assert _render_style_cached.cache_info().misses == 3
@@ -0,0 +1,66 @@
+import pytest
+import glob
+import xml.etree.ElementTree as ET
+
+from musescore_part_formatter.main import format_mscx_bytes
+from musescore_part_formatter.utils import Style
+from musescore_part_formatter.xml_backend import (
+    XMLBackend,
+    StdlibBackend,
+    get_xml_backend,
+    set_xml_backend,
+    available_xml_backends,
+)
+
+PARAMS = {
+    "selected_style": Style.BROADWAY,
+    "show_title": "TEST Show",
+    "show_number": "1",
+    "version_num": "1.0.0",
+    "num_measures_per_line_part": 6,
+    "num_measures_per_line_score": 4,
+    "num_lines_per_page": 3,
+}
+
+
+@pytest.fixture
+def xml_backend():
+    yield
+    set_xml_backend(None)
+
+
+def test_stdlib_backend_always_available():
+    assert "stdlib" in available_xml_backends()
+
+
+def test_incomplete_backend_fails_up_front():
+    class ParseOnlyBackend(XMLBackend):
+        name = "parse-only"
+
+        def parse(self, path):
+            return ET.parse(path)
+
+    with pytest.raises(TypeError, match="abstract"):
+        ParseOnlyBackend()
+    assert isinstance(StdlibBackend(), XMLBackend)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_xml_backend("not-a-backend")
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob("tests/test-data/sample-mscx/*.mscx")))
+def test_lxml_output_matches_stdlib(path, xml_backend):
+    pytest.importorskip("lxml")
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    set_xml_backend("stdlib")
+    stdlib_output = format_mscx_bytes(data, PARAMS)
+    set_xml_backend("lxml")
+    lxml_output = format_mscx_bytes(data, PARAMS)
+
+    # serialized slightly differently (eg. <a/> vs <a />), but should be the same document
+    assert ET.canonicalize(lxml_output) == ET.canonicalize(stdlib_output)